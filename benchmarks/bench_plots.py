@@ -0,0 +1,126 @@
+"""Benchmarks for map and time series plot construction
+"""
+
+import shutil
+import tempfile
+from epivislab.simhandler import EpiSummary
+from .synthetic import synthetic_ensemble, synthetic_counts, synthetic_shapes, burden_frame
+
+
+class SpatialSimulation:
+    params = ([10, 100], [22, 200])
+    param_names = ['vertices', 'timesteps']
+
+    def setup(self, vertices, timesteps):
+        from epivislab import maps
+        self.maps = maps
+        self.counts = synthetic_counts(vertices=vertices, timesteps=timesteps)
+        self.shapes = synthetic_shapes(vertices=vertices)
+
+    def time_spatial_simulation(self, vertices, timesteps):
+        self.maps.spatial_simulation(self.counts, self.shapes, 'Ih')
+
+    def peakmem_spatial_simulation(self, vertices, timesteps):
+        self.maps.spatial_simulation(self.counts, self.shapes, 'Ih')
+
+
+class BurdenPlot:
+    params = ([10, 100], ['full', 'delta'])
+    param_names = ['vertices', 'frame_mode']
+
+    def setup(self, vertices, frame_mode):
+        from epivislab import maps
+        self.maps = maps
+        self.df = burden_frame(synthetic_counts(vertices=vertices, timesteps=60), synthetic_shapes(vertices=vertices))
+
+    def _plot(self, frame_mode):
+        return self.maps.make_burden_plot(
+            self.df, '2020-03-11', '2020-05-09', token='benchmark-token', frame_mode=frame_mode
+        )
+
+    def time_make_burden_plot(self, vertices, frame_mode):
+        self._plot(frame_mode)
+
+    def peakmem_make_burden_plot(self, vertices, frame_mode):
+        self._plot(frame_mode)
+
+
+class TimeseriesPlots:
+    params = ([10, 100], [22, 200])
+    param_names = ['replicates', 'timesteps']
+
+    def setup(self, replicates, timesteps):
+        from epivislab import timeseries
+        self.timeseries = timeseries
+        summary = EpiSummary(
+            simulation=synthetic_ensemble(replicates=replicates, vertices=1, timesteps=timesteps),
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state']
+        )
+        # the interval and replicate sums are computed and loaded here, so the benchmarks measure figure construction
+        self.interval = summary.prediction_interval(
+            groupers=['step', 'compt', 'vertex'], aggcol='compt_model__state', upper=0.95, lower=0.05,
+            backend='xarray'
+        ).load()
+        self.replicates = summary.xr_sum_over_groups(
+            groupers=['step', 'compt', 'vertex', 'index'], aggcol='compt_model__state'
+        ).load()
+
+        # one panel of each, for the static figure builders
+        interval_cube = timeseries.build_cube(self.interval, ['upper', 'lower', 'median'], ['compt', 'vertex'], 'step')
+        replicate_cube = timeseries.build_cube(
+            self.replicates, ['compt_model__state'], ['compt', 'vertex'], 'step', index_coord='index'
+        )
+        self.x = interval_cube['x']
+        self.bands = [interval_cube[i][0, 0] for i in ['upper', 'lower', 'median']]
+        self.lines = replicate_cube['compt_model__state'][0, 0]
+
+    def time_interval_timeseries(self, replicates, timesteps):
+        self.timeseries.interval_timeseries(self.interval)
+
+    def peakmem_interval_timeseries(self, replicates, timesteps):
+        self.timeseries.interval_timeseries(self.interval)
+
+    def time_spaghetti_timeseries(self, replicates, timesteps):
+        self.timeseries.spaghetti_timeseries(self.replicates, 'step', 'compt_model__state', 'index', render='packed')
+
+    def peakmem_spaghetti_timeseries(self, replicates, timesteps):
+        self.timeseries.spaghetti_timeseries(self.replicates, 'step', 'compt_model__state', 'index', render='packed')
+
+    def time_interval_figure(self, replicates, timesteps):
+        self.timeseries.interval_figure(self.x, *self.bands)
+
+    def time_spaghetti_figure(self, replicates, timesteps):
+        self.timeseries.spaghetti_figure(self.x, self.lines, render='packed')
+
+
+class FigureReport:
+    params = ([2, 20], [None, 4])
+    param_names = ['vertices', 'processes']
+
+    def setup(self, vertices, processes):
+        self.output_dir = tempfile.mkdtemp()
+        self.summary = EpiSummary(
+            simulation=synthetic_ensemble(replicates=10, vertices=vertices, timesteps=60),
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state']
+        )
+        # only the within-simulation sums are memoized here; the benchmark measures the quantiles between
+        # simulations as well as figure construction and export
+        self.summary.xr_sum_over_groups(
+            groupers=['step', 'compt', 'vertex', 'index'], aggcol='compt_model__state'
+        )
+
+    def teardown(self, vertices, processes):
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def time_figure_report(self, vertices, processes):
+        self.summary.figure_report(
+            self.output_dir, ['step', 'compt', 'vertex'], 'compt_model__state', processes=processes
+        )
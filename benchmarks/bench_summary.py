@@ -0,0 +1,121 @@
+"""Benchmarks for SimHandler and EpiSummary statistics
+
+Each benchmark has a ``time_`` and a ``peakmem_`` variant. In-memory memoization is disabled
+(``memo_max_bytes=0``) so that every call repeats the full calculation, except in :class:`Rollup`, which measures
+sums taken from memoized parents.
+"""
+
+from epivislab.simhandler import EpiSummary
+from .synthetic import synthetic_ensemble
+
+
+def summary(replicates, vertices, age_groups=5, risk_groups=2, compartments=9, timesteps=22, memo_max_bytes=0):
+    simulation = synthetic_ensemble(
+        replicates=replicates, vertices=vertices, age_groups=age_groups, risk_groups=risk_groups,
+        compartments=compartments, timesteps=timesteps
+    )
+
+    return EpiSummary(
+        simulation=simulation,
+        state_coord=['compt'],
+        within_sim_coord=['age', 'risk', 'vertex'],
+        time_coord=['step'],
+        between_sim_coord=['index'],
+        measured_coord=['compt_model__state'],
+        memo_max_bytes=memo_max_bytes
+    )
+
+
+class MakeChunks:
+    params = ([10, 100], [1, 10], [22, 200])
+    param_names = ['replicates', 'vertices', 'timesteps']
+
+    def setup(self, replicates, vertices, timesteps):
+        self.summary = summary(replicates, vertices, timesteps=timesteps)
+
+    def _make_chunks(self):
+        self.summary._chunk_sims = {}
+        return self.summary.make_chunks().npartitions
+
+    def time_make_chunks(self, replicates, vertices, timesteps):
+        self._make_chunks()
+
+    def peakmem_make_chunks(self, replicates, vertices, timesteps):
+        self._make_chunks()
+
+
+class SumOverGroups:
+    params = ([10, 100], [1, 10], [(5, 2), (17, 5)])
+    param_names = ['replicates', 'vertices', 'age_risk']
+
+    def setup(self, replicates, vertices, age_risk):
+        self.summary = summary(replicates, vertices, age_groups=age_risk[0], risk_groups=age_risk[1])
+
+    def _sum(self):
+        return self.summary.sum_over_groups(
+            groupers=['step', 'compt', 'vertex', 'index'], aggcol='compt_model__state'
+        ).compute()
+
+    def time_sum_over_groups(self, replicates, vertices, age_risk):
+        self._sum()
+
+    def peakmem_sum_over_groups(self, replicates, vertices, age_risk):
+        self._sum()
+
+
+class QuantileBetweenSims:
+    params = ([10, 100], [1, 10], [9, 20])
+    param_names = ['replicates', 'vertices', 'compartments']
+
+    def setup(self, replicates, vertices, compartments):
+        self.summary = summary(replicates, vertices, compartments=compartments)
+
+    def _quantile(self):
+        return self.summary.quantile_between_sims(
+            groupers=['step', 'compt', 'vertex'], aggcol='compt_model__state', quantile=0.95
+        ).compute()
+
+    def time_quantile_between_sims(self, replicates, vertices, compartments):
+        self._quantile()
+
+    def peakmem_quantile_between_sims(self, replicates, vertices, compartments):
+        self._quantile()
+
+
+class PredictionInterval:
+    params = ([10, 100], [1, 10], ['dataframe', 'xarray'])
+    param_names = ['replicates', 'vertices', 'backend']
+
+    def setup(self, replicates, vertices, backend):
+        self.summary = summary(replicates, vertices)
+
+    def _interval(self, backend):
+        return self.summary.prediction_interval(
+            groupers=['step', 'compt', 'vertex'], aggcol='compt_model__state', upper=0.95, lower=0.05,
+            backend=backend
+        )
+
+    def time_prediction_interval(self, replicates, vertices, backend):
+        self._interval(backend)
+
+    def peakmem_prediction_interval(self, replicates, vertices, backend):
+        self._interval(backend)
+
+
+class Rollup:
+    params = ([10, 100], [1, 10], ['dataframe', 'xarray'])
+    param_names = ['replicates', 'vertices', 'backend']
+    levels = [['compt', 'age', 'vertex', 'step'], ['compt', 'risk', 'vertex', 'step'], ['compt', 'vertex', 'step']]
+
+    def setup(self, replicates, vertices, backend):
+        self.summary = summary(replicates, vertices, memo_max_bytes=2 ** 30)
+
+    def _rollup(self, backend):
+        self.summary.memo.clear()
+        return self.summary.rollup(self.levels, 'compt_model__state', backend=backend)
+
+    def time_rollup(self, replicates, vertices, backend):
+        self._rollup(backend)
+
+    def peakmem_rollup(self, replicates, vertices, backend):
+        self._rollup(backend)
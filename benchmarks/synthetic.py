@@ -0,0 +1,129 @@
+"""Synthetic simulation ensembles for benchmarks
+
+The generated data have the same layout as Episimlab output (see ``tests/data/test_sim_2.zarr``), with sizes
+controlled by the number of replicates, vertices, age and risk groups, compartments and timesteps.
+"""
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+COMPARTMENTS = ['S', 'E', 'Pa', 'Py', 'Ia', 'Iy', 'Ih', 'R', 'D']
+
+
+def coordinates(replicates, vertices, age_groups, risk_groups, compartments, timesteps):
+    """Coordinate values for a synthetic ensemble."""
+
+    if compartments <= len(COMPARTMENTS):
+        compartment_names = COMPARTMENTS[:compartments]
+    else:
+        compartment_names = [f'C{i}' for i in range(compartments)]
+
+    return {
+        'replicates': np.arange(replicates),
+        'steps': pd.date_range('2020-03-11', periods=timesteps),
+        'vertices': np.array([str(48001 + 2 * i) for i in range(vertices)], dtype=object),
+        'compartments': np.array(compartment_names, dtype=object),
+        'age_groups': np.array([f'age{i}' for i in range(age_groups)], dtype=object),
+        'risk_groups': np.array([f'risk{i}' for i in range(risk_groups)], dtype=object),
+    }
+
+
+def synthetic_ensemble(replicates=10, vertices=1, age_groups=5, risk_groups=2, compartments=9, timesteps=22,
+                       chunks=None, seed=0):
+    """Synthetic ensemble in the layout of :class:`epivislab.simhandler.EpiSummary` input.
+
+    Args:
+        replicates (int): number of simulations (``index`` coordinate)
+        vertices (int): number of vertices (``vertex`` coordinate)
+        age_groups (int): number of age groups (``age`` coordinate)
+        risk_groups (int): number of risk groups (``risk`` coordinate)
+        compartments (int): number of compartments (``compt`` coordinate)
+        timesteps (int): number of timesteps (``step`` coordinate)
+        chunks (dict): optional dask chunks; by default one chunk per replicate
+        seed (int): random seed
+
+    Returns:
+        xarray.Dataset: ``compt_model__state`` with dimensions ``(index, step, vertex, compt, age, risk)``
+    """
+
+    values = coordinates(replicates, vertices, age_groups, risk_groups, compartments, timesteps)
+    rng = np.random.default_rng(seed)
+    shape = (replicates, timesteps, vertices, compartments, age_groups, risk_groups)
+    state = rng.poisson(100, size=shape).astype(float)
+
+    ds = xr.Dataset(
+        {'compt_model__state': (['index', 'step', 'vertex', 'compt', 'age', 'risk'], state)},
+        coords={
+            'index': values['replicates'],
+            'step': values['steps'],
+            'vertex': values['vertices'],
+            'compt': values['compartments'],
+            'age': values['age_groups'],
+            'risk': values['risk_groups'],
+        }
+    )
+
+    return ds.chunk(chunks if chunks is not None else {'index': 1})
+
+
+def synthetic_counts(vertices=10, age_groups=5, risk_groups=2, compartments=9, timesteps=22, seed=0):
+    """Synthetic counts in the layout expected by :func:`epivislab.maps.spatial_simulation`.
+
+    Returns:
+        xarray.DataArray: ``apply_counts_delta__counts`` with dimensions
+        ``(compartment, risk_group, age_group, vertex, step)``; vertex IDs are numeric as in Episimlab output
+    """
+
+    values = coordinates(1, vertices, age_groups, risk_groups, compartments, timesteps)
+    rng = np.random.default_rng(seed)
+    coords = {
+        'compartment': values['compartments'],
+        'risk_group': values['risk_groups'],
+        'age_group': values['age_groups'],
+        'vertex': values['vertices'].astype(float),
+        'step': values['steps'],
+    }
+
+    return xr.DataArray(
+        rng.poisson(5, size=[len(i) for i in coords.values()]).astype(float),
+        coords=coords,
+        dims=list(coords.keys()),
+        name='apply_counts_delta__counts'
+    )
+
+
+def synthetic_shapes(vertices=10):
+    """Square vertex geometries with vertex IDs in the ``GEOID10`` column.
+
+    Returns:
+        geopandas.GeoDataFrame: one row per vertex
+    """
+
+    import geopandas as gpd
+    from shapely.geometry import box
+
+    values = coordinates(1, vertices, 1, 1, 1, 1)
+    side = int(np.ceil(np.sqrt(vertices)))
+
+    return gpd.GeoDataFrame(
+        {
+            'GEOID10': values['vertices'],
+            'geometry': [box(i % side, i // side, i % side + 1, i // side + 1) for i in range(vertices)],
+        },
+        crs='EPSG:4326'
+    )
+
+
+def burden_frame(counts, shapes, compartment='Ih'):
+    """Input for :func:`epivislab.maps.make_burden_plot` built from synthetic counts and shapes."""
+
+    from epivislab import maps
+
+    df = maps.spatial_simulation(counts, shapes, compartment)
+    df['group_pop'] = 1000.0
+    df['burden_per_10k'] = df['apply_counts_delta__counts'] / df['group_pop'] * 10000
+    df['burden_per_10k_str'] = [str(round(i, 2)) for i in df['burden_per_10k']]
+    df['marker_size'] = 10 + df['burden_per_10k'] / 100
+
+    return df
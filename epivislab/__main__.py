@@ -0,0 +1,4 @@
+import sys
+from epivislab.cli import main
+
+sys.exit(main())
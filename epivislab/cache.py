@@ -0,0 +1,293 @@
+"""Caching of summary statistic results
+"""
+
+import os
+import json
+import shutil
+import hashlib
+from collections import OrderedDict
+import xarray as xr
+import dask
+
+
+def dataset_fingerprint(simulation):
+    """Fingerprint the data behind an ``xarray.Dataset``.
+
+    For datasets read from a zarr store (``simulation.encoding['source']``) whose data variables are still the
+    arrays read from the store, the fingerprint combines the store path, the contents of the zarr metadata files and
+    the size and modification time of every chunk file, so rewriting or appending to the store changes the
+    fingerprint without reading any chunk data. The dimension sizes, coordinate values and data variables of the
+    dataset are also included, so a dataset holding only some of the store's variables differs from the full store.
+
+    Datasets derived from a store (for example with ``isel``, ``sel`` or arithmetic) keep
+    ``encoding['source']`` but not the store's arrays; they, and all other datasets, are fingerprinted with
+    ``dask.base.tokenize``, which for ``dask``-backed data hashes the task graph names rather than the values.
+
+    Args:
+        simulation (xarray.Dataset): simulation data
+
+    Returns:
+        str: hexadecimal fingerprint
+    """
+
+    source = simulation.encoding.get('source')
+    if source is None or not os.path.isdir(source) or not _reads_store(simulation):
+        return dask.base.tokenize(simulation)
+
+    digest = hashlib.sha256(os.path.abspath(source).encode())
+    digest.update(dask.base.tokenize(
+        dict(simulation.sizes),
+        {name: simulation[name].values for name in simulation.coords},
+        {name: (simulation[name].dims, str(simulation[name].dtype)) for name in simulation.data_vars}
+    ).encode())
+    for root, dirs, files in os.walk(source):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, source).encode())
+            if name in ('.zmetadata', '.zarray', '.zattrs', '.zgroup'):
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+            else:
+                stat = os.stat(path)
+                digest.update(f'{stat.st_size}:{stat.st_mtime_ns}'.encode())
+
+    return digest.hexdigest()
+
+
+def _reads_store(simulation):
+    """Whether every data variable of ``simulation`` is an unmodified ``dask`` array opened from its zarr store."""
+
+    return all([
+        dask.is_dask_collection(value.data) and value.data.name.startswith(f'open_dataset-{name}-')
+        for name, value in simulation.data_vars.items()
+    ])
+
+
+class ResultCache:
+    """Content-addressed on-disk cache of summary results.
+
+    Each result is an ``xarray.Dataset`` stored as a zarr store named by its key under :attr:`directory`. Keys
+    combine a dataset fingerprint (see :func:`dataset_fingerprint`) with a hash of the parameters that produced
+    the result. Reading a result uses no ``dask`` graph. When the cache grows beyond :attr:`max_bytes` the least
+    recently used results are removed.
+
+    Attributes:
+        directory (str): directory holding cached results
+        max_bytes (int): maximum total size of cached results in bytes; ``None`` for no limit
+    """
+
+    def __init__(self, directory, max_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, fingerprint, **params):
+        """Build a cache key for a dataset fingerprint and the parameters of a calculation.
+
+        Args:
+            fingerprint (str): dataset fingerprint
+            **params: JSON-serializable parameters of the calculation (e.g. groupers, aggcol, quantiles)
+
+        Returns:
+            str: cache key
+        """
+
+        params_hash = hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+        return f'{fingerprint[:32]}-{params_hash[:32]}'
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.zarr')
+
+    def get(self, key):
+        """Read a cached result.
+
+        Args:
+            key (str): cache key
+
+        Returns:
+            xarray.Dataset: cached result loaded into memory, or ``None`` if ``key`` is not cached
+        """
+
+        path = self._path(key)
+        if not os.path.isdir(path):
+            return None
+
+        result = xr.open_zarr(path, chunks=None).load()
+        os.utime(path)  # mark as recently used
+
+        return result
+
+    def put(self, key, result):
+        """Write a result to the cache, then evict least recently used results if over :attr:`max_bytes`.
+
+        Args:
+            key (str): cache key
+            result (xarray.Dataset): result to cache; computed before writing
+
+        Returns:
+            None; writes ``result`` to :attr:`directory`
+        """
+
+        path = self._path(key)
+        tmp_path = f'{path}.tmp{os.getpid()}'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+        # write then rename so that a partially written result is never read
+        result.to_zarr(tmp_path, mode='w')
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp_path, path)
+
+        self.evict()
+
+    def entries(self):
+        """List cached results from least to most recently used.
+
+        Returns:
+            list of tuple: (key, size in bytes) for each cached result
+        """
+
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.zarr'):
+                continue
+            path = os.path.join(self.directory, name)
+            size = sum(
+                [os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files]
+            )
+            entries.append((os.path.getmtime(path), name[:-len('.zarr')], size))
+
+        return [(key, size) for _, key, size in sorted(entries)]
+
+    def evict(self):
+        """Remove least recently used results until the cache is within :attr:`max_bytes`.
+
+        Returns:
+            list of str: keys of evicted results
+        """
+
+        if self.max_bytes is None:
+            return []
+
+        entries = self.entries()
+        total = sum([size for _, size in entries])
+        evicted = []
+        for key, size in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(self._path(key), ignore_errors=True)
+            total -= size
+            evicted.append(key)
+
+        return evicted
+
+    def invalidate(self, key=None, fingerprint=None):
+        """Remove cached results.
+
+        Args:
+            key (str): remove only this result
+            fingerprint (str): remove only results for datasets with this fingerprint
+
+        Returns:
+            list of str: keys of removed results; all results are removed if neither argument is given
+        """
+
+        removed = []
+        for key_, _ in self.entries():
+            if key is not None and key_ != key:
+                continue
+            if fingerprint is not None and not key_.startswith(fingerprint[:32]):
+                continue
+            shutil.rmtree(self._path(key_), ignore_errors=True)
+            removed.append(key_)
+
+        return removed
+
+
+class MemoCache:
+    """Bounded in-memory least recently used cache of intermediate results.
+
+    Entries are stored with their size in bytes; when the total exceeds :attr:`max_bytes` the least recently used
+    entries are evicted. Entries larger than :attr:`max_bytes` are not stored.
+
+    Attributes:
+        max_bytes (int): maximum total size of stored entries in bytes
+        hits (int): number of lookups that found an entry
+        misses (int): number of lookups that did not find an entry
+        evictions (int): number of entries evicted
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Look up an entry and mark it as recently used.
+
+        Args:
+            key (hashable): entry key
+
+        Returns:
+            object: stored value, or ``None`` if ``key`` is not stored
+        """
+
+        if key not in self.entries:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+
+        return self.entries[key][0]
+
+    def put(self, key, value, nbytes):
+        """Store an entry, evicting least recently used entries to stay within :attr:`max_bytes`.
+
+        Args:
+            key (hashable): entry key
+            value (object): value to store
+            nbytes (int): size of ``value`` in bytes
+
+        Returns:
+            bool: whether ``value`` was stored
+        """
+
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key)[1]
+        if nbytes > self.max_bytes:
+            return False
+
+        self.entries[key] = (value, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted_bytes) = self.entries.popitem(last=False)
+            self.nbytes -= evicted_bytes
+            self.evictions += 1
+
+        return True
+
+    def clear(self):
+        """Remove all entries; counters are kept."""
+
+        self.entries.clear()
+        self.nbytes = 0
+
+    def info(self):
+        """Summarize cache usage.
+
+        Returns:
+            dict: ``hits``, ``misses``, ``evictions``, ``entries`` and ``nbytes``
+        """
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'nbytes': self.nbytes,
+        }
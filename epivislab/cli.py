@@ -0,0 +1,124 @@
+"""Command line entry points
+
+``epivislab summarize`` writes within-simulation sums and between-simulation quantiles (and optionally other
+ensemble statistics) of a simulation zarr store to a summary zarr store, out of core::
+
+    epivislab summarize simulation.zarr --groupers compt vertex step --quantiles 0.05 0.5 0.95 \\
+        --chunk-bytes 64MiB --scheduler processes
+
+Coordinate roles default to the names used in Episimlab output; see ``epivislab summarize --help``.
+"""
+
+import os
+import logging
+import argparse
+import dask
+import xarray as xr
+from epivislab.simhandler import EpiSummary
+
+logger = logging.getLogger(__name__)
+
+
+def summarize(args):
+    """Run ``epivislab summarize`` with parsed arguments.
+
+    Args:
+        args (argparse.Namespace): arguments parsed by :func:`parser`
+
+    Returns:
+        xarray.Dataset: the written summary store, opened lazily
+    """
+
+    output = args.output
+    if output is None:
+        output = f'{os.path.splitext(args.store.rstrip(os.sep))[0]}-summary.zarr'
+    chunk_bytes = None if args.chunk_bytes is None else dask.utils.parse_bytes(args.chunk_bytes)
+
+    # opened lazily; blocks are read from the store as the summary is written
+    simulation = xr.open_zarr(args.store)
+    summary = EpiSummary(
+        simulation=simulation,
+        state_coord=args.state_coord,
+        within_sim_coord=args.within_sim_coord,
+        between_sim_coord=args.between_sim_coord,
+        time_coord=args.time_coord,
+        measured_coord=args.measured_coord,
+        chunk_bytes=chunk_bytes,
+        scheduler=args.scheduler,
+        num_workers=args.num_workers,
+    )
+    try:
+        return summary.summarize_to_zarr(
+            output=output,
+            groupers=args.groupers,
+            aggcol=args.aggcol or args.measured_coord[0],
+            quantiles=args.quantiles,
+            statistics=args.statistics,
+            threshold=args.threshold,
+            chunk_bytes=chunk_bytes,
+        )
+    finally:
+        summary.close()
+
+
+def parser():
+    """Build the ``epivislab`` argument parser.
+
+    Returns:
+        argparse.ArgumentParser
+    """
+
+    parser_ = argparse.ArgumentParser(prog='epivislab', description='Visualizations for epidemic simulations')
+    parser_.add_argument('-v', '--verbose', action='store_true', help='log progress')
+    commands = parser_.add_subparsers(dest='command', required=True)
+
+    summarize_ = commands.add_parser(
+        'summarize', help='summarize a simulation zarr store to a zarr store',
+        description='Write within-simulation sums and between-simulation quantiles of a simulation zarr store to a '
+                    'zarr store, reading and writing one block at a time.'
+    )
+    summarize_.add_argument('store', help='simulation zarr store')
+    summarize_.add_argument('-o', '--output', help='summary zarr store; defaults to STORE-summary.zarr')
+    summarize_.add_argument('--groupers', nargs='+', required=True, help='coordinates to keep in the summary')
+    summarize_.add_argument('--aggcol', help='measured variable to summarize; defaults to the first measured coord')
+    summarize_.add_argument('--quantiles', nargs='+', type=float, default=[0.05, 0.5, 0.95],
+                            help='quantiles between simulations')
+    summarize_.add_argument('--statistics', nargs='+', choices=['mean', 'variance', 'min', 'max', 'exceedance',
+                                                                'peak_time', 'peak_size'],
+                            help='other statistics between simulations')
+    summarize_.add_argument('--threshold', type=float, help='threshold for the exceedance statistic')
+    summarize_.add_argument('--chunk-bytes', help='target block size, e.g. 64MiB; defaults to dask array.chunk-size')
+    summarize_.add_argument('--scheduler', choices=['threads', 'processes', 'synchronous', 'distributed'],
+                            help='dask scheduler')
+    summarize_.add_argument('--num-workers', type=int, help='number of dask workers')
+    summarize_.add_argument('--state-coord', nargs='+', default=['compt'], help='epidemiological state coords')
+    summarize_.add_argument('--within-sim-coord', nargs='+', default=['age', 'risk', 'vertex'],
+                            help='coords within a simulation')
+    summarize_.add_argument('--between-sim-coord', nargs='+', default=['index'],
+                            help='coords separating simulations')
+    summarize_.add_argument('--time-coord', nargs='+', default=['step'], help='time coord')
+    summarize_.add_argument('--measured-coord', nargs='+', default=['compt_model__state'],
+                            help='measured variables')
+    summarize_.set_defaults(run=summarize)
+
+    return parser_
+
+
+def main(argv=None):
+    """Entry point of the ``epivislab`` command.
+
+    Args:
+        argv (list of str): command line arguments; defaults to ``sys.argv[1:]``
+
+    Returns:
+        int: exit status
+    """
+
+    args = parser().parse_args(argv)
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO)
+
+    result = args.run(args)
+    logger.info(f'Wrote {result.encoding.get("source", "")}')
+
+    return 0
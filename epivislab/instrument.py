@@ -0,0 +1,160 @@
+"""Instrumentation of summary statistic calculations
+
+Each stage of a calculation (``validate``, ``chunk``, ``sum``, ``quantile``, ``statistics``, ``merge``,
+``to_xarray``, ``rollup``, ``write``, ``render``) is recorded as a span: a ``dict`` with the ``stage`` name, its
+duration in ``seconds`` and any sizes known for the stage (``rows_in``, ``rows_out``, ``bytes_in``, ``bytes_out``,
+``tasks`` in the ``dask`` graph). Cache lookups are recorded as ``cache`` spans with ``kind`` (``'memo'`` or
+``'disk'``) and ``hit``.
+
+Records are logged to the ``epivislab.instrument`` logger at ``DEBUG`` level and passed to every callback registered
+with :func:`add_callback` or :func:`collect`, e.g. to forward them to a metrics system::
+
+    with instrument.collect() as records:
+        summary.prediction_interval(groupers, aggcol, upper=0.95, lower=0.05)
+    slowest = max(records, key=lambda record: record['seconds'])
+
+Sizes that would need extra computation (such as the row count of a persisted ``dask.DataFrame``) are only
+measured while a callback is registered or ``DEBUG`` logging is enabled; see :func:`enabled`.
+"""
+
+import time
+import logging
+import contextlib
+import dask
+
+logger = logging.getLogger(__name__)
+
+_callbacks = []
+
+
+def add_callback(callback):
+    """Register a function called with every span record.
+
+    Args:
+        callback (callable): function taking a single ``dict`` argument
+
+    Returns:
+        None
+    """
+
+    _callbacks.append(callback)
+
+
+def remove_callback(callback):
+    """Unregister a function added with :func:`add_callback`.
+
+    Args:
+        callback (callable): registered function
+
+    Returns:
+        None
+    """
+
+    _callbacks.remove(callback)
+
+
+def enabled():
+    """Whether span records are consumed, by a callback or by ``DEBUG`` logging.
+
+    Returns:
+        bool
+    """
+
+    return len(_callbacks) > 0 or logger.isEnabledFor(logging.DEBUG)
+
+
+def emit(record):
+    """Log a span record and pass it to every registered callback.
+
+    Args:
+        record (dict): span record
+
+    Returns:
+        None
+    """
+
+    if logger.isEnabledFor(logging.DEBUG):
+        fields = ', '.join([f'{key}={value}' for key, value in record.items() if key not in ['stage', 'seconds']])
+        logger.debug(f'{record["stage"]}: {record.get("seconds", 0):.4f} s; {fields}')
+    for callback in list(_callbacks):
+        callback(record)
+
+
+@contextlib.contextmanager
+def span(stage, **fields):
+    """Time a stage of a calculation.
+
+    The record is yielded so that sizes can be added while the stage runs; it is emitted (see :func:`emit`) with
+    its duration when the ``with`` block exits.
+
+    Args:
+        stage (str): name of the stage
+        **fields: initial fields of the record
+
+    Yields:
+        dict: span record
+    """
+
+    record = {'stage': stage, **fields}
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        emit(record)
+
+
+def cache_event(kind, hit, **fields):
+    """Record a cache lookup.
+
+    Args:
+        kind (str): ``'memo'`` or ``'disk'``
+        hit (bool): whether the lookup found a result
+        **fields: other fields of the record
+
+    Returns:
+        None
+    """
+
+    emit({'stage': 'cache', 'kind': kind, 'hit': hit, 'seconds': 0.0, **fields})
+
+
+@contextlib.contextmanager
+def collect(callback=None):
+    """Collect the span records emitted within a ``with`` block.
+
+    Args:
+        callback (callable): optional function also called with every record
+
+    Yields:
+        list of dict: span records, appended as they are emitted
+    """
+
+    records = []
+
+    def _collect(record):
+        records.append(record)
+        if callback is not None:
+            callback(record)
+
+    add_callback(_collect)
+    try:
+        yield records
+    finally:
+        remove_callback(_collect)
+
+
+def dask_tasks(collection):
+    """Number of tasks in the graph of a ``dask`` collection.
+
+    Args:
+        collection (object): ``dask`` collection (or ``xarray`` object backed by one)
+
+    Returns:
+        int: number of tasks; ``0`` for objects that are not ``dask`` collections
+    """
+
+    if not dask.is_dask_collection(collection):
+        return 0
+
+    return len(collection.__dask_graph__())
@@ -5,45 +5,342 @@ mpl_logger = logging.getLogger('matplotlib')
 mpl_logger.setLevel(logging.WARNING)
 fi_logger = logging.getLogger('fiona')
 fi_logger.setLevel(logging.WARNING)
+import os
+import json
+import hashlib
 import pandas as pd
 import geopandas as gpd
-import shapefile
-import plotly.offline as po
-import plotly.express as px
+import plotly
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import numpy as np
-import xarray as xr
-import xsimlab as xs
 #from episimlab.partition import partition
 #from episimlab.setup.coords import InitDefaultCoords
 import multiprocessing as mp
-from datetime import datetime
 
 
 def spatial_simulation(xr_array, shape, compartment):
+    """Join simulated counts for one compartment to vertex geometries and centroid coordinates.
+
+    Vertex IDs and dates are formatted once per unique value and broadcast back to rows with integer codes, and
+    centroids are calculated once per shape before the join, rather than once per vertex and timestep.
+
+    Args:
+        xr_array (xarray): simulation data with ``compartment``, ``risk_group``, ``age_group``, ``vertex`` and ``step``
+            coordinates
+        shape (geopandas.GeoDataFrame): vertex geometries with vertex IDs in the ``GEOID10`` column
+        compartment (str): compartment to select
+
+    Returns:
+        geopandas.GeoDataFrame: one row per vertex and timestep, with ``date``, ``lon`` and ``lat`` columns and the
+        matching ``shape`` columns
+    """
+
     xr_compt = xr_array.sel({'compartment': compartment}).sum(dim=['risk_group', 'age_group'])
     df_compt = xr_compt.to_dataframe().reset_index()
-    df_compt['vertex'] = [str(int(i)) for i in df_compt['vertex']]
-    df_compt['date'] = [
-        datetime.strftime(pd.to_datetime(i), '%Y-%m-%d') for i in df_compt['step']
-    ]
+
+    # format each unique vertex and date once
+    vertex_codes, vertex_values = pd.factorize(df_compt['vertex'])
+    vertex_labels = np.array([str(int(i)) for i in vertex_values], dtype=object)
+    df_compt['vertex'] = vertex_labels[vertex_codes]
+
+    step_codes, step_values = pd.factorize(df_compt['step'])
+    df_compt['date'] = pd.DatetimeIndex(step_values).strftime('%Y-%m-%d').to_numpy(dtype=object)[step_codes]
+
+    # calculate (planar) centroids once per shape, then join shapes to rows by integer position
+    shape_xy = pd.DataFrame(shape).reset_index(drop=True)
+    centroids = gpd.GeoSeries(np.asarray(shape_xy['geometry'].values)).centroid
+    shape_xy['lon'] = centroids.x.values
+    shape_xy['lat'] = centroids.y.values
+
+    geoid = pd.Index(shape_xy['GEOID10'])
+    assert geoid.is_unique
+    shape_position = geoid.get_indexer(vertex_labels)[vertex_codes]
+    shape_rows = shape_xy.reindex(shape_position).reset_index(drop=True)
+
     df_shape = gpd.GeoDataFrame(
-        pd.merge(df_compt, shape, left_on='vertex', right_on='GEOID10', how='left'),
+        pd.concat([df_compt, shape_rows], axis=1),
+        geometry='geometry',
         crs=shape.crs
     )
-    df_shape['lon'] = [i.centroid.coords[0][0] if i else None for i in df_shape['geometry']]
-    df_shape['lat'] = [i.centroid.coords[0][1] if i else None for i in df_shape['geometry']]
 
     return df_shape
 
 
-def make_burden_plot(dataframe, start_date, stop_date, token):
-    # data manipulation
+def _burden_frame(args):
+    """Build one animation frame of :func:`make_burden_plot` from preallocated per-date array slices.
+
+    Defined at module level so that frames can be built in a process pool.
+    """
+
+    (k, date, lat, lon, size, color, customdata, agg_x, agg_y, agg_point_y, agg_customdata, cmin, cmax,
+     hovertemplate_left, hovertemplate_right) = args
+
+    return go.Frame(
+        data=[
+            go.Scattermapbox(
+                lat=lat,
+                lon=lon,
+                marker=dict(
+                    size=size,  # 25
+                    color=color,
+                    colorbar=dict(title='', x=0.45),
+                    colorscale="Viridis",
+                    cmax=cmax,
+                    cmin=cmin
+                ),
+                customdata=customdata,
+                hovertemplate=hovertemplate_left
+            ),
+            go.Scatter(
+                x=agg_x,
+                y=agg_y,
+                mode='lines',
+                line=dict(width=2, color='gray')
+            ),
+            go.Scatter(
+                x=[date],
+                y=[agg_point_y],
+                mode='markers',
+                marker=dict(size=10, color='red'),
+                customdata=agg_customdata,
+                hovertemplate=hovertemplate_right
+            )
+        ],
+        traces=[0, 1, 2],  # there are 2 subplots but three traces, we need to request the three traces here
+        name=f'frame{k}'
+    )
+
+
+# plotly.py >= 6 serializes numpy arrays as base64-encoded typed arrays instead of JSON lists
+_TYPED_ARRAYS = int(plotly.__version__.split('.')[0]) >= 6
+
+
+def _compact(values):
+    """Per-frame numeric array in the most compact form plotly can serialize."""
+
+    values = np.asarray(values, dtype=float)
+    if _TYPED_ARRAYS:
+        return values.astype(np.float32)
+
+    return values
+
+
+def _burden_delta_frame(args):
+    """Build one delta-only animation frame of :func:`make_burden_plot`.
+
+    Only marker color and size (or polygon values), hover values and the aggregate marker change between dates;
+    geometry, vertex labels, the color scale and the aggregate line are taken from the figure's base traces.
+    """
+
+    k, date, map_mode, size, color, hover, agg_point_y, agg_customdata, hovertemplate_right = args
+
+    if map_mode == 'choropleth':
+        map_trace = go.Choroplethmapbox(z=color, customdata=hover)
+    else:
+        map_trace = go.Scattermapbox(marker=dict(size=size, color=color), customdata=hover)
+
+    return go.Frame(
+        data=[
+            map_trace,
+            go.Scatter(
+                x=[date],
+                y=[agg_point_y],
+                mode='markers',
+                marker=dict(size=10, color='red'),
+                customdata=agg_customdata,
+                hovertemplate=hovertemplate_right
+            )
+        ],
+        traces=[0, 2],  # the aggregate line (trace 1) is static
+        name=f'frame{k}'
+    )
+
+
+def shape_fingerprint(shape, id_col='GEOID10'):
+    """Fingerprint vertex geometries.
+
+    For a path to a shapefile, the fingerprint is a hash of the bytes of the shapefile and its sidecar files, so the
+    shapefile need not be read. For a ``geopandas.GeoDataFrame``, it is a hash of the vertex IDs, the coordinate
+    reference system and the well-known binary of every geometry.
+
+    Args:
+        shape (str or geopandas.GeoDataFrame): path to a shapefile, or vertex geometries
+        id_col (str): name of the column with vertex IDs
+
+    Returns:
+        str: hexadecimal fingerprint
+    """
+
+    digest = hashlib.sha256()
+    if isinstance(shape, (str, os.PathLike)):
+        stem = os.path.splitext(shape)[0]
+        for ext in ['.shp', '.shx', '.dbf', '.prj', '.cpg']:
+            if os.path.exists(stem + ext):
+                with open(stem + ext, 'rb') as f:
+                    digest.update(ext.encode())
+                    digest.update(f.read())
+        return digest.hexdigest()
+
+    digest.update(str(shape.crs).encode())
+    for vertex, geometry in zip(shape[id_col], shape.geometry):
+        digest.update(str(vertex).encode())
+        digest.update(geometry.wkb if geometry is not None else b'')
+
+    return digest.hexdigest()
+
+
+def zoom_tolerance(tolerance, zoom):
+    """Select a simplification tolerance for a map zoom level.
+
+    Args:
+        tolerance (float or dict): a single tolerance, or tolerances keyed by the minimum zoom level they apply to
+        zoom (float): map zoom level
+
+    Returns:
+        float: tolerance for the highest zoom level key at or below ``zoom`` (the lowest key if ``zoom`` is below all
+        keys)
+    """
+
+    if not isinstance(tolerance, dict):
+        return tolerance
+
+    levels = sorted(tolerance)
+    eligible = [i for i in levels if i <= zoom]
+
+    return tolerance[eligible[-1] if eligible else levels[0]]
+
+
+def bounds_zoom(bounds, width=400, height=400):
+    """Select a map center and zoom level that fit longitude and latitude bounds.
+
+    Mapbox maps use the Web Mercator projection, in which the world spans 512 pixels at zoom level 0 and twice as
+    many at each further level.
+
+    Args:
+        bounds (sequence of float): (min longitude, min latitude, max longitude, max latitude) in EPSG:4326
+        width (int): map width in pixels
+        height (int): map height in pixels
+
+    Returns:
+        tuple: center (dict with ``lat`` and ``lon`` keys) and zoom level (float, between 0 and 20)
+    """
+
+    west, south, east, north = [float(i) for i in bounds]
+    south_y, north_y = [np.log(np.tan(np.pi / 4 + np.radians(np.clip(i, -85.0, 85.0)) / 2)) for i in (south, north)]
+
+    # fraction of the world spanned in each direction; a single point is drawn at the highest zoom level
+    x_span = max((east - west) / 360, 1e-9)
+    y_span = max((north_y - south_y) / (2 * np.pi), 1e-9)
+    zoom = float(np.clip(min(np.log2(width / 512 / x_span), np.log2(height / 512 / y_span)), 0, 20))
+
+    center_lat = np.degrees(2 * np.arctan(np.exp((south_y + north_y) / 2)) - np.pi / 2)
+
+    return dict(lat=float(center_lat), lon=(west + east) / 2), zoom
+
+
+def simplified_geojson(shape, tolerance, cache_dir=None, id_col='GEOID10'):
+    """Simplified vertex geometries as GeoJSON, with features identified by vertex ID.
+
+    Geometries are reprojected to longitude and latitude (EPSG:4326), as mapbox expects, if the shape has another
+    coordinate reference system, and then simplified once (preserving topology) at ``tolerance`` degrees. When
+    ``cache_dir`` is given, the GeoJSON is written there keyed by :func:`shape_fingerprint` and ``tolerance``, and
+    later calls with the same geometries and tolerance read it back without reading the shapefile or simplifying
+    again.
+
+    Args:
+        shape (str or geopandas.GeoDataFrame): path to a shapefile, or vertex geometries
+        tolerance (float): simplification tolerance in degrees; ``0`` keeps geometries unchanged
+        cache_dir (str): optional directory for cached GeoJSON
+        id_col (str): name of the column with vertex IDs
+
+    Returns:
+        dict: GeoJSON ``FeatureCollection`` with feature ``id`` set to the vertex ID
+    """
+
+    path = None
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, f'{shape_fingerprint(shape, id_col)[:32]}-{float(tolerance)!r}.geojson')
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+
+    if isinstance(shape, (str, os.PathLike)):
+        shape = gpd.read_file(shape)
+
+    shape = shape[shape.geometry.notna()]
+    if shape.crs is not None and shape.crs.to_epsg() != 4326:
+        shape = shape.to_crs(4326)
+    geometry = gpd.GeoSeries(
+        shape.geometry.simplify(tolerance, preserve_topology=True).values,
+        index=pd.Index(shape[id_col].astype(str), name=id_col),
+        crs=shape.crs
+    )
+    geojson = json.loads(geometry.to_json())
+
+    if path is not None:
+        # write then rename so that a partially written file is never read
+        tmp_path = f'{path}.tmp{os.getpid()}'
+        with open(tmp_path, 'w') as f:
+            json.dump(geojson, f)
+        os.replace(tmp_path, path)
+
+    return geojson
+
+
+def make_burden_plot(dataframe, start_date, stop_date, token, processes=None, frame_mode='full', map_mode='markers',
+                     shape=None, tolerance=0.001, geometry_cache_dir=None):
+    """Animated map of burden per 10,000 by vertex alongside the aggregate burden over time.
+
+    The data are sorted by date once, so the rows for each animation frame are a contiguous slice of preallocated
+    arrays, and the aggregate burden for every date is looked up from a single groupby. Frames can optionally be
+    built in parallel with a process pool.
+
+    With ``frame_mode='full'`` every frame carries the complete map and line traces. With ``frame_mode='delta'``
+    the vertex locations, labels, color scale and aggregate line are sent once in the base traces and each frame
+    carries only marker colors and sizes and hover values, which greatly reduces the size of exported HTML for
+    long animations. Every date must then include the same vertices. With plotly 6 or later, per-frame arrays are
+    encoded as compact binary typed arrays.
+
+    With ``map_mode='choropleth'`` vertices are drawn as polygons rather than centroid markers. Geometries are
+    reprojected to EPSG:4326 and simplified once by :func:`simplified_geojson` (optionally cached on disk) and sent
+    once with the base trace; frames reference polygons by vertex ID and carry only values, whatever the
+    ``frame_mode``. The map is centered on the vertex geometries in ``dataframe``, at the zoom level that fits them
+    (see :func:`bounds_zoom`), and that zoom level selects the simplification ``tolerance``.
+
+    Args:
+        dataframe (pandas.DataFrame): output of :func:`spatial_simulation` with ``burden_per_10k``,
+            ``burden_per_10k_str``, ``marker_size`` and ``group_pop`` columns
+        start_date (str): first date to animate, formatted ``%Y-%m-%d``
+        stop_date (str): last date to animate, formatted ``%Y-%m-%d``
+        token (str): mapbox access token
+        processes (int): optional number of worker processes used to build frames
+        frame_mode (str): ``'full'`` or ``'delta'``
+        map_mode (str): ``'markers'`` or ``'choropleth'``
+        shape (str or geopandas.GeoDataFrame): path to a shapefile, or vertex geometries with vertex IDs in the
+            ``GEOID10`` column, for ``map_mode='choropleth'``; by default the geometries in ``dataframe`` are used
+        tolerance (float or dict): geometry simplification tolerance in degrees, or tolerances keyed by minimum zoom
+            level (see :func:`zoom_tolerance`)
+        geometry_cache_dir (str): optional directory for cached simplified geometries
+
+    Returns:
+        plotly.graph_objects.Figure: animated figure
+    """
+
+    assert frame_mode in ['full', 'delta']
+    assert map_mode in ['markers', 'choropleth']
+    values_only = frame_mode == 'delta' or map_mode == 'choropleth'
+    center = dict(lat=30.3, lon=-97.7)
+    zoom = 8.5
+
+    # data manipulation; sort once by date so that each frame is a contiguous slice
     dataslice = dataframe[(dataframe['date'] >= start_date) & (dataframe['date'] <= stop_date)]
-    dates = dataslice['date'].unique()
+    dataslice = dataslice.sort_values(['date', 'vertex'] if values_only else 'date', kind='mergesort')
+    dates, frame_starts = np.unique(dataslice['date'].to_numpy(), return_index=True)
+    frame_stops = np.append(frame_starts[1:], len(dataslice))
 
-    aggregate_pct = dataframe.groupby(['date'])['apply_counts_delta__counts', 'group_pop'].sum().reset_index()
+    aggregate_pct = dataframe.groupby(['date'])[['apply_counts_delta__counts', 'group_pop']].sum().reset_index()
     aggregate_pct['burden_per_10k'] = (aggregate_pct['apply_counts_delta__counts'] / aggregate_pct['group_pop']) * 10000
     aggregate_pct['burden_per_10k_str'] = [str(round(i, 2)) for i in aggregate_pct['burden_per_10k']]
     agg_slice = aggregate_pct[(aggregate_pct['date'] >= start_date) & (aggregate_pct['date'] <= stop_date)]
@@ -53,7 +350,7 @@ def make_burden_plot(dataframe, start_date, stop_date, token):
     hovertemplate_right = '%{customdata[0]}<br>%{customdata[1]} per 10k<extra></extra>'
 
     # starting time slice
-    d1 = dataslice[dataslice['date'] == min(dates)]
+    d1 = dataslice.iloc[frame_starts[0]:frame_stops[0]]
 
     # https://chart-studio.plotly.com/~empet/15243/animating-traces-in-subplotsbr/#/
     fig = make_subplots(
@@ -62,8 +359,34 @@ def make_burden_plot(dataframe, start_date, stop_date, token):
         subplot_titles=(
         'Hospitalizations (per 10,000)\nby patient residence zip code', 'Total hospitalizations (per 10,000)')
     )
-    fig.add_trace(
-        go.Scattermapbox(
+    if map_mode == 'choropleth':
+        vertices = gpd.GeoDataFrame(
+            dataframe.drop_duplicates('vertex')[['vertex', 'geometry']], geometry='geometry', crs=dataframe.crs
+        )
+        vertices = vertices[vertices.geometry.notna()]
+        if vertices.crs is not None and vertices.crs.to_epsg() != 4326:
+            vertices = vertices.to_crs(4326)
+        center, zoom = bounds_zoom(vertices.total_bounds)
+
+        if shape is None:
+            geojson = simplified_geojson(
+                vertices, zoom_tolerance(tolerance, zoom), cache_dir=geometry_cache_dir, id_col='vertex'
+            )
+        else:
+            geojson = simplified_geojson(shape, zoom_tolerance(tolerance, zoom), cache_dir=geometry_cache_dir)
+        map_trace = go.Choroplethmapbox(
+            geojson=geojson,
+            locations=d1['vertex'].to_numpy(),
+            z=d1['burden_per_10k'].to_numpy(),
+            colorbar=dict(title='', x=0.45),
+            colorscale="Viridis",
+            marker=dict(opacity=0.7, line=dict(width=0.5)),
+            text=d1['vertex'].to_numpy(),
+            customdata=d1['burden_per_10k_str'].to_numpy(),
+            hovertemplate='%{text}<br>%{customdata} per 10k<extra></extra>'
+        )
+    else:
+        map_trace = go.Scattermapbox(
             lat=[d1['lat']],
             lon=[d1['lon']],
             mode='markers',
@@ -77,10 +400,8 @@ def make_burden_plot(dataframe, start_date, stop_date, token):
             ),
             customdata=d1[['vertex', 'burden_per_10k_str']].to_numpy(),
             hovertemplate=hovertemplate_left
-        ),
-        row=1,
-        col=1
-    )
+        )
+    fig.add_trace(map_trace, row=1, col=1)
 
     # for some reason I don't fully understand, we need to do this twice...
     fig.add_trace(
@@ -108,49 +429,84 @@ def make_burden_plot(dataframe, start_date, stop_date, token):
         mapbox=dict(
             accesstoken=token,
             bearing=0,
-            center=dict(lat=30.3,
-                        lon=-97.7),
+            center=center,
             pitch=0,
-            zoom=8.5,
+            zoom=zoom,
             style='light'
         )
     )
 
-    frames = [
-        go.Frame(
-            data=[
-                go.Scattermapbox(
-                    lat=dataslice[dataslice['date'] == dates[k]]['lat'],
-                    lon=dataslice[dataslice['date'] == dates[k]]['lon'],
-                    marker=dict(
-                        size=dataslice[dataslice['date'] == dates[k]]['marker_size'],  # 25
-                        color=dataslice[dataslice['date'] == dates[k]]['burden_per_10k'],
-                        colorbar=dict(title='', x=0.45),
-                        colorscale="Viridis",
-                        cmax=max(dataslice['burden_per_10k']),
-                        cmin=min(dataslice['burden_per_10k'])
-                    ),
-                    customdata=dataslice[dataslice['date'] == dates[k]][['vertex', 'burden_per_10k_str']].to_numpy(),
-                    hovertemplate=hovertemplate_left
-                ),
-                go.Scatter(
-                    x=agg_slice['date'],
-                    y=agg_slice['burden_per_10k'],
-                    mode='lines',
-                    line=dict(width=2, color='gray')
-                ),
-                go.Scatter(
-                    x=[dates[k]],
-                    y=[sum(agg_slice[agg_slice['date'] == dates[k]]['burden_per_10k'])],
-                    mode='markers',
-                    marker=dict(size=10, color='red'),
-                    customdata=agg_slice[agg_slice['date'] == dates[k]][['date', 'burden_per_10k_str']].to_numpy(),
-                    hovertemplate=hovertemplate_right
-                )
-            ],
-            traces=[0, 1, 2],  # there are 2 subplots but three traces, we need to request the three traces here
-            name=f'frame{k}') for k in range(len(dates))
-    ]
+    # preallocated per-row and per-date arrays
+    lat = dataslice['lat'].to_numpy()
+    lon = dataslice['lon'].to_numpy()
+    marker_size = dataslice['marker_size'].to_numpy()
+    burden = dataslice['burden_per_10k'].to_numpy()
+    customdata = dataslice[['vertex', 'burden_per_10k_str']].to_numpy()
+    cmax = np.nanmax(burden)
+    cmin = np.nanmin(burden)
+
+    agg_x = agg_slice['date'].to_numpy()
+    agg_y = agg_slice['burden_per_10k'].to_numpy()
+    agg_by_date = agg_slice.groupby('date')['burden_per_10k'].sum().reindex(dates, fill_value=0).to_numpy()
+    agg_customdata = agg_slice[['date', 'burden_per_10k_str']].to_numpy()
+    agg_position = pd.Index(agg_x).get_indexer(dates)
+
+    if values_only:
+        # geometry, vertex labels and the color scale are sent once with the base trace
+        first = slice(frame_starts[0], frame_stops[0])
+        vertex = dataslice['vertex'].to_numpy()
+        hover = dataslice['burden_per_10k_str'].to_numpy()
+        for k in range(len(dates)):
+            assert np.array_equal(vertex[frame_starts[k]:frame_stops[k]], vertex[first])
+
+        if map_mode == 'choropleth':
+            fig.data[0].update(zmin=cmin, zmax=cmax)
+        else:
+            fig.data[0].update(
+                lat=lat[first],
+                lon=lon[first],
+                text=vertex[first],
+                customdata=hover[first],
+                marker=dict(size=marker_size[first], color=burden[first], cmax=cmax, cmin=cmin),
+                hovertemplate='%{text}<br>%{customdata} per 10k<extra></extra>'
+            )
+
+        frame_args = [
+            (
+                k, dates[k], map_mode,
+                _compact(marker_size[frame_starts[k]:frame_stops[k]]),
+                _compact(burden[frame_starts[k]:frame_stops[k]]),
+                hover[frame_starts[k]:frame_stops[k]],
+                agg_by_date[k],
+                agg_customdata[[agg_position[k]]] if agg_position[k] >= 0 else agg_customdata[:0],
+                hovertemplate_right
+            )
+            for k in range(len(dates))
+        ]
+        build_frame = _burden_delta_frame
+
+    else:
+        frame_args = [
+            (
+                k, dates[k],
+                lat[frame_starts[k]:frame_stops[k]],
+                lon[frame_starts[k]:frame_stops[k]],
+                marker_size[frame_starts[k]:frame_stops[k]],
+                burden[frame_starts[k]:frame_stops[k]],
+                customdata[frame_starts[k]:frame_stops[k]],
+                agg_x, agg_y, agg_by_date[k],
+                agg_customdata[[agg_position[k]]] if agg_position[k] >= 0 else agg_customdata[:0],
+                cmin, cmax, hovertemplate_left, hovertemplate_right
+            )
+            for k in range(len(dates))
+        ]
+        build_frame = _burden_frame
+
+    if processes is None:
+        frames = [build_frame(args) for args in frame_args]
+    else:
+        with mp.Pool(processes) as pool:
+            frames = pool.map(build_frame, frame_args)
 
     fig.update(frames=frames)
 
@@ -1,19 +1,87 @@
 """High-level API classes for working with epidemic simulation data
 """
 
+import os
+import re
+import json
+import logging
+import itertools
+import contextlib
+import multiprocessing as mp
 import xarray as xr
 import numpy as np
 import pandas as pd
 import dask.dataframe as dd
 import dask
-from epivislab.stats import Sum, Quantile
-from epivislab.timeseries import interval_timeseries, spaghetti_timeseries
+from epivislab.stats import Sum, Quantile, MultiQuantile, EnsembleStats
+from epivislab.streaming import EnsembleAccumulator
+from epivislab.cache import ResultCache, MemoCache, dataset_fingerprint
+from epivislab import instrument
+
+logger = logging.getLogger(__name__)
+
+
+def _aggcol_names(aggcol):
+    """Measured coordinate name(s) as a tuple, so that ``'x'`` and ``['x']`` give the same memo and cache keys."""
+
+    return (aggcol,) if type(aggcol) == str else tuple(aggcol)
+
+
+def _categorize(frame, categories):
+    """Replace integer code columns of a partition of the long-format frame with ``pandas.Categorical`` columns."""
+
+    return frame.assign(**{
+        coord: pd.Categorical.from_codes(frame[coord].to_numpy(), dtype=dtype) for coord, dtype in categories.items()
+    })
+
+
+def _check_scheduler(scheduler):
+    """Raise ``ValueError`` unless ``scheduler`` is a scheduler name, ``None``, or a ``dask.distributed.Client`` or
+    ``LocalCluster``."""
+
+    names = [None, 'threads', 'processes', 'synchronous', 'distributed']
+    if scheduler is None or isinstance(scheduler, str):
+        if scheduler not in names:
+            raise ValueError(f'Unknown scheduler {scheduler!r}; expected one of {names[1:]}, None, or a '
+                             f'dask.distributed.Client or LocalCluster.')
+        return
+
+    try:
+        from distributed import Client, LocalCluster
+    except ImportError:
+        raise ValueError(f'Scheduler {scheduler!r} is not a scheduler name and dask.distributed is not installed.')
+    if not isinstance(scheduler, (Client, LocalCluster)):
+        raise ValueError(f'Scheduler {scheduler!r} is not a scheduler name, dask.distributed.Client or LocalCluster.')
+
+
+def _block_frame(block, dim_order, categories, start):
+    """Long-format ``pandas.DataFrame`` of one block of the simulation, with rows numbered from ``start``."""
+
+    frame = block.to_dataframe(dim_order=dim_order).reset_index()
+    frame.index = pd.RangeIndex(start, start + len(frame))
+    if categories:
+        frame = _categorize(frame, categories)
+
+    return frame
+
 
 class SimHandler:
     """Organizes ``xarray`` simulation data coordinates and manages aggregation and summary statistic calculations.
 
     Class instantiation automatically calls several data validation, cleaning, and organizing methods.
-    See :func:`validate`, :func:`make_lists`, and :func:`chunk_sim` for more details on these methods.
+    See :func:`validate` and :func:`make_lists` for more details on these methods. The long-format
+    ``dask.DataFrame`` view of the simulation (:attr:`chunk_sim`) is only built when a statistic first needs it;
+    see :func:`make_chunks`.
+
+    Progress messages are logged to the ``epivislab.simhandler`` logger, and each stage of a calculation is
+    recorded with :mod:`epivislab.instrument`.
+
+    ``dask`` computations run on the scheduler chosen by ``scheduler``: ``None`` uses the ``dask`` default
+    (threads for arrays and data frames); ``'threads'``, ``'processes'`` or ``'synchronous'`` select a local
+    scheduler with up to ``num_workers`` workers; ``'distributed'`` starts a ``dask.distributed.LocalCluster`` on
+    first use (configured by ``cluster_kwargs``); a ``dask.distributed.Client`` is used as given, and a
+    ``dask.distributed.LocalCluster`` through a client connected on first use. Any other value raises
+    ``ValueError``. See :func:`execution`, :func:`compute` and :func:`persist`.
 
     Attributes:
         simulation (xarray): simulation data
@@ -21,9 +89,18 @@ class SimHandler:
         within_sim (str, list): coordinate(s) for within-simulation data
         between_sim (str, list): coordinate(s) for between-simulation data
         time_coord (str): coordinate for timestep data
+        chunk_bytes (int): target size in bytes of each chunk of :attr:`chunk_sim`; defaults to the ``dask``
+            ``array.chunk-size`` setting
+        chunk_plan (dict): chunking chosen by :func:`plan_chunks` for the most recently built long-format frame
+        scheduler (str, dask.distributed.Client, dask.distributed.LocalCluster): scheduler for ``dask`` computations
+        num_workers (int): number of workers for local schedulers and the ``LocalCluster``
+        cluster_kwargs (dict): keyword arguments for ``dask.distributed.LocalCluster``
+        compact (bool): whether :func:`make_chunks` encodes string coordinates as categoricals and downcasts
+            measured values where lossless; see :func:`coord_codes` and :func:`value_dtypes`
     """
 
-    def __init__(self, simulation, state_coord, within_sim_coord, between_sim_coord, measured_coord, time_coord):
+    def __init__(self, simulation, state_coord, within_sim_coord, between_sim_coord, measured_coord, time_coord,
+                 chunk_bytes=None, scheduler=None, num_workers=None, cluster_kwargs=None, compact=True):
         self.simulation = simulation
         self.state_coord = state_coord  # never sum
         self.within_sim = within_sim_coord  # only sum within simulations
@@ -31,10 +108,19 @@ class SimHandler:
         self.between_sim = between_sim_coord  # never sum, only summarize over simulations
         self.all_coords = None
         self.measured = measured_coord
-        self.validate()
-        self.make_lists()
-        self.chunk_sim = None
-        self.make_chunks()
+        self.chunk_bytes = chunk_bytes
+        _check_scheduler(scheduler)
+        self.scheduler = scheduler
+        self.num_workers = num_workers
+        self.cluster_kwargs = {} if cluster_kwargs is None else cluster_kwargs
+        self._client = None
+        self.compact = compact
+        self._value_dtypes = {}
+        with instrument.span('validate'):
+            self.validate()
+            self.make_lists()
+        self.chunk_plan = None
+        self._chunk_sims = {}
 
     def validate(self):
         """Check that all coords are identified as between, within, or measured"""
@@ -65,11 +151,144 @@ class SimHandler:
         if type(self.measured) == str:
             self.measured = [self.measured]
 
-    def make_chunks(self):
+    def plan_chunks(self, chunk_bytes=None, measured=None):
+        """Choose chunk sizes for :attr:`simulation` that fit a memory budget.
+
+        :func:`make_chunks` builds one partition of the long-format frame from each block of the plan. The
+        between-simulation coordinates are never split, so each partition holds complete replicate vectors and
+        between-simulation statistics need no shuffle. The other coordinates are split largest first (typically
+        vertex, then time), each to the largest chunk that keeps a block within ``chunk_bytes``, until a block fits.
+        If :attr:`simulation` is already chunked (for example when it was opened with ``xr.open_zarr``), chunks are
+        divisors or multiples of the existing chunk sizes, so blocks stay aligned with the chunks on disk.
+
+        If a single block of complete replicate vectors (one value of every other coordinate) is larger than
+        ``chunk_bytes``, the plan uses such blocks, sets ``over_budget`` and logs a warning.
+
+        Args:
+            chunk_bytes (int): target size of each chunk in bytes; defaults to :attr:`chunk_bytes`
+            measured (list of str): measured coordinates to include; defaults to :attr:`measured`
+
+        Returns:
+            dict: the plan, with keys ``chunks`` ({coordinate: chunk size}), ``bytes_per_chunk``, ``n_chunks``,
+            ``row_bytes``, ``over_budget`` and ``source`` (``'existing'`` if the existing chunk sizes were kept,
+            ``'planned'`` otherwise)
+        """
+
+        if chunk_bytes is None:
+            chunk_bytes = self.chunk_bytes
+        if chunk_bytes is None:
+            chunk_bytes = dask.utils.parse_bytes(dask.config.get('array.chunk-size'))
+        if measured is None:
+            measured = self.measured
+
+        # every row of the long-format frame carries each coordinate (or its code) and each measured variable
+        codes = self.coord_codes()
+        row_bytes = sum([np.dtype(codes.get(i, self.simulation[i].dtype)).itemsize for i in self.all_coords])
+        row_bytes += sum([dtype.itemsize for dtype in self.value_dtypes(measured).values()])
+        sizes = {i: len(self.simulation[i]) for i in self.all_coords}
+
+        # existing (e.g. zarr on-disk) chunking
+        existing = self.simulation[measured[0]].chunks
+        dims = self.simulation[measured[0]].dims
+        disk = {} if existing is None else {i: max(existing[dims.index(i)]) for i in self.all_coords if i in dims}
+
+        chunks = dict(sizes)
+        for coord in sorted([i for i in self.all_coords if i not in self.between_sim], key=lambda i: -sizes[i]):
+            block_bytes = int(np.prod(list(chunks.values()))) * row_bytes
+            if block_bytes <= chunk_bytes:
+                break
+            fit = max(chunk_bytes // (block_bytes // chunks[coord]), 1)
+            if coord in disk and fit < disk[coord]:
+                fit = max([i for i in range(1, fit + 1) if disk[coord] % i == 0])
+            elif coord in disk:
+                fit = fit // disk[coord] * disk[coord]
+            chunks[coord] = min(fit, sizes[coord])
+
+        bytes_per_chunk = int(np.prod(list(chunks.values()))) * row_bytes
+        n_chunks = int(np.prod([np.ceil(sizes[i] / chunks[i]) for i in self.all_coords]))
+        source = 'existing' if all([chunks[i] in [sizes[i], disk.get(i)] for i in self.all_coords]) else 'planned'
+        plan = {
+            'chunks': chunks, 'bytes_per_chunk': bytes_per_chunk, 'n_chunks': n_chunks, 'row_bytes': row_bytes,
+            'over_budget': bytes_per_chunk > chunk_bytes, 'source': source
+        }
+
+        logger.info(f'Chunk plan ({source}): {chunks}; {n_chunks} chunks of up to {bytes_per_chunk} bytes.')
+        if plan['over_budget']:
+            logger.warning(
+                f'The replicate vectors of a single cell take {bytes_per_chunk} bytes, more than chunk_bytes '
+                f'({chunk_bytes}); partitions will exceed the budget.'
+            )
+
+        return plan
+
+    def coord_codes(self):
+        """Integer code dtypes of the string coordinates encoded by :func:`make_chunks`.
+
+        Codes are positions in the coordinate, stored in the smallest signed integer type that holds them.
+
+        Returns:
+            dict: {coordinate name: ``numpy.dtype``}; empty if :attr:`compact` is ``False``
+        """
+
+        if not self.compact:
+            return {}
+
+        codes = {}
+        for coord in self.all_coords:
+            if self.simulation[coord].dtype.kind in 'OUS':
+                n = len(self.simulation[coord])
+                codes[coord] = np.dtype(np.int8 if n < 2 ** 7 else np.int16 if n < 2 ** 15 else np.int32)
+
+        return codes
+
+    def value_dtypes(self, measured=None):
+        """Dtypes of the measured columns of the frame built by :func:`make_chunks`.
+
+        With :attr:`compact`, ``float64`` values are stored as ``float32`` and ``int64`` values as ``int32`` if every
+        value survives the round trip. Values already in memory are compared directly (one vectorized pass, no I/O).
+        Lazy (``dask``-backed) values are never read here: they are narrowed only if their on-disk dtype
+        (``encoding['dtype']``, e.g. an ``int16`` zarr array decoded to ``float64``) casts safely to the narrow
+        dtype, so building :attr:`chunk_sim` stays a graph-only operation. The result is remembered.
+
+        Args:
+            measured (list of str): measured coordinates; defaults to :attr:`measured`
+
+        Returns:
+            dict: {measured coordinate: ``numpy.dtype``}
+        """
+
+        if measured is None:
+            measured = self.measured
+        if type(measured) == str:
+            measured = [measured]
+
+        narrow = {np.dtype(np.float64): np.dtype(np.float32), np.dtype(np.int64): np.dtype(np.int32)}
+        unchecked = [
+            i for i in measured
+            if self.compact and i not in self._value_dtypes and self.simulation[i].dtype in narrow
+        ]
+        for name in unchecked:
+            value = self.simulation[name]
+            if value.chunks is None:
+                lossless = bool(((value.astype(narrow[value.dtype]) == value) | value.isnull()).all())
+            else:
+                stored = value.encoding.get('dtype')
+                lossless = stored is not None and np.can_cast(stored, narrow[value.dtype], casting='safe')
+            self._value_dtypes[name] = narrow[value.dtype] if lossless else value.dtype
+            logger.info(f'Storing {name} as {self._value_dtypes[name]} in the long-format frame.')
+
+        return {i: self._value_dtypes.get(i, self.simulation[i].dtype) for i in measured}
+
+    def make_chunks(self, measured=None):
         """Convert the ``xarray`` :attr:`simulation` to a ``dask.DataFrame``.
 
-        The resulting ``dask.DataFrame`` will have a chunk size equal to the length of values in each each simulation
-        as inferred by the combined lengths of all simulation coordinates. The dimensions will be ordered as follows:
+        The conversion is lazy and cached: a frame is built the first time it is requested for a given set of
+        ``measured`` coordinates and reused afterwards. Statistics request only the measured coordinates they
+        aggregate, so unused variables are never projected into the frame.
+
+        The chunking of the resulting ``dask.DataFrame`` is chosen by :func:`plan_chunks`, which keeps the
+        between-simulation coordinates in a single chunk and splits the remaining coordinates to fit
+        :attr:`chunk_bytes`. The dimensions will be ordered as follows:
 
         - self.within_sim
         - self.state_coord
@@ -81,49 +300,257 @@ class SimHandler:
         simulation measures are organized next to each other, for faster slicing and computation of between-simulation
         statistics.
 
+        With :attr:`compact`, string coordinates become ``pandas.Categorical`` columns (built from the integer codes of
+        :func:`coord_codes`, so no per-row strings are created) and measured values are downcast as described in
+        :func:`value_dtypes`. Group-bys and shuffles then move small integer keys; :class:`epivislab.stats.Sum` and
+        :class:`epivislab.stats.MultiQuantile` map the codes back to labels in their results and accumulate sums at
+        full precision.
+
+        Args:
+            measured (list of str): measured coordinates to include; defaults to :attr:`measured`
+
         Returns:
-            None; assigns chunked ``dask.DataFrame`` to :attr:`chunk_sim`
+            dask.DataFrame: long-format simulation data; the chunk plan, with ``n_chunks`` and ``bytes_per_chunk``
+            measured from the built frame, is assigned to :attr:`chunk_plan`
         """
 
-        # get chunk size length of values in each simulation, except the measured value
-        chunk_size = 0
-        for coord in self.all_coords:
-            chunk_size += len(self.simulation[coord])
+        if measured is None:
+            measured = self.measured
+        if type(measured) == str:
+            measured = [measured]
+
+        key = tuple(measured)
+        if key in self._chunk_sims:
+            instrument.cache_event('memo', True, name='make_chunks', measured=measured)
+            return self._chunk_sims[key]
+
+        with instrument.span('chunk', measured=measured) as record:
+            chunk_sim = self._make_chunks(measured)
+            record.update(
+                rows_out=int(np.prod([len(self.simulation[i]) for i in self.all_coords])),
+                bytes_in=int(sum([self.simulation[i].nbytes for i in measured])),
+                partitions=chunk_sim.npartitions,
+                tasks=instrument.dask_tasks(chunk_sim)
+            )
+
+        self._chunk_sims[key] = chunk_sim
 
-        assert chunk_size > 0
+        return chunk_sim
 
-        # strip off any values in the simulation xarray, apply chunk size, and convert to dask dataframe
+    def _make_chunks(self, measured):
+        """Plan chunks and build the long-format ``dask.DataFrame`` of ``measured``; see :func:`make_chunks`."""
+
+        self.chunk_plan = self.plan_chunks(measured=measured)
+
+        # strip off any values in the simulation xarray and convert each block of the plan to a partition
         # see https://xarray.pydata.org/en/stable/generated/xarray.Dataset.to_dask_dataframe.html for importance of
         # dimension order: "Hierarchical dimension order for the resulting dataframe. All arrays are transposed to
         # this order and then written out as flat vectors in contiguous order, so the last dimension in this list will
         # be contiguous in the resulting DataFrame. This has a major influence on which operations are efficient on
-        # the resulting dask dataframe."
-        simple_coords = self.all_coords + self.measured
-        chunk_sim = self.simulation[simple_coords].chunk(
-            chunks={i: chunk_size for i in self.all_coords}
-        ).to_dask_dataframe(
-            dim_order=self.all_coords
+        # the resulting dask dataframe." Blocks are flattened in the same order, but ``to_dask_dataframe`` itself is
+        # not used because it merges the chunks of every coordinate but the leading one.
+        simple_coords = self.all_coords + measured
+        codes = self.coord_codes()
+        simulation = self.simulation[simple_coords].astype(self.value_dtypes(measured)).assign_coords({
+            coord: np.arange(len(self.simulation[coord]), dtype=dtype) for coord, dtype in codes.items()
+        })
+        categories = {coord: pd.CategoricalDtype(self.simulation[coord].values) for coord in codes}
+
+        chunks = self.chunk_plan['chunks']
+        sizes = {i: len(simulation[i]) for i in self.all_coords}
+        blocks = itertools.product(*[
+            [slice(start, min(start + chunks[i], sizes[i])) for start in range(0, sizes[i], chunks[i])]
+            for i in self.all_coords
+        ])
+        parts = []
+        divisions = [0]
+        for block in blocks:
+            parts.append(dask.delayed(_block_frame)(
+                simulation.isel(dict(zip(self.all_coords, block))), self.all_coords, categories, divisions[-1]
+            ))
+            divisions.append(divisions[-1] + int(np.prod([i.stop - i.start for i in block])))
+        divisions[-1] -= 1
+
+        empty = simulation.isel({i: slice(0, 0) for i in self.all_coords}).compute()
+        chunk_sim = dd.from_delayed(
+            parts, meta=_block_frame(empty, self.all_coords, categories, 0), divisions=divisions, verify_meta=False
         )
 
-        self.chunk_sim = chunk_sim
+        # report the partitions actually built
+        rows = np.diff(chunk_sim.divisions)
+        rows[-1] += 1
+        self.chunk_plan['n_chunks'] = chunk_sim.npartitions
+        self.chunk_plan['bytes_per_chunk'] = int(rows.max()) * self.chunk_plan['row_bytes']
+
+        return chunk_sim
+
+    @property
+    def chunk_sim(self):
+        """Long-format ``dask.DataFrame`` of all :attr:`measured` coordinates, built on first use by :func:`make_chunks`.
+        """
+
+        return self.make_chunks()
+
+    @property
+    def client(self):
+        """``dask.distributed.Client`` for ``scheduler='distributed'``, connected to a ``LocalCluster`` started on
+        first use.
+
+        A ``Client`` given as :attr:`scheduler` is returned as is; a ``LocalCluster`` is connected to on first use.
+        """
+
+        if self._client is None:
+            from distributed import Client, LocalCluster
+
+            if isinstance(self.scheduler, Client):
+                self._client = self.scheduler
+            elif isinstance(self.scheduler, LocalCluster):
+                self._client = Client(self.scheduler, set_as_default=False)
+            else:
+                cluster_kwargs = dict(self.cluster_kwargs)
+                if self.num_workers is not None:
+                    cluster_kwargs.setdefault('n_workers', self.num_workers)
+                self._client = Client(LocalCluster(**cluster_kwargs), set_as_default=False)
+                logger.info(f'Started dask LocalCluster at {self._client.dashboard_link}.')
+
+        return self._client
+
+    def execution(self):
+        """Context manager running ``dask`` computations within it on :attr:`scheduler`.
+
+        Returns:
+            context manager
+        """
+
+        if self.scheduler is None:
+            return contextlib.nullcontext()
+        if self.scheduler == 'distributed' or not isinstance(self.scheduler, str):
+            return dask.config.set(scheduler=self.client)
+        if self.num_workers is not None:
+            return dask.config.set(scheduler=self.scheduler, num_workers=self.num_workers)
+
+        return dask.config.set(scheduler=self.scheduler)
+
+    def compute(self, *collections):
+        """Compute several ``dask`` collections in a single pass on :attr:`scheduler`.
+
+        Graph pieces shared between the collections are computed once.
+
+        Args:
+            *collections: ``dask`` collections (or ``xarray`` objects backed by them)
+
+        Returns:
+            tuple: computed results, in the order of ``collections``
+        """
+
+        with self.execution():
+            return dask.compute(*collections)
+
+    def persist(self, *collections):
+        """Persist several ``dask`` collections in a single pass on :attr:`scheduler`; see :func:`compute`.
+
+        Args:
+            *collections: ``dask`` collections (or ``xarray`` objects backed by them)
+
+        Returns:
+            tuple: persisted collections, in the order of ``collections``
+        """
+
+        with self.execution():
+            return dask.persist(*collections)
+
+    def close(self):
+        """Shut down the ``LocalCluster`` started for ``scheduler='distributed'``, if any.
+
+        A ``Client`` or ``LocalCluster`` given as :attr:`scheduler` is left running.
+        """
+
+        if self._client is not None and self._client is not self.scheduler:
+            cluster = self._client.cluster
+            self._client.close()
+            if cluster is not self.scheduler:
+                cluster.close()
+        self._client = None
 
 class EpiSummary(SimHandler):
     """Extends :class:`SimHandler` for to implement aggregations.
+
+    If ``cache_dir`` is given, ``xarray`` results of :func:`xr_sum_over_groups` and :func:`quantiles_between_sims`
+    (and so :func:`prediction_interval`) are stored in an on-disk :class:`epivislab.cache.ResultCache` keyed by the
+    fingerprint of :attr:`simulation` and the calculation parameters. Repeated calculations, including from other
+    sessions opening the same zarr store, are read from the cache without building a ``dask`` graph.
+
+    Within-simulation sums are also memoized in memory (:attr:`memo`), keyed by the backend, the set of groupers and
+    the measured coordinate(s) (whether given as a name or a list), so follow-up statistics on the same grouping
+    (e.g. :func:`interval_plot` then :func:`spaghetti_plot`) reuse the persisted sum instead of summing again. A sum
+    over fewer groupers is taken from the smallest memoized sum that retains them rather than from
+    :attr:`simulation`; :func:`rollup` fills the memo for a set of grouper subsets in one call.
+
+    Attributes:
+        cache (ResultCache): on-disk result cache, or ``None`` if caching is disabled
+        memo (MemoCache): in-memory cache of persisted within-simulation sums, limited to ``memo_max_bytes``
     """
 
-    def __init__(self, simulation, state_coord, within_sim_coord, between_sim_coord, measured_coord, time_coord):
-        super(SimHandler, self).__init__()
-        self.simulation = simulation
-        self.state_coord = state_coord
-        self.within_sim = within_sim_coord
-        self.time_coord = time_coord
-        self.between_sim = between_sim_coord
-        self.all_coords = None
-        self.measured = measured_coord
-        self.validate()
-        self.make_lists()
-        self.chunk_sim = None
-        self.make_chunks()
+    def __init__(self, simulation, state_coord, within_sim_coord, between_sim_coord, measured_coord, time_coord,
+                 chunk_bytes=None, cache_dir=None, cache_max_bytes=None, memo_max_bytes=2 ** 30, scheduler=None,
+                 num_workers=None, cluster_kwargs=None, compact=True):
+        super().__init__(
+            simulation=simulation,
+            state_coord=state_coord,
+            within_sim_coord=within_sim_coord,
+            between_sim_coord=between_sim_coord,
+            measured_coord=measured_coord,
+            time_coord=time_coord,
+            chunk_bytes=chunk_bytes,
+            scheduler=scheduler,
+            num_workers=num_workers,
+            cluster_kwargs=cluster_kwargs,
+            compact=compact
+        )
+        self.cache = None if cache_dir is None else ResultCache(directory=cache_dir, max_bytes=cache_max_bytes)
+        self._fingerprint = None
+        self.memo = MemoCache(max_bytes=memo_max_bytes)
+
+    @property
+    def fingerprint(self):
+        """Fingerprint of :attr:`simulation`, calculated on first use; see :func:`epivislab.cache.dataset_fingerprint`.
+        """
+
+        if self._fingerprint is None:
+            self._fingerprint = dataset_fingerprint(self.simulation)
+
+        return self._fingerprint
+
+    def cache_key(self, name, **params):
+        """Build the :attr:`cache` key for calculation ``name`` with parameters ``params`` on :attr:`simulation`.
+
+        Args:
+            name (str): name of the calculation
+            **params: parameters of the calculation
+
+        Returns:
+            str: cache key
+        """
+
+        if 'aggcol' in params:
+            params['aggcol'] = list(_aggcol_names(params['aggcol']))
+
+        return self.cache.key(self.fingerprint, name=name, **params)
+
+    def invalidate_cache(self):
+        """Remove all cached results for :attr:`simulation`.
+
+        Returns:
+            list of str: keys of removed results
+        """
+
+        if self.cache is None:
+            return []
+
+        removed = self.cache.invalidate(fingerprint=self.fingerprint)
+        self._fingerprint = None
+
+        return removed
 
     def sum_over_groups(self, groupers, aggcol):
         """Sum column ``aggcol`` within simulations, maintaining groups named in ``groupers``
@@ -145,21 +572,231 @@ class EpiSummary(SimHandler):
         try:
             assert set(self.between_sim).issubset(set(groupers))
         except AssertionError:
-            print(f'The coordinate indicating separate simulations ({self.between_sim}) must be included as a grouping variable.')
+            logger.error(f'The coordinate indicating separate simulations ({self.between_sim}) must be included as a grouping variable.')
             raise AssertionError
 
         # the measures to aggregate must all be recognized as measurement coordinates
         try:
-            assert len(set(aggcol).intersection(self.measured)) == len(aggcol)
+            assert set(_aggcol_names(aggcol)).issubset(self.measured)
+        except AssertionError:
+            logger.error(f'Not all {aggcol} measures are listed as simulation measurements ({self.measured}).')
+
+        simulation_sum, _ = self._dd_sum(groupers=groupers, aggcol=aggcol)
+
+        return simulation_sum
+
+    def _dd_sum(self, groupers, aggcol, derived=None):
+        """Persisted :func:`Sum.dd_sum` of the long-format frame, memoized in :attr:`memo`.
+
+        ``derived`` optionally builds further lazy collections from the sum (e.g. quantiles); they are persisted
+        in the same pass as the sum so that the shared graph is computed once.
+
+        The sum is memoized as a ``dask.DataFrame`` with one column per measured coordinate, so ``aggcol`` given as
+        ``'x'`` or ``['x']`` shares one entry; a single name returns the ``dask.Series`` of that column.
+
+        Returns:
+            tuple: the persisted sum and a tuple of the persisted derived collections
+        """
+
+        def _view(frame):
+            return frame[aggcol] if type(aggcol) == str else frame
+
+        names = list(_aggcol_names(aggcol))
+        memo_key = ('dataframe', frozenset(groupers), tuple(names))
+        simulation_sum = self.memo.get(memo_key)
+        instrument.cache_event('memo', simulation_sum is not None, name='sum_over_groups', groupers=groupers)
+        if simulation_sum is not None:
+            logger.info(f'Reusing sum of {aggcol} retaining groups {groupers}.')
+            simulation_sum = _view(simulation_sum)
+            return simulation_sum, self.persist(*derived(simulation_sum)) if derived is not None else ()
+
+        parent_groupers, parent = self._rollup_parent('dataframe', groupers, aggcol)
+        if parent is None:
+            chunk_sim = self.make_chunks(measured=names)
+            logger.info(f'Summing {aggcol} over variables {set(self.within_sim).difference(set(groupers))}; retaining groups {groupers}.')
+        else:
+            chunk_sim = parent.reset_index()
+            logger.info(f'Summing {aggcol} retaining groups {groupers} from the memoized sum over {parent_groupers}.')
+        with instrument.span(
+            'sum', backend='dataframe', groupers=groupers, aggcol=aggcol, parent=parent_groupers
+        ) as record:
+            sum_ = Sum()
+            simulation_sum = sum_.dd_sum(ddf=chunk_sim, groupers=groupers, aggcol=names)
+            extra = derived(_view(simulation_sum)) if derived is not None else []
+            record.update(tasks=instrument.dask_tasks(simulation_sum), derived=len(extra))
+            simulation_sum, *extra = self.persist(simulation_sum, *extra)
+            nbytes = int(np.sum(self.compute(simulation_sum.memory_usage(deep=True))[0]))
+            if parent is None:
+                record.update(
+                    rows_in=int(np.prod([len(self.simulation[i]) for i in self.all_coords])),
+                    bytes_in=int(sum([self.simulation[i].nbytes for i in names]))
+                )
+            else:
+                record['bytes_in'] = self.memo.entries[('dataframe', frozenset(parent_groupers), tuple(names))][1]
+            record['bytes_out'] = nbytes
+            if instrument.enabled():
+                record['rows_out'] = self.compute(simulation_sum.map_partitions(len))[0].sum()
+        self.memo.put(memo_key, simulation_sum, nbytes=nbytes)
+
+        return _view(simulation_sum), tuple(extra)
+
+    def _rollup_parent(self, backend, groupers, aggcol):
+        """Smallest memoized sum of ``aggcol`` that retains every coordinate in ``groupers``.
+
+        Summing is associative, so a sum over fewer groupers can be taken from any finer sum instead of
+        :attr:`simulation`; the finer sum with the fewest bytes is the cheapest to read.
+
+        Returns:
+            tuple: the parent's groupers and the parent sum, or ``(None, None)`` if no finer sum is memoized
+        """
+
+        candidates = [
+            (nbytes, key) for key, (_, nbytes) in self.memo.entries.items()
+            if key[0] == backend and key[2] == _aggcol_names(aggcol) and set(groupers) < key[1]
+        ]
+        if not candidates:
+            return None, None
+
+        _, key = min(candidates, key=lambda candidate: candidate[0])
+
+        return sorted(key[1]), self.memo.get(key)
+
+    def rollup(self, levels, aggcol, backend='dataframe'):
+        """Pre-aggregate within-simulation sums of ``aggcol`` for several grouper subsets.
+
+        The sum over the union of ``levels`` is computed once from :attr:`simulation` (with the ``dataframe``
+        backend, only if the union leaves some coordinate to sum over). Every other level is then derived, finest
+        first, from the smallest sum already memoized that retains its groupers, so each coarser level reads an
+        already reduced parent rather than the raw data. The sums are held in :attr:`memo`, so later calls to
+        :func:`sum_over_groups`, :func:`xr_sum_over_groups`, :func:`quantiles_between_sims` and the plotting methods
+        for any of these levels (or any coarser grouping) start from them.
+
+        :attr:`memo` must be large enough to hold the finest sum; otherwise each level is summed from
+        :attr:`simulation`.
+
+        Args:
+            levels (list of list of str): grouper subsets to pre-aggregate; the between-simulation coordinates are
+                added to each
+            aggcol (str): name of measured coordinate
+            backend (str): ``'dataframe'`` for :func:`sum_over_groups` or ``'xarray'`` for
+                :func:`xr_sum_over_groups`
+
+        Returns:
+            dict: {tuple of groupers: persisted sum} for every level
+        """
+
+        assert backend in ['dataframe', 'xarray']
+
+        levels = [[i for i in level if i not in self.between_sim] + self.between_sim for level in levels]
+        finest = [i for i in self.all_coords if any([i in level for level in levels])]
+
+        # with the dataframe backend, a sum retaining every coordinate would only regroup the long-format frame
+        order = sorted(levels, key=len, reverse=True)
+        if backend == 'xarray' or set(finest) != set(self.all_coords):
+            order = [finest] + order
+
+        with instrument.span('rollup', backend=backend, levels=len(levels), aggcol=aggcol):
+            rollup = {}
+            for level in order:
+                if tuple(level) in rollup:
+                    continue
+                if backend == 'dataframe':
+                    rollup[tuple(level)] = self.sum_over_groups(groupers=level, aggcol=aggcol)
+                else:
+                    rollup[tuple(level)] = self.xr_sum_over_groups(groupers=level, aggcol=aggcol)
+
+        if (backend, frozenset(order[0]), _aggcol_names(aggcol)) not in self.memo.entries:
+            logger.warning(
+                f'The sum over {order[0]} does not fit in memo_max_bytes; levels were summed from the simulation.'
+            )
+
+        return {key: value for key, value in rollup.items() if list(key) in levels}
+
+    def xr_sum_over_groups(self, groupers, aggcol):
+        """Sum ``aggcol`` within simulations directly on :attr:`simulation`, maintaining groups named in ``groupers``
+
+        This is the ``xarray`` counterpart to :func:`sum_over_groups`: the same checks are applied, but the sum is
+        a labelled reduction over the dense simulation array rather than a ``dask.DataFrame`` groupby.
+
+        Args:
+            groupers (list of str): names of coordinates to maintain in aggregated data
+            aggcol (str): name of measured coordinate
+
+        Returns:
+            xarray.Dataset: simulation data summed across within-simulation variables not included in ``groupers``.
+        """
+
+        if type(aggcol) == str:
+            aggcol = [aggcol]
+        if type(groupers) == str:
+            groupers = [groupers]
+
+        # the coordinates that separate simulations must be included as a grouping variable
+        try:
+            assert set(self.between_sim).issubset(set(groupers))
         except AssertionError:
-            print(f'Not all {aggcol} measures are listed as simulation measurements ({self.measured}).')
+            logger.error(f'The coordinate indicating separate simulations ({self.between_sim}) must be included as a grouping variable.')
+            raise AssertionError
 
-        print(f'Summing {aggcol} over variables {set(self.within_sim).difference(set(groupers))}; retaining groups {groupers}.')
-        sum_ = Sum()
-        simulation_sum = sum_.dd_sum(ddf=self.chunk_sim, groupers=groupers, aggcol=aggcol)
+        # the measures to aggregate must all be recognized as measurement coordinates
+        assert len(set(aggcol).intersection(self.measured)) == len(aggcol)
+
+        if self.cache is not None:
+            key = self.cache_key('xr_sum_over_groups', groupers=groupers, aggcol=aggcol)
+            simulation_sum = self.cache.get(key)
+            instrument.cache_event('disk', simulation_sum is not None, name='xr_sum_over_groups', groupers=groupers)
+            if simulation_sum is not None:
+                logger.info(f'Loaded sum of {aggcol} retaining groups {groupers} from cache.')
+                return simulation_sum
+
+        simulation_sum, _ = self._xr_sum(groupers=groupers, aggcol=aggcol)
+
+        if self.cache is not None:
+            self.cache.put(key, simulation_sum)
 
         return simulation_sum
 
+    def _xr_sum(self, groupers, aggcol, derived=None):
+        """Persisted :func:`Sum.xr_sum` of :attr:`simulation`, memoized in :attr:`memo`.
+
+        ``derived`` optionally builds further lazy collections from the sum; see :func:`_dd_sum`.
+
+        Returns:
+            tuple: the persisted sum and a tuple of the persisted derived collections
+        """
+
+        memo_key = ('xarray', frozenset(groupers), _aggcol_names(aggcol))
+        simulation_sum = self.memo.get(memo_key)
+        instrument.cache_event('memo', simulation_sum is not None, name='xr_sum_over_groups', groupers=groupers)
+        if simulation_sum is not None:
+            logger.info(f'Reusing sum of {aggcol} retaining groups {groupers}.')
+            simulation_sum = simulation_sum.transpose(*groupers)
+            return simulation_sum, self.persist(*derived(simulation_sum)) if derived is not None else ()
+
+        parent_groupers, parent = self._rollup_parent('xarray', groupers, aggcol)
+        if parent is None:
+            parent = self.simulation
+            logger.info(f'Summing {aggcol} over variables {set(self.within_sim).difference(set(groupers))}; retaining groups {groupers}.')
+        else:
+            logger.info(f'Summing {aggcol} retaining groups {groupers} from the memoized sum over {parent_groupers}.')
+        with instrument.span(
+            'sum', backend='xarray', groupers=groupers, aggcol=aggcol, parent=parent_groupers
+        ) as record:
+            sum_ = Sum()
+            simulation_sum = sum_.xr_sum(ds=parent, groupers=groupers, aggcol=aggcol)
+            extra = derived(simulation_sum) if derived is not None else []
+            record.update(tasks=instrument.dask_tasks(simulation_sum), derived=len(extra))
+            simulation_sum, *extra = self.persist(simulation_sum, *extra)
+            record.update(
+                rows_in=int(sum([parent[i].size for i in aggcol])),
+                bytes_in=int(sum([parent[i].nbytes for i in aggcol])),
+                rows_out=int(sum([simulation_sum[i].size for i in simulation_sum.data_vars])),
+                bytes_out=int(simulation_sum.nbytes)
+            )
+        self.memo.put(memo_key, simulation_sum, nbytes=simulation_sum.nbytes)
+
+        return simulation_sum, tuple(extra)
+
     def quantile_between_sims(self, groupers, aggcol, quantile):
         """Calculate quantiles of column ``aggcol`` between simulations, maintaining groups named in ``groupers``
 
@@ -197,27 +834,146 @@ class EpiSummary(SimHandler):
             simulation_sum = self.sum_over_groups(groupers=list(sum_cols), aggcol=aggcol)
 
         else:
-            simulation_sum = self.chunk_sim
+            simulation_sum = self.make_chunks(measured=aggcol)
 
-        print(f'Calculating quantile {quantile} for {aggcol} after summation over variables {[None if len(update_groupers) == 0 else update_groupers]}.')
-        quantile = Quantile(quantile=quantile)
-        simulation_quantile = quantile.dd_quantile(ddf=simulation_sum, groupers=groupers, aggcol=aggcol)
+        logger.info(f'Calculating quantile {quantile} for {aggcol} after summation over variables {[None if len(update_groupers) == 0 else update_groupers]}.')
+        with instrument.span('quantile', backend='dataframe', quantiles=[quantile], groupers=groupers) as record:
+            quantile = Quantile(quantile=quantile)
+            simulation_quantile = quantile.dd_quantile(ddf=simulation_sum, groupers=groupers, aggcol=aggcol)
+            record['tasks'] = instrument.dask_tasks(simulation_quantile)
 
         return simulation_quantile
 
-    def prediction_interval(self, groupers, aggcol, upper, lower):
-        """Wrapper to :func:`quantile_between_sum` to calculate upper, lower, 50% quantiles.
+    def quantiles_between_sims(self, groupers, aggcol, quantiles, backend='dataframe', method='exact', k=200):
+        """Calculate several quantiles of column ``aggcol`` between simulations in a single pass.
+
+        Unlike repeated calls to :func:`quantile_between_sims`, the within-simulation sum is calculated once and
+        each group's replicate values are sorted once to produce every quantile (see :class:`MultiQuantile`).
+
+        With ``backend='xarray'`` the sum and quantiles are reductions over the dense :attr:`simulation` array
+        (see :func:`xr_sum_over_groups`) and no ``dask.DataFrame`` is built.
+
+        Quantiles are exact by default. For very large ensembles, ``method='sketch'`` (``xarray`` backend only)
+        estimates them with a mergeable :class:`epivislab.stats.QuantileSketch`, one chunk of replicates at a time,
+        instead of gathering each group's replicates together (see :func:`MultiQuantile.xr_sketch_quantiles`).
+        Sketch quantiles are exact up to ``k`` replicates; beyond that the rank error is bounded by about
+        ``n * log2(n / k) / k`` for ``n`` replicates.
 
         Args:
             groupers (list of str): names of coordinates to maintain in aggregated data
             aggcol (str): name of measured coordinate
-            upper (float): quantile value in the (0, 1) interval; passed to :func:`quantile_between_sims`
-            lower (float): quantile value in the (0, 1) interval; passed to :func:`quantile_between_sims`
+            quantiles (list of float): quantile values in the (0, 1) interval
+            backend (str): ``'dataframe'`` or ``'xarray'``
+            method (str): ``'exact'`` or ``'sketch'``
+            k (int): compactor capacity of the sketch for ``method='sketch'``
 
         Returns:
-            xarray: quantile data for the grouped simulation
+            xarray.Dataset: quantiles of ``aggcol`` with dimensions ``groupers`` and ``quantile``
         """
 
+        if type(aggcol) == str:
+            aggcol = [aggcol]
+        if type(groupers) == str:
+            groupers = [groupers]
+
+        # the coordinate that separates simulations most not be a grouping variable
+        assert not set(self.between_sim).issubset(set(groupers))
+
+        # the measures to aggregate must all be recognized as measurement coordinates
+        assert len(set(aggcol).intersection(self.measured)) == len(aggcol)
+
+        assert backend in ['dataframe', 'xarray']
+        assert method in ['exact', 'sketch']
+        assert method == 'exact' or backend == 'xarray'
+
+        if self.cache is not None:
+            params = {'method': method, 'k': k} if method == 'sketch' else {}
+            key = self.cache_key(
+                'quantiles_between_sims', groupers=groupers, aggcol=aggcol, quantiles=list(quantiles), backend=backend,
+                **params
+            )
+            simulation_quantiles = self.cache.get(key)
+            instrument.cache_event(
+                'disk', simulation_quantiles is not None, name='quantiles_between_sims', groupers=groupers
+            )
+            if simulation_quantiles is not None:
+                logger.info(f'Loaded quantiles {quantiles} for {aggcol} retaining groups {groupers} from cache.')
+                return simulation_quantiles
+
+        # sum over any coordinates that are not requested grouping variables
+        update_groupers = set(self.within_sim).difference(groupers)
+        sum_cols = groupers + self.between_sim  # add between simulation indicator(s)
+        quantile = MultiQuantile(quantiles=quantiles)
+
+        logger.info(f'Calculating quantiles {quantiles} for {aggcol} after summation over variables {[None if len(update_groupers) == 0 else update_groupers]}.')
+        if backend == 'xarray':
+            if method == 'sketch':
+                simulation_sum, _ = self._xr_sum(groupers=list(sum_cols), aggcol=aggcol)
+            else:
+                # the sum and its quantiles are computed in one pass
+                simulation_sum, (simulation_quantiles,) = self._xr_sum(
+                    groupers=list(sum_cols), aggcol=aggcol,
+                    derived=lambda ds: [quantile.xr_quantiles(ds=ds, between=self.between_sim, aggcol=aggcol)]
+                )
+            with instrument.span(
+                'quantile', backend=backend, method=method, quantiles=list(quantiles), groupers=groupers
+            ) as record:
+                if method == 'sketch':
+                    with self.execution():
+                        simulation_quantiles = quantile.xr_sketch_quantiles(
+                            ds=simulation_sum, between=self.between_sim, aggcol=aggcol, k=k
+                        )
+                else:
+                    record['tasks'] = instrument.dask_tasks(simulation_quantiles)
+                    simulation_quantiles, = self.compute(simulation_quantiles)
+                record.update(
+                    rows_in=int(sum([simulation_sum[i].size for i in aggcol])),
+                    rows_out=int(sum([simulation_quantiles[i].size for i in aggcol])),
+                    bytes_out=int(simulation_quantiles.nbytes)
+                )
+
+        else:
+            def _quantiles(ddf):
+                return [quantile.dd_grouped_quantiles(ddf=ddf, groupers=groupers, aggcol=aggcol[0])]
+
+            if len(update_groupers) > 0:
+                # the sum and its quantiles are computed in one pass
+                _, (quantile_frame,) = self._dd_sum(groupers=list(sum_cols), aggcol=aggcol, derived=_quantiles)
+
+            else:
+                quantile_frame, = _quantiles(self.make_chunks(measured=aggcol))
+
+            with instrument.span(
+                'quantile', backend=backend, method=method, quantiles=list(quantiles), groupers=groupers
+            ) as record:
+                record['tasks'] = instrument.dask_tasks(quantile_frame)
+                quantile_frame, = self.compute(quantile_frame)
+                simulation_quantiles = quantile.frame_to_xarray(quantile_frame, groupers=groupers, aggcol=aggcol[0])
+                record.update(
+                    rows_out=int(sum([simulation_quantiles[i].size for i in aggcol])),
+                    bytes_out=int(simulation_quantiles.nbytes)
+                )
+
+        if self.cache is not None:
+            self.cache.put(key, simulation_quantiles)
+
+        return simulation_quantiles
+
+    def prediction_interval(self, groupers, aggcol, upper, lower, backend='dataframe', method='exact', k=200):
+        """Wrapper to :func:`quantiles_between_sims` to calculate upper, lower, 50% quantiles.
+
+        Args:
+            groupers (list of str): names of coordinates to maintain in aggregated data
+            aggcol (str): name of measured coordinate
+            upper (float): quantile value in the (0, 1) interval; passed to :func:`quantiles_between_sims`
+            lower (float): quantile value in the (0, 1) interval; passed to :func:`quantiles_between_sims`
+            backend (str): ``'dataframe'`` or ``'xarray'``; passed to :func:`quantiles_between_sims`
+            method (str): ``'exact'`` or ``'sketch'``; passed to :func:`quantiles_between_sims`
+            k (int): compactor capacity of the sketch; passed to :func:`quantiles_between_sims`
+
+        Returns:
+            xarray: quantile data for the grouped simulation
+        """
 
         assert upper < 1.0
         assert upper > 0.0
@@ -225,58 +981,239 @@ class EpiSummary(SimHandler):
         assert lower > 0.0
         assert upper > lower
 
-        median = self.quantile_between_sims(groupers=groupers, aggcol=aggcol, quantile=0.5).compute().reset_index()
-        upper_ = self.quantile_between_sims(groupers=groupers, aggcol=aggcol, quantile=upper).compute().reset_index()
-        lower_ = self.quantile_between_sims(groupers=groupers, aggcol=aggcol, quantile=lower).compute().reset_index()
-
-        median = median.rename(columns={'value': 'median'})
-        upper_ = upper_.rename(columns={'value': 'upper'})
-        lower_ = lower_.rename(columns={'value': 'lower'})
-
-        sims_summary = pd.merge(
-            pd.merge(
-                upper_,
-                lower_,
-                on=groupers,
-                how='outer'
-            ),
-            median,
-            on=groupers,
-            how='outer'
+        if type(aggcol) == list:
+            aggcol = aggcol[0]
+
+        quantiles = self.quantiles_between_sims(
+            groupers=groupers, aggcol=aggcol, quantiles=sorted(set([lower, 0.5, upper])), backend=backend,
+            method=method, k=k
         )
-        sims_summary = sims_summary.set_index(groupers)
-        sims_ds = sims_summary.to_xarray()
+
+        with instrument.span('merge', name='prediction_interval') as record:
+            sims_ds = xr.Dataset({
+                'upper': quantiles[aggcol].sel(quantile=upper, drop=True),
+                'lower': quantiles[aggcol].sel(quantile=lower, drop=True),
+                'median': quantiles[aggcol].sel(quantile=0.5, drop=True),
+            })
+            record['bytes_out'] = int(sims_ds.nbytes)
+
         return sims_ds
 
-    def interval_plot(self, groupers, aggcol, upper, lower):
+    def ensemble_stats(self, groupers, aggcol, statistics, threshold=None, quantiles=(0.05, 0.5, 0.95), ddof=1):
+        """Calculate several ensemble statistics of ``aggcol`` between simulations in a single pass.
+
+        The within-simulation sum over coordinates not in ``groupers`` and every requested statistic (see
+        :class:`epivislab.stats.EnsembleStats`) are computed together, reading each replicate once. Peak statistics
+        are taken along the time coordinate, which must then be in ``groupers``.
+
+        Args:
+            groupers (list of str): names of coordinates to maintain in aggregated data
+            aggcol (str): name of measured coordinate
+            statistics (list of str): any of ``'mean'``, ``'variance'``, ``'min'``, ``'max'``, ``'exceedance'``,
+                ``'peak_time'`` and ``'peak_size'``
+            threshold (float, xarray.DataArray): threshold for ``'exceedance'``, e.g. capacity per vertex
+            quantiles (list of float): quantiles of the peak time and peak size distributions
+            ddof (int): delta degrees of freedom for ``'variance'``
+
+        Returns:
+            xarray.Dataset: one data variable per statistic
+        """
+
+        if type(aggcol) == str:
+            aggcol = [aggcol]
+        if type(groupers) == str:
+            groupers = [groupers]
+
+        # the coordinate that separates simulations most not be a grouping variable
+        assert not set(self.between_sim).issubset(set(groupers))
+
+        # the measures to aggregate must all be recognized as measurement coordinates
+        assert len(set(aggcol).intersection(self.measured)) == len(aggcol)
+
+        stats = EnsembleStats(statistics=statistics, threshold=threshold, quantiles=quantiles, ddof=ddof)
+        assert not stats.peak_statistics or self.time_coord[0] in groupers
+
+        cache_threshold = threshold if threshold is None or np.isscalar(threshold) else dask.base.tokenize(threshold)
+        if self.cache is not None:
+            key = self.cache_key(
+                'ensemble_stats', groupers=groupers, aggcol=aggcol, statistics=stats.statistics,
+                threshold=cache_threshold, quantiles=stats.quantiles, ddof=ddof
+            )
+            simulation_stats = self.cache.get(key)
+            instrument.cache_event('disk', simulation_stats is not None, name='ensemble_stats', groupers=groupers)
+            if simulation_stats is not None:
+                logger.info(f'Loaded statistics {stats.statistics} for {aggcol} retaining groups {groupers} from cache.')
+                return simulation_stats
+
+        logger.info(f'Calculating statistics {stats.statistics} for {aggcol} retaining groups {groupers}.')
+        sum_cols = groupers + self.between_sim  # add between simulation indicator(s)
+        _, (simulation_stats,) = self._xr_sum(
+            groupers=list(sum_cols), aggcol=aggcol,
+            derived=lambda ds: [
+                stats.xr_stats(ds=ds, between=self.between_sim, aggcol=aggcol, time_coord=self.time_coord[0])
+            ]
+        )
+        with instrument.span('statistics', statistics=stats.statistics, groupers=groupers) as record:
+            simulation_stats, = self.compute(simulation_stats)
+            record['bytes_out'] = int(simulation_stats.nbytes)
+
+        if self.cache is not None:
+            self.cache.put(key, simulation_stats)
+
+        return simulation_stats
+
+    def summarize_to_zarr(self, output, groupers, aggcol, quantiles=(0.05, 0.5, 0.95), statistics=None,
+                          threshold=None, chunk_bytes=None):
+        """Write within-simulation sums and between-simulation summaries of ``aggcol`` to a zarr store, out of core.
+
+        Nothing is computed into memory as a whole: blocks of :attr:`simulation` are read, summed, regrouped so
+        that each block holds complete replicate vectors for a slice of ``groupers``, reduced to quantiles (and
+        optional :class:`epivislab.stats.EnsembleStats` statistics) and written to ``output`` block by block on
+        :attr:`scheduler`. Every block, including the output chunks, is sized to about ``chunk_bytes``, so memory use
+        is bounded by ``chunk_bytes`` per worker regardless of the size of the ensemble.
+
+        Args:
+            output (str): path of the zarr store to write; an existing store is overwritten
+            groupers (list of str): names of coordinates to maintain in aggregated data
+            aggcol (str): name of measured coordinate
+            quantiles (list of float): quantile values in the (0, 1) interval
+            statistics (list of str): optional statistics to calculate with :class:`epivislab.stats.EnsembleStats`
+            threshold (float, xarray.DataArray): threshold for the ``'exceedance'`` statistic
+            chunk_bytes (int): target size of each block in bytes; defaults to :attr:`chunk_bytes` or the ``dask``
+                ``array.chunk-size`` setting
+
+        Returns:
+            xarray.Dataset: the written store, opened lazily, with ``sum`` (dimensions ``groupers`` and the
+            between-simulation coordinates), ``quantile_value`` (dimensions ``groupers`` and ``quantile``) and one
+            data variable per statistic
+        """
+
+        if type(aggcol) == list:
+            aggcol = aggcol[0]
+        if type(groupers) == str:
+            groupers = [groupers]
+
+        # the coordinate that separates simulations most not be a grouping variable
+        assert not set(self.between_sim).issubset(set(groupers))
+
+        # the measures to aggregate must all be recognized as measurement coordinates
+        assert aggcol in self.measured
+
+        if chunk_bytes is None:
+            chunk_bytes = self.chunk_bytes
+        if chunk_bytes is None:
+            chunk_bytes = dask.utils.parse_bytes(dask.config.get('array.chunk-size'))
+
+        logger.info(f'Summarizing {aggcol} retaining groups {groupers} to {output} in blocks of {chunk_bytes} bytes.')
+        with dask.config.set({'array.chunk-size': chunk_bytes}):
+            sum_ = Sum()
+            simulation_sum = sum_.xr_sum(ds=self.simulation, groupers=groupers + self.between_sim, aggcol=aggcol)
+
+            # each block holds complete replicate vectors for as many cells as fit in chunk_bytes
+            gathered = simulation_sum.chunk({
+                **{i: 'auto' for i in groupers}, **{i: -1 for i in self.between_sim}
+            })
+            quantile = MultiQuantile(quantiles=quantiles)
+            summary = xr.Dataset({
+                'sum': simulation_sum[aggcol],
+                'quantile_value': quantile.xr_quantiles(ds=gathered, between=self.between_sim, aggcol=aggcol)[aggcol],
+            })
+            if statistics:
+                stats = EnsembleStats(statistics=statistics, threshold=threshold, quantiles=quantiles)
+                assert not stats.peak_statistics or self.time_coord[0] in groupers
+                if stats.peak_statistics:
+                    gathered = gathered.chunk({self.time_coord[0]: -1})
+                summary = summary.merge(
+                    stats.xr_stats(ds=gathered, between=self.between_sim, aggcol=aggcol, time_coord=self.time_coord[0])
+                )
+
+            # zarr needs regular chunks; size the output chunks to the same budget
+            for name in summary.variables:
+                summary[name].encoding = {}
+            summary = summary.chunk({i: 'auto' for i in summary.dims})
+
+        with instrument.span('write', output=output, groupers=groupers, aggcol=aggcol) as record:
+            record['tasks'] = instrument.dask_tasks(summary)
+            writer = summary.to_zarr(output, mode='w', compute=False)
+            self.compute(writer)
+            record['bytes_out'] = int(summary.nbytes)
+
+        return xr.open_zarr(output)
+
+    def accumulator(self, groupers, aggcol, quantiles=(0.05, 0.5, 0.95), k=200):
+        """Create an :class:`epivislab.streaming.EnsembleAccumulator` seeded with the replicates in :attr:`simulation`.
+
+        Further replicates can be added with :func:`EnsembleAccumulator.ingest` as they are written, without
+        recomputing statistics over the replicates already summarized.
+
+        Args:
+            groupers (list of str): names of coordinates to maintain in aggregated data
+            aggcol (str): name of measured coordinate
+            quantiles (list of float): quantile values in the (0, 1) interval
+            k (int): compactor capacity of the quantile sketch; quantiles are exact up to ``k`` replicates
+
+        Returns:
+            EnsembleAccumulator: accumulator holding statistics for the current replicates
+        """
+
+        if type(aggcol) == list:
+            aggcol = aggcol[0]
+
+        # the measures to aggregate must all be recognized as measurement coordinates
+        assert aggcol in self.measured
+
+        accumulator = EnsembleAccumulator(
+            groupers=groupers, aggcol=aggcol, between_sim_coord=self.between_sim, quantiles=quantiles, k=k
+        )
+        with self.execution():
+            accumulator.ingest(self.simulation)
+
+        return accumulator
+
+    def interval_plot(self, groupers, aggcol, upper, lower, backend='xarray', plot_width=None):
         """Wrapper to prediction_interval to calculate interval and generate plot
         Args:
             groupers (list of str): names of coordinates to maintain in aggregated data
             aggcol (str): name of measured coordinate
             upper (float): quantile value in the (0, 1) interval`
             lower (float): quantile value in the (0, 1) interval`
+            backend (str): ``'dataframe'`` or ``'xarray'``; passed to :func:`prediction_interval`. The default,
+                ``'xarray'``, shares its memoized sum with a grouped :func:`spaghetti_plot`
+            plot_width (int): optional plot width in pixels used for downsampling; passed to
+                :func:`epivislab.timeseries.interval_timeseries`
 
         Returns:
             None; outputs plotly graph using plotly ``display`` method.
         """
 
-        summary_xr = self.prediction_interval(groupers=groupers, aggcol=aggcol, upper=upper, lower=lower)
+        from epivislab.timeseries import interval_timeseries
 
-        return interval_timeseries(summary_xr=summary_xr)
+        summary_xr = self.prediction_interval(groupers=groupers, aggcol=aggcol, upper=upper, lower=lower, backend=backend)
 
-    def spaghetti_plot(self, **kwargs):
+        with self.execution():
+            return interval_timeseries(summary_xr=summary_xr, plot_width=plot_width)
+
+    def spaghetti_plot(self, render='traces', density_threshold=None, bins=50, plot_width=None, **kwargs):
         """Generate spaghetti plots directly from :attr:`simulation`
 
         Optionally, data can be grouped by passing ``groupers`` and ``aggcol`` arguments, which are passed on
         to :func:`timeseries.spaghetti_timeseries`.
 
         Args:
+            render (str): ``'traces'`` or ``'packed'``; passed to :func:`epivislab.timeseries.spaghetti_timeseries`
+            density_threshold (int): optional number of replicates above which a density heatmap is drawn; passed
+                to :func:`epivislab.timeseries.spaghetti_timeseries`
+            bins (int): number of y-axis bins for the density heatmap
+            plot_width (int): optional plot width in pixels used for downsampling; passed to
+                :func:`epivislab.timeseries.spaghetti_timeseries`
             **kwargs (optional): optional keyword to :func:`epivislab.timeseries.spaghetti_timeseries`
 
         Returns:
             None; outputs plotly graph using plotly ``display`` method.
         """
 
+        from epivislab.timeseries import spaghetti_timeseries
+
         try:
             assert len(self.between_sim) == 1
 
@@ -299,16 +1236,127 @@ class EpiSummary(SimHandler):
             assert 'groupers' in kwargs.keys()
             assert 'aggcol' in kwargs.keys()
 
-            # slow, foolish and annoying: dask.DataFrame to pandas.Series w/multiindex to pandas.DataFrame to
-            # pandas.DataFrame with different column names to pandas.Series w/multiindex to xarray
-            # reasons: (1) no dask to xarray method yet, and (2) aggcol name is lost in dask to pandas conversion
-            sum_simulation = self.sum_over_groups(groupers=kwargs['groupers'], aggcol=kwargs['aggcol']).compute().reset_index()
-            sum_simulation = sum_simulation.rename(columns={'': kwargs['aggcol']})
-            sum_simulation = sum_simulation.set_index(kwargs['groupers'])
-            sum_simulation = sum_simulation.to_xarray()
-            return spaghetti_timeseries(sum_simulation, self.time_coord[0], kwargs['aggcol'], self.between_sim[0])
+            # labelled reduction straight to xarray; dimensions are kept, so no MultiIndex is built or unstacked
+            sum_simulation = self.xr_sum_over_groups(groupers=kwargs['groupers'], aggcol=kwargs['aggcol'])
+            with self.execution():
+                return spaghetti_timeseries(
+                    sum_simulation, self.time_coord[0], kwargs['aggcol'], self.between_sim[0],
+                    render=render, density_threshold=density_threshold, bins=bins, plot_width=plot_width
+                )
 
         else:
-            return spaghetti_timeseries(self.simulation, self.time_coord[0], self.measured[0], self.between_sim[0])
+            with self.execution():
+                return spaghetti_timeseries(
+                    self.simulation, self.time_coord[0], self.measured[0], self.between_sim[0],
+                    render=render, density_threshold=density_threshold, bins=bins, plot_width=plot_width
+                )
+
+    def figure_report(self, output_dir, groupers, aggcol, kind='interval', upper=0.95, lower=0.05, backend='xarray',
+                      render='packed', density_threshold=None, bins=50, plot_width=None, formats=('html',),
+                      processes=None):
+        """Write one static figure per combination of ``groupers`` values to ``output_dir``, with a manifest.
+
+        The summary cube (the prediction interval for ``kind='interval'``, or the within-simulation sum for
+        ``kind='spaghetti'``) is computed once and pre-indexed with :func:`epivislab.timeseries.build_cube`; each
+        figure then receives only its own slice of the cube. Figures are built as plain ``plotly`` figures (no
+        widgets) and exported by :func:`epivislab.timeseries.write_figure`, in ``processes`` worker processes if
+        given.
+
+        ``manifest.json`` in ``output_dir`` lists the ``selection`` (``{coordinate name: value}``) and ``files`` of
+        every figure.
 
+        Args:
+            output_dir (str): directory to write figures to; created if missing
+            groupers (list of str): names of coordinates to maintain in aggregated data, including the time
+                coordinate; one figure is drawn for each combination of the other coordinates' values
+            aggcol (str): name of measured coordinate
+            kind (str): ``'interval'`` or ``'spaghetti'``
+            upper (float): upper quantile of the prediction interval
+            lower (float): lower quantile of the prediction interval
+            backend (str): ``'dataframe'`` or ``'xarray'``; passed to :func:`prediction_interval`
+            render (str): ``'traces'`` or ``'packed'``; passed to :func:`epivislab.timeseries.spaghetti_figure`
+            density_threshold (int): optional number of replicates above which a density heatmap is drawn
+            bins (int): number of y-axis bins for the density heatmap
+            plot_width (int): optional plot width in pixels used for downsampling
+            formats (list of str): any of ``'html'`` and ``'png'`` (which requires ``kaleido``)
+            processes (int): optional number of worker processes used to build and export figures
 
+        Returns:
+            dict: the manifest
+        """
+
+        from epivislab.timeseries import build_cube, cube_selection, _report_figure
+
+        assert kind in ['interval', 'spaghetti']
+        if type(aggcol) == list:
+            aggcol = aggcol[0]
+        if type(groupers) == str:
+            groupers = [groupers]
+        groupers = [i for i in groupers if i not in self.between_sim]
+
+        # figures are time series; every other grouper selects a figure
+        assert self.time_coord[0] in groupers
+        panels = [i for i in groupers if i != self.time_coord[0]]
+
+        if kind == 'interval':
+            summary_xr = self.prediction_interval(
+                groupers=groupers, aggcol=aggcol, upper=upper, lower=lower, backend=backend
+            )
+            variables = ['upper', 'lower', 'median']
+            cube = build_cube(summary_xr, variables, panels, self.time_coord[0])
+            options = {'plot_width': plot_width}
+        else:
+            assert len(self.between_sim) == 1
+            summary_xr = self.xr_sum_over_groups(groupers=groupers + self.between_sim, aggcol=aggcol)
+            variables = [aggcol]
+            with self.execution():
+                cube = build_cube(summary_xr, variables, panels, self.time_coord[0], index_coord=self.between_sim[0])
+            options = {
+                'render': render, 'density_threshold': density_threshold, 'bins': bins, 'plot_width': plot_width
+            }
+
+        os.makedirs(output_dir, exist_ok=True)
+        if 'html' in formats:
+            # written once here so that workers never race to copy the bundle
+            from plotly.offline import get_plotlyjs
+            bundle = os.path.join(output_dir, 'plotly.min.js')
+            if not os.path.exists(bundle):
+                with open(bundle, 'w', encoding='utf-8') as f:
+                    f.write(get_plotlyjs())
+
+        selections = [
+            dict(zip(panels, values)) for values in itertools.product(*[list(cube['positions'][i]) for i in panels])
+        ]
+        figure_args = []
+        for selection in selections:
+            position = cube_selection(cube, selection)
+            name = '_'.join([kind] + [f'{key}-{value}' for key, value in selection.items()])
+            name = re.sub(r'[^A-Za-z0-9_.+-]', '-', name)
+            title = ', '.join([f'{key}: {value}' for key, value in selection.items()])
+            figure_args.append((
+                kind, cube['x'], [cube[i][position] for i in variables], os.path.join(output_dir, name), title,
+                list(formats), options
+            ))
+
+        with instrument.span('render', kind=kind, figures=len(figure_args), processes=processes):
+            if processes is None:
+                files = [_report_figure(args) for args in figure_args]
+            else:
+                with mp.Pool(processes) as pool:
+                    files = pool.map(_report_figure, figure_args)
+
+        manifest = {
+            'kind': kind,
+            'aggcol': aggcol,
+            'groupers': groupers,
+            'formats': list(formats),
+            'figures': [
+                {'selection': selection, 'files': [os.path.basename(i) for i in paths]}
+                for selection, paths in zip(selections, files)
+            ],
+        }
+        with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2, default=str)
+        logger.info(f'Wrote {len(figure_args)} {kind} figures to {output_dir}.')
+
+        return manifest
@@ -1,9 +1,45 @@
 """Classes for calculating summary statistics for epidemic simulations
 """
 
+import logging
 import xarray as xr
 import numpy as np
+import pandas as pd
 import dask.dataframe as dd
+from epivislab import instrument
+
+logger = logging.getLogger(__name__)
+
+
+def decode_categories(frame):
+    """Replace categorical columns and index levels of a ``pandas`` object with their labels.
+
+    Categorical coordinates of the long-format frame (see :func:`epivislab.simhandler.SimHandler.make_chunks`) are
+    mapped back to the dtype of their categories, so results carry the same labels as the simulation coordinates.
+    Index levels are relabelled without touching the per-row codes.
+
+    Args:
+        frame (pandas.DataFrame, pandas.Series): data with possibly categorical columns or index
+
+    Returns:
+        pandas.DataFrame, pandas.Series: data with categorical columns and index levels decoded
+    """
+
+    index = frame.index
+    if isinstance(index, pd.MultiIndex) and any([isinstance(i, pd.CategoricalIndex) for i in index.levels]):
+        levels = [i.astype(i.categories.dtype) if isinstance(i, pd.CategoricalIndex) else i for i in index.levels]
+        frame = frame.copy(deep=False)
+        frame.index = index.set_levels(levels)
+    elif isinstance(index, pd.CategoricalIndex):
+        frame = frame.copy(deep=False)
+        frame.index = index.astype(index.categories.dtype)
+
+    if isinstance(frame, pd.DataFrame):
+        categorical = [i for i in frame.columns if isinstance(frame[i].dtype, pd.CategoricalDtype)]
+        if categorical:
+            frame = frame.astype({i: frame[i].cat.categories.dtype for i in categorical})
+
+    return frame
 
 
 class AggStats:
@@ -36,7 +72,7 @@ class AggStats:
         keep = groupers + aggcol
         drop = ddf.columns.difference(keep)
 
-        print(f'Dropping columns {drop} and aggregating by {groupers}.')
+        logger.info(f'Dropping columns {drop} and aggregating by {groupers}.')
         ddf_agg = ddf.drop(drop, axis=1).groupby(groupers).agg(aggfxn).compute()
 
         ddf_agg['groups'] = [i[0][0] for i in ddf_agg.values]
@@ -81,14 +117,51 @@ class Sum(AggStats):
 
         """
 
-        ddf_sum = ddf.groupby(groupers)[aggcol].agg('sum')
+        # compact (float32, int32) values are summed at full precision
+        columns = [aggcol] if type(aggcol) == str else aggcol
+        accumulate = {i: np.promote_types(ddf[i].dtype, np.int64) for i in columns}
+        accumulate = {i: dtype for i, dtype in accumulate.items() if dtype != ddf[i].dtype}
+        if accumulate:
+            ddf = ddf.astype(accumulate)
+
+        # observed=True keeps each partition's partial sums to the groups it holds when groupers are categorical
+        ddf_sum = ddf.groupby(groupers, observed=True)[aggcol].agg('sum')
+        if any([isinstance(ddf[i].dtype, pd.CategoricalDtype) for i in groupers]):
+            ddf_sum = ddf_sum.map_partitions(decode_categories)
 
         return ddf_sum
 
+    def xr_sum(self, ds, groupers, aggcol):
+        """Sum ``aggcol`` of an ``xarray.Dataset`` over every dimension not named in ``groupers``.
+
+        The reduction is applied directly to the dense simulation array, so no long-format table is built.
+
+        Args:
+            ds (xarray.Dataset): simulation data
+            groupers (list of str): names of dimensions to maintain in aggregated data
+            aggcol (str): name of data variable in ``ds`` containing measurements to aggregate
+
+        Returns:
+            xarray.Dataset: data summed across dimensions not in ``groupers``, with dimensions ordered as ``groupers``
+        """
+
+        if type(aggcol) == list:
+            aggcol = aggcol[0]
+        if type(groupers) == str:
+            groupers = [groupers]
+
+        sum_dims = [i for i in ds[aggcol].dims if i not in groupers]
+        xr_sum = ds[aggcol].sum(dim=sum_dims).transpose(*groupers)
+
+        return xr_sum.to_dataset(name=aggcol)
+
 
 class Quantile(AggStats):
     """Extends :class:`AggStats` for quantile aggregations.
 
+    Quantiles are exact: rows are shuffled so that each group's complete replicate vector is in one partition, and
+    the quantile is then read off the sorted values of every group (see :func:`MultiQuantile.grouped_quantiles`).
+
     Attributes:
         quantile (float): quantile value in the (0, 1) interval
     """
@@ -97,26 +170,620 @@ class Quantile(AggStats):
         super(AggStats, self).__init__()
         self.quantile = quantile
 
-    def chunk(self, grouped):
-        value = grouped.quantile(q=self.quantile)
-        return value
-
     def dd_quantile(self, ddf, groupers, aggcol):
-        """Passes arguments to ``AggStats.dd_agg`` for quantile calculation.
+        """Calculate the :attr:`quantile` of ``aggcol`` for each group of a ``dask.DataFrame``.
 
         Args:
-            ddf (dask.DataFrame): simulation data
+            ddf (dask.DataFrame): simulation data, with ``groupers`` as columns or as the (multi-)index, such as the
+                output of :func:`Sum.dd_sum`
+            groupers (list of str): names of coordinates to maintain in aggregated data
             aggcol (str): name of column in ddf containing measurements to aggregate
-            aggfxn (str): name of aggregation function to use
 
         Returns:
-            dask.DataFrame: data aggregated across groupers
+            dask.DataFrame: ``value`` column with the quantile of each group, followed by the ``groupers`` columns
+
+        """
+
+        if type(aggcol) == str:
+            aggcol = [aggcol]
+        if type(groupers) == str:
+            groupers = [groupers]
+
+        # only valid for aggregation of a single column
+        assert len(aggcol) == 1
+
+        quantile = MultiQuantile(quantiles=[self.quantile])
+        ddf_quantile = quantile.dd_grouped_quantiles(ddf=ddf, groupers=groupers, aggcol=aggcol[0])
+
+        return ddf_quantile[['value'] + groupers]
+
+
+class MultiQuantile(AggStats):
+    """Extends :class:`AggStats` to calculate several quantiles in a single pass.
+
+    Each group's replicate vector is sorted once and every requested quantile is read off the sorted values by
+    linear interpolation (the same interpolation used by ``pandas`` and ``numpy``).
+
+    Attributes:
+        quantiles (list of float): quantile values in the (0, 1) interval
+    """
+
+    def __init__(self, quantiles):
+        super(AggStats, self).__init__()
+        if type(quantiles) == float:
+            quantiles = [quantiles]
+        self.quantiles = list(quantiles)
 
+    def sorted_quantiles(self, values, axis=-1):
+        """Calculate all :attr:`quantiles` of ``values`` along ``axis`` with a single sort.
+
+        Missing values are ignored; positions with no valid values return ``NaN``.
+
+        Args:
+            values (numpy.ndarray): array of measurements
+            axis (int): axis containing the replicate values
+
+        Returns:
+            numpy.ndarray: quantiles; ``axis`` is replaced by a trailing axis of length ``len(quantiles)``
         """
 
-        return self.dd_agg(
-            ddf=ddf,
+        values = np.moveaxis(np.asarray(values, dtype=float), axis, -1)
+        ordered = np.sort(values, axis=-1)  # NaN values sort to the end
+        n_valid = np.sum(~np.isnan(ordered), axis=-1, keepdims=True)
+
+        # fractional position of each quantile within the valid values
+        position = np.asarray(self.quantiles, dtype=float) * np.maximum(n_valid - 1, 0)
+        lo = np.floor(position).astype(int)
+        hi = np.ceil(position).astype(int)
+        weight = position - lo
+
+        lo_values = np.take_along_axis(ordered, lo, axis=-1)
+        hi_values = np.take_along_axis(ordered, hi, axis=-1)
+        result = lo_values + (hi_values - lo_values) * weight
+
+        return np.where(n_valid > 0, result, np.nan)
+
+    def grouped_quantiles(self, frame, groupers, aggcol):
+        """Calculate all :attr:`quantiles` of ``aggcol`` for every group of a ``pandas.DataFrame``.
+
+        Rows are sorted once by group and value, so each group's valid values form a sorted run, and every quantile
+        is read off the runs by linear interpolation as in :func:`sorted_quantiles`. Groups may have different
+        numbers of replicates; missing values are ignored and groups with no valid values return ``NaN``.
+
+        Args:
+            frame (pandas.DataFrame): data holding every row of each group
+            groupers (list of str): names of columns identifying groups
+            aggcol (str): name of column containing measurements
+
+        Returns:
+            pandas.DataFrame: ``groupers``, ``quantile`` and ``value`` columns, one row per group and quantile
+        """
+
+        if len(frame) == 0:
+            return decode_categories(
+                frame[groupers].assign(quantile=np.array([], dtype=float), value=np.array([], dtype=float))
+            )
+
+        codes, groups = pd.factorize(pd.MultiIndex.from_frame(frame[groupers]), sort=True)
+        values = frame[aggcol].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        codes, values = codes[valid], values[valid]
+
+        order = np.lexsort((values, codes))
+        ordered = values[order]
+        counts = np.bincount(codes, minlength=len(groups))
+        starts = np.cumsum(counts) - counts
+
+        # fractional position of each quantile within each group's sorted run
+        position = starts[:, np.newaxis] + np.asarray(self.quantiles) * np.maximum(counts - 1, 0)[:, np.newaxis]
+        last = max(len(ordered) - 1, 0)
+        lo = np.minimum(np.floor(position).astype(int), last)
+        hi = np.minimum(np.ceil(position).astype(int), last)
+        if len(ordered) > 0:
+            result = ordered[lo] + (ordered[hi] - ordered[lo]) * (position - np.floor(position))
+        else:
+            result = np.full(position.shape, np.nan)
+        result = np.where(counts[:, np.newaxis] > 0, result, np.nan)
+
+        quantile_frame = groups.to_frame(index=False, name=groupers).iloc[np.repeat(np.arange(len(groups)), len(self.quantiles))]
+        quantile_frame = quantile_frame.reset_index(drop=True)
+        quantile_frame['quantile'] = np.tile(np.asarray(self.quantiles, dtype=float), len(groups))
+        quantile_frame['value'] = result.ravel()
+
+        return decode_categories(quantile_frame)
+
+    def dd_grouped_quantiles(self, ddf, groupers, aggcol):
+        """Lazily calculate all :attr:`quantiles` of ``aggcol`` for every group of a ``dask.DataFrame``.
+
+        If the data have more than one partition, rows are first shuffled on ``groupers`` so that each group's
+        complete replicate vector is in a single partition; :func:`grouped_quantiles` is then applied to every
+        partition, so the quantiles are exact.
+
+        Args:
+            ddf (dask.DataFrame, dask.Series): simulation data, with ``groupers`` as columns or as the (multi-)index
+            groupers (list of str): names of coordinates to maintain in aggregated data
+            aggcol (str): name of column in ``ddf`` containing measurements to aggregate
+
+        Returns:
+            dask.DataFrame: ``groupers``, ``quantile`` and ``value`` columns, one row per group and quantile
+        """
+
+        if ddf.ndim == 1:
+            ddf = ddf.to_frame(name=aggcol)
+        if not set(groupers).issubset(ddf.columns):
+            ddf = ddf.reset_index()
+        ddf = ddf[groupers + [aggcol]]
+
+        if ddf.npartitions > 1:
+            ddf = ddf.shuffle(on=groupers)
+
+        return ddf.map_partitions(
+            self.grouped_quantiles,
             groupers=groupers,
             aggcol=aggcol,
-            aggfxn=dd.Aggregation('quantile', self.chunk, self.agg, finalize=self.finalize)
+            meta=self.grouped_quantiles(ddf._meta, groupers=groupers, aggcol=aggcol)
+        )
+
+    def dd_quantiles(self, ddf, groupers, between, aggcol):
+        """Calculate all :attr:`quantiles` of ``aggcol`` across the ``between`` coordinates of a ``dask.DataFrame``.
+
+        The quantiles are calculated exactly with :func:`dd_grouped_quantiles`; only the (small) result is
+        computed and converted to ``xarray``.
+
+        Args:
+            ddf (dask.DataFrame, dask.Series): simulation data, either with ``groupers`` and ``between`` as columns
+                or as the (multi-)index of a series such as the output of :func:`Sum.dd_sum`
+            groupers (list of str): names of coordinates to maintain in aggregated data
+            between (list of str): names of coordinates distinguishing replicate simulations
+            aggcol (str): name of column in ``ddf`` containing measurements to aggregate
+
+        Returns:
+            xarray.Dataset: quantiles of ``aggcol`` with dimensions ``groupers`` and ``quantile``
+        """
+
+        if type(aggcol) == str:
+            aggcol = [aggcol]
+        if type(groupers) == str:
+            groupers = [groupers]
+        if type(between) == str:
+            between = [between]
+
+        # only valid for aggregation of a single column
+        assert len(aggcol) == 1
+
+        quantile_frame = self.dd_grouped_quantiles(ddf=ddf, groupers=groupers, aggcol=aggcol[0]).compute()
+
+        return self.frame_to_xarray(quantile_frame, groupers=groupers, aggcol=aggcol[0])
+
+    def frame_to_xarray(self, quantile_frame, groupers, aggcol):
+        """Convert the computed output of :func:`dd_grouped_quantiles` to an ``xarray.Dataset``.
+
+        Args:
+            quantile_frame (pandas.DataFrame): ``groupers``, ``quantile`` and ``value`` columns
+            groupers (list of str): names of coordinates to maintain in aggregated data
+            aggcol (str): name to give the quantile data variable
+
+        Returns:
+            xarray.Dataset: quantiles of ``aggcol`` with dimensions ``groupers`` and ``quantile``
+        """
+
+        with instrument.span('to_xarray', rows_in=len(quantile_frame)) as record:
+            quantile_xr = quantile_frame.set_index(groupers + ['quantile'])['value'].rename(aggcol).to_xarray()
+            quantile_xr = quantile_xr.to_dataset()
+            record.update(rows_out=int(quantile_xr[aggcol].size), bytes_out=int(quantile_xr.nbytes))
+
+        return quantile_xr
+
+    def xr_quantiles(self, ds, between, aggcol):
+        """Calculate all :attr:`quantiles` of ``aggcol`` along the ``between`` dimensions of an ``xarray.Dataset``.
+
+        Quantiles are calculated with :func:`sorted_quantiles` along the replicate axis of the dense simulation
+        array. For ``dask``-backed data the replicate axis is first gathered into a single chunk so that each
+        block holds complete replicate vectors.
+
+        Args:
+            ds (xarray.Dataset): simulation data, typically the output of :func:`Sum.xr_sum`
+            between (list of str): names of dimensions distinguishing replicate simulations
+            aggcol (str): name of data variable in ``ds`` containing measurements to aggregate
+
+        Returns:
+            xarray.Dataset: quantiles of ``aggcol`` with the remaining dimensions of ``ds`` and ``quantile``
+        """
+
+        if type(aggcol) == list:
+            aggcol = aggcol[0]
+        if type(between) == str:
+            between = [between]
+
+        data = ds[aggcol]
+        if len(between) > 1:
+            data = data.stack(replicate=between)
+            between = ['replicate']
+
+        if data.chunks is not None:
+            data = data.chunk({between[0]: -1})
+
+        quantile_xr = xr.apply_ufunc(
+            self.sorted_quantiles,
+            data,
+            input_core_dims=[between],
+            output_core_dims=[['quantile']],
+            dask='parallelized',
+            output_dtypes=[float],
+            dask_gufunc_kwargs={'output_sizes': {'quantile': len(self.quantiles)}}
+        )
+        quantile_xr = quantile_xr.assign_coords(quantile=self.quantiles)
+
+        return quantile_xr.to_dataset(name=aggcol)
+
+    def xr_sketch_quantiles(self, ds, between, aggcol, k=200, seed=None):
+        """Approximate all :attr:`quantiles` of ``aggcol`` along the ``between`` dimensions with a :class:`QuantileSketch`.
+
+        For very large ensembles, the replicate axis need not be gathered into one chunk: each chunk of replicates
+        is computed in turn and added to a mergeable sketch, so memory is bounded by one chunk plus the sketch.
+        Quantiles are exact up to ``k`` replicates; see :class:`QuantileSketch` for the error bound beyond that.
+
+        Args:
+            ds (xarray.Dataset): simulation data, typically the output of :func:`Sum.xr_sum`
+            between (list of str): names of dimensions distinguishing replicate simulations
+            aggcol (str): name of data variable in ``ds`` containing measurements to aggregate
+            k (int): compactor capacity of the sketch
+            seed (int): optional random seed of the sketch
+
+        Returns:
+            xarray.Dataset: quantiles of ``aggcol`` with the remaining dimensions of ``ds`` and ``quantile``
+        """
+
+        if type(aggcol) == list:
+            aggcol = aggcol[0]
+        if type(between) == str:
+            between = [between]
+
+        data = ds[aggcol]
+        if len(between) > 1:
+            data = data.stack(replicate=between)
+            between = ['replicate']
+        dims = [i for i in data.dims if i != between[0]]
+        data = data.transpose(*dims, between[0])
+
+        sketch = QuantileSketch(k=k, seed=seed)
+        if data.chunks is None:
+            sketch.update(data.values)
+        else:
+            bounds = np.cumsum((0,) + data.chunks[-1])
+            for start, stop in zip(bounds[:-1], bounds[1:]):
+                sketch.update(data.isel({between[0]: slice(start, stop)}).values)
+
+        return xr.Dataset(
+            {aggcol: (dims + ['quantile'], sketch.quantiles(self.quantiles))},
+            coords={**{i: data[i].values for i in dims if i in data.coords}, 'quantile': self.quantiles}
+        )
+
+
+class EnsembleStats(AggStats):
+    """Extends :class:`AggStats` to calculate several ensemble statistics in one fused pass over the replicates.
+
+    Any subset of the following statistics can be requested:
+
+    - ``mean``, ``variance``, ``min`` and ``max`` of each cell across replicates
+    - ``exceedance``: the share of replicates above :attr:`threshold` (e.g. hospital bed capacity)
+    - ``peak_time`` and ``peak_size``: quantiles across replicates of each replicate's time and size of peak along
+      the time dimension
+
+    Each block of data holding complete replicate vectors (and, for peak statistics, the complete time axis) is
+    reduced once to every requested statistic, so the data are read in a single scan regardless of how many
+    statistics are requested. Missing values are ignored.
+
+    Attributes:
+        statistics (list of str): statistics to calculate
+        threshold (float, xarray.DataArray): threshold for ``exceedance``; a ``DataArray`` (e.g. capacity per
+            vertex) is broadcast against the grouped data
+        quantiles (list of float): quantiles of the peak time and peak size distributions
+        ddof (int): delta degrees of freedom for ``variance``
+    """
+
+    STATISTICS = ['mean', 'variance', 'min', 'max', 'exceedance', 'peak_time', 'peak_size']
+    PEAK_STATISTICS = ['peak_time', 'peak_size']
+
+    def __init__(self, statistics, threshold=None, quantiles=(0.05, 0.5, 0.95), ddof=1):
+        super(AggStats, self).__init__()
+        if type(statistics) == str:
+            statistics = [statistics]
+        assert len(statistics) > 0
+        assert set(statistics).issubset(self.STATISTICS)
+        assert 'exceedance' not in statistics or threshold is not None
+
+        self.statistics = list(statistics)
+        self.threshold = threshold
+        self.quantiles = list(quantiles)
+        self.ddof = ddof
+
+    @property
+    def cell_statistics(self):
+        """Requested statistics with one value per cell."""
+
+        return [i for i in self.statistics if i not in self.PEAK_STATISTICS]
+
+    @property
+    def peak_statistics(self):
+        """Requested statistics of the peak along the time dimension."""
+
+        return [i for i in self.statistics if i in self.PEAK_STATISTICS]
+
+    def reduce(self, values, threshold=np.nan):
+        """Calculate :attr:`cell_statistics` along the trailing replicate axis of ``values``.
+
+        Args:
+            values (numpy.ndarray): measurements with the replicate axis last
+            threshold (float, numpy.ndarray): threshold for ``exceedance``, broadcastable against ``values`` without
+                its replicate axis
+
+        Returns:
+            numpy.ndarray: statistics; the replicate axis is replaced by a trailing axis of length
+            ``len(cell_statistics)``
+        """
+
+        values = np.asarray(values, dtype=float)
+        valid = ~np.isnan(values)
+        count = valid.sum(axis=-1)
+        filled = np.where(valid, values, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = filled.sum(axis=-1) / count
+            results = {'mean': mean}
+            if 'variance' in self.statistics:
+                deviation = np.where(valid, values - mean[..., np.newaxis], 0.0)
+                results['variance'] = np.where(
+                    count > self.ddof, (deviation ** 2).sum(axis=-1) / (count - self.ddof), np.nan
+                )
+            if 'min' in self.statistics:
+                results['min'] = np.where(count > 0, np.where(valid, values, np.inf).min(axis=-1), np.nan)
+            if 'max' in self.statistics:
+                results['max'] = np.where(count > 0, np.where(valid, values, -np.inf).max(axis=-1), np.nan)
+            if 'exceedance' in self.statistics:
+                above = valid & (values > np.asarray(threshold, dtype=float)[..., np.newaxis])
+                results['exceedance'] = above.sum(axis=-1) / count
+
+        return np.stack([results[i] for i in self.cell_statistics], axis=-1)
+
+    def peaks(self, values):
+        """Calculate quantiles of the peak time (as a position along the time axis) and peak size of each replicate.
+
+        Args:
+            values (numpy.ndarray): measurements with the time and replicate axes last
+
+        Returns:
+            numpy.ndarray: shape ``values.shape[:-2] + (2, len(quantiles))``, with peak time then peak size
+        """
+
+        values = np.asarray(values, dtype=float)
+        valid = ~np.isnan(values)
+        filled = np.where(valid, values, -np.inf)
+        peak_time = filled.argmax(axis=-2).astype(float)
+        peak_size = filled.max(axis=-2)
+
+        # replicates with no valid values have no peak
+        missing = ~valid.any(axis=-2)
+        peak_time[missing] = np.nan
+        peak_size[missing] = np.nan
+
+        quantile = MultiQuantile(quantiles=self.quantiles)
+
+        return np.stack([quantile.sorted_quantiles(peak_time), quantile.sorted_quantiles(peak_size)], axis=-2)
+
+    def position_values(self, positions, times):
+        """Map fractional positions along the time axis to time coordinate values by linear interpolation.
+
+        Args:
+            positions (numpy.ndarray): positions; ``NaN`` where there is no peak
+            times (numpy.ndarray): time coordinate values (numeric or ``datetime64``)
+
+        Returns:
+            numpy.ndarray: time values with the dtype of ``times``; ``NaN`` (or ``NaT``) where there is no peak
+        """
+
+        missing = np.isnan(positions)
+        positions = np.where(missing, 0, positions)
+        if np.issubdtype(times.dtype, np.datetime64):
+            values = np.interp(positions, np.arange(len(times)), times.astype('int64')).round().astype('int64')
+            return np.where(missing, np.datetime64('NaT'), values.astype(times.dtype))
+
+        values = np.interp(positions, np.arange(len(times)), times.astype(float))
+
+        return np.where(missing, np.nan, values)
+
+    def xr_stats(self, ds, between, aggcol, time_coord=None):
+        """Calculate all :attr:`statistics` of ``aggcol`` along the ``between`` dimensions of an ``xarray.Dataset``.
+
+        For ``dask``-backed data the replicate axis (and, for peak statistics, the time axis) is gathered into a
+        single chunk, and every block is reduced once by :func:`reduce` and :func:`peaks`.
+
+        Args:
+            ds (xarray.Dataset): simulation data, typically the output of :func:`Sum.xr_sum`
+            between (list of str): names of dimensions distinguishing replicate simulations
+            aggcol (str): name of data variable in ``ds`` containing measurements to aggregate
+            time_coord (str): name of the time dimension; required for peak statistics
+
+        Returns:
+            xarray.Dataset: one data variable per statistic; peak statistics have the time dimension replaced by
+            ``quantile``, and ``peak_time`` holds values of ``time_coord``
+        """
+
+        if type(aggcol) == list:
+            aggcol = aggcol[0]
+        if type(between) == str:
+            between = [between]
+        if type(time_coord) == list:
+            time_coord = time_coord[0]
+        assert time_coord is not None or not self.peak_statistics
+
+        data = ds[aggcol]
+        if len(between) > 1:
+            data = data.stack(replicate=between)
+            between = ['replicate']
+
+        core_dims = [time_coord, between[0]] if self.peak_statistics else [between[0]]
+        if data.chunks is not None:
+            data = data.chunk({i: -1 for i in core_dims})
+
+        threshold = np.nan if self.threshold is None else self.threshold
+        cell_dims = [time_coord] if self.peak_statistics else []
+
+        def _fused(values, threshold):
+            results = []
+            if self.cell_statistics:
+                results.append(self.reduce(values, np.asarray(threshold)[..., np.newaxis] if cell_dims else threshold))
+            if self.peak_statistics:
+                results.append(self.peaks(values))
+            return tuple(results) if len(results) > 1 else results[0]
+
+        # only the requested kinds of output are calculated; e.g. peak statistics alone skip :func:`reduce`
+        output_core_dims = []
+        output_sizes = {}
+        if self.cell_statistics:
+            output_core_dims.append(cell_dims + ['statistic'])
+            output_sizes['statistic'] = len(self.cell_statistics)
+        if self.peak_statistics:
+            output_core_dims.append(['peak', 'quantile'])
+            output_sizes.update({'peak': 2, 'quantile': len(self.quantiles)})
+
+        outputs = xr.apply_ufunc(
+            _fused,
+            data,
+            threshold,
+            input_core_dims=[core_dims, []],
+            output_core_dims=output_core_dims,
+            dask='parallelized',
+            output_dtypes=[float] * len(output_core_dims),
+            dask_gufunc_kwargs={'output_sizes': output_sizes}
         )
+        if len(output_core_dims) == 1:
+            outputs = (outputs,)
+
+        stats_xr = xr.Dataset()
+        for i, name in enumerate(self.cell_statistics):
+            stats_xr[name] = outputs[0].isel(statistic=i, drop=True)
+
+        if self.peak_statistics:
+            peaks = outputs[-1].assign_coords(quantile=self.quantiles)
+            if 'peak_time' in self.statistics:
+                times = data[time_coord].values
+                stats_xr['peak_time'] = xr.apply_ufunc(
+                    self.position_values,
+                    peaks.isel(peak=0, drop=True),
+                    kwargs={'times': times},
+                    dask='parallelized',
+                    output_dtypes=[times.dtype]
+                )
+            if 'peak_size' in self.statistics:
+                stats_xr['peak_size'] = peaks.isel(peak=1, drop=True)
+
+        return stats_xr
+
+
+class QuantileSketch:
+    """Mergeable, approximate quantile sketch over the replicate axis of an array.
+
+    The sketch is a KLL-style stack of compactors, vectorized so that every cell of the leading dimensions
+    (e.g. compartment x vertex x timestep) is summarized at once. Level ``l`` holds values carrying weight
+    ``2 ** l``; when a level grows past ``k`` values it is sorted and every other value (starting from a random
+    offset) is promoted to the next level. Sketches built from disjoint batches of replicates can be merged.
+
+    Error bounds: while fewer than ``k`` replicates have been added, no compaction occurs and quantiles are exact
+    (identical to :func:`MultiQuantile.sorted_quantiles`). Beyond that, each compaction at level ``l`` moves the
+    rank of any value by at most ``2 ** l``, so the rank error of a returned quantile is bounded by about
+    ``n * log2(n / k) / k`` for ``n`` replicates and is zero in expectation.
+
+    Attributes:
+        k (int): capacity of each compactor level
+        levels (list of numpy.ndarray): retained values at each level, replicate axis last
+        count (int): number of replicates summarized
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.levels = []
+        self.count = 0
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        """Add replicate values to the sketch.
+
+        Args:
+            values (numpy.ndarray): measurements with the replicate axis last
+
+        Returns:
+            None; updates :attr:`levels` and :attr:`count`
+        """
+
+        values = np.asarray(values, dtype=float)
+        self._add(0, values)
+        self.count += values.shape[-1]
+        self._compress()
+
+    def merge(self, other):
+        """Merge another sketch, built over the same cells from different replicates, into this one.
+
+        Args:
+            other (QuantileSketch): sketch to merge
+
+        Returns:
+            None; updates :attr:`levels` and :attr:`count`
+        """
+
+        for level, values in enumerate(other.levels):
+            self._add(level, values)
+        self.count += other.count
+        self._compress()
+
+    def _add(self, level, values):
+        while len(self.levels) <= level:
+            self.levels.append(np.empty(values.shape[:-1] + (0,)))
+        self.levels[level] = np.concatenate([self.levels[level], values], axis=-1)
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            buffer = self.levels[level]
+            size = buffer.shape[-1]
+            if size > self.k:
+                buffer = np.sort(buffer, axis=-1)
+                n_pairs = size - size % 2
+                offset = self.rng.integers(2)
+                self.levels[level] = buffer[..., n_pairs:]
+                self._add(level + 1, buffer[..., offset:n_pairs:2])
+            level += 1
+
+    def quantiles(self, quantiles):
+        """Estimate quantiles from the sketch.
+
+        Args:
+            quantiles (list of float): quantile values in the (0, 1) interval
+
+        Returns:
+            numpy.ndarray: quantiles; the replicate axis is replaced by a trailing axis of length ``len(quantiles)``
+        """
+
+        assert self.count > 0
+
+        if len(self.levels) == 1:
+            return MultiQuantile(quantiles=quantiles).sorted_quantiles(self.levels[0], axis=-1)
+
+        values = np.concatenate(self.levels, axis=-1)
+        weights = np.concatenate([np.full(i.shape[-1], 2 ** level) for level, i in enumerate(self.levels)])
+
+        order = np.argsort(values, axis=-1)
+        values = np.take_along_axis(values, order, axis=-1)
+        cumulative = np.cumsum(weights[order], axis=-1)
+        total = cumulative[..., -1:]
+
+        # interpolate between the values holding the ranks on either side of each target rank
+        result = []
+        for q in quantiles:
+            rank = q * (total - 1)
+            lo = np.sum(cumulative <= np.floor(rank), axis=-1, keepdims=True)
+            hi = np.sum(cumulative <= np.ceil(rank), axis=-1, keepdims=True)
+            lo_values = np.take_along_axis(values, lo, axis=-1)
+            hi_values = np.take_along_axis(values, hi, axis=-1)
+            result.append(lo_values + (hi_values - lo_values) * (rank - np.floor(rank)))
+
+        return np.concatenate(result, axis=-1)
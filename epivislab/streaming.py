@@ -0,0 +1,212 @@
+"""Incremental summaries for simulation ensembles that grow over time
+"""
+
+import itertools
+import numpy as np
+import xarray as xr
+from epivislab.stats import Sum, QuantileSketch
+
+
+class EnsembleAccumulator:
+    """Maintains running summary statistics for replicate simulations as they arrive.
+
+    Each call to :func:`ingest` sums a batch of new replicates within simulations (keeping ``groupers``), then
+    updates exact running sums, means and variances and a mergeable :class:`epivislab.stats.QuantileSketch`. The
+    cost of an update is proportional to the number of new replicates, not the size of the full ensemble.
+
+    Replicates are keyed by their ``between_sim`` coordinate values; replicates that have already been ingested are
+    dropped before the batch is summed, so overlapping batches (for example a re-read of a zarr store being appended
+    to) are safe and only the new replicates are read.
+
+    Attributes:
+        groupers (list of str): names of coordinates to maintain in aggregated data
+        aggcol (str): name of measured coordinate
+        between_sim (list of str): coordinate(s) for between-simulation data
+        quantiles (list of float): quantile values in the (0, 1) interval
+        seen (set): ``between_sim`` values of replicates already ingested
+        count (int): number of replicates ingested
+        total (numpy.ndarray): running sum over replicates
+        mean (numpy.ndarray): running mean over replicates
+        m2 (numpy.ndarray): running sum of squared deviations from the mean
+        sketch (QuantileSketch): running quantile sketch
+    """
+
+    def __init__(self, groupers, aggcol, between_sim_coord, quantiles=(0.05, 0.5, 0.95), k=200, seed=None):
+        if type(groupers) == str:
+            groupers = [groupers]
+        if type(aggcol) == list:
+            aggcol = aggcol[0]
+        if type(between_sim_coord) == str:
+            between_sim_coord = [between_sim_coord]
+
+        # the coordinate that separates simulations most not be a grouping variable
+        assert not set(between_sim_coord).intersection(set(groupers))
+
+        self.groupers = list(groupers)
+        self.aggcol = aggcol
+        self.between_sim = list(between_sim_coord)
+        self.quantiles = list(quantiles)
+        self.seen = set()
+        self.count = 0
+        self.total = None
+        self.mean = None
+        self.m2 = None
+        self.coords = None
+        self.sketch = QuantileSketch(k=k, seed=seed)
+
+    def _new_replicates(self, simulation):
+        """Restrict ``simulation`` to replicates not yet ingested and return them as a (groupers..., replicate) array.
+        """
+
+        replicates = simulation[self.aggcol].stack(replicate=self.between_sim)
+        keys = [i if type(i) == tuple else (i,) for i in replicates['replicate'].values]
+        new = [i for i, key in enumerate(keys) if key not in self.seen]
+        replicates = replicates.isel(replicate=new)
+
+        return replicates, [keys[i] for i in new]
+
+    def ingest(self, simulation):
+        """Add a batch of replicate simulations to the running statistics.
+
+        Args:
+            simulation (xarray.Dataset): simulation data for one or more replicates, with the same coordinates as
+                earlier batches apart from ``between_sim``
+
+        Returns:
+            int: number of new replicates ingested
+        """
+
+        # drop replicates already ingested before summing, so that overlapping batches only read new replicates
+        new = [
+            key for key in itertools.product(*[simulation[i].values.tolist() for i in self.between_sim])
+            if key not in self.seen
+        ]
+        if len(new) == 0:
+            return 0
+        simulation = simulation.isel({
+            coord: [j for j, value in enumerate(simulation[coord].values.tolist()) if value in {i[n] for i in new}]
+            for n, coord in enumerate(self.between_sim)
+        })
+
+        sum_ = Sum()
+        simulation_sum = sum_.xr_sum(ds=simulation, groupers=self.groupers + self.between_sim, aggcol=self.aggcol)
+        replicates, keys = self._new_replicates(simulation_sum)
+        if len(keys) == 0:
+            return 0
+
+        coords = {i: replicates[i].values for i in self.groupers}
+        if self.coords is None:
+            self.coords = coords
+        else:
+            for key, values in self.coords.items():
+                assert np.array_equal(values, coords[key]), f'Coordinate {key} does not match earlier batches.'
+
+        values = np.asarray(replicates.transpose(*self.groupers, 'replicate').values, dtype=float)
+        self._update_moments(values)
+        self.sketch.update(values)
+        self.seen.update(keys)
+
+        return len(keys)
+
+    def _update_moments(self, values):
+        """Merge batch moments into the running moments (Chan et al. parallel algorithm)."""
+
+        n_new = values.shape[-1]
+        total_new = values.sum(axis=-1)
+        mean_new = total_new / n_new
+        m2_new = ((values - mean_new[..., np.newaxis]) ** 2).sum(axis=-1)
+
+        if self.count == 0:
+            self.total, self.mean, self.m2 = total_new, mean_new, m2_new
+
+        else:
+            n = self.count + n_new
+            delta = mean_new - self.mean
+            self.total = self.total + total_new
+            self.mean = self.mean + delta * n_new / n
+            self.m2 = self.m2 + m2_new + delta ** 2 * self.count * n_new / n
+
+        self.count += n_new
+
+    def merge(self, other):
+        """Merge an accumulator built over a disjoint set of replicates into this one.
+
+        Args:
+            other (EnsembleAccumulator): accumulator with the same ``groupers``, ``aggcol`` and coordinates
+
+        Returns:
+            None; updates running statistics in place
+        """
+
+        assert self.groupers == other.groupers
+        assert self.aggcol == other.aggcol
+        assert not self.seen.intersection(other.seen)
+
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.coords = other.coords
+            self.total, self.mean, self.m2 = other.total, other.mean, other.m2
+        else:
+            n = self.count + other.count
+            delta = other.mean - self.mean
+            self.total = self.total + other.total
+            self.mean = self.mean + delta * other.count / n
+            self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / n
+
+        self.count += other.count
+        self.sketch.merge(other.sketch)
+        self.seen.update(other.seen)
+
+    def summary(self, ddof=1):
+        """Current running statistics.
+
+        Args:
+            ddof (int): delta degrees of freedom for the variance
+
+        Returns:
+            xarray.Dataset: ``sum``, ``mean``, ``variance`` with dimensions ``groupers``, and ``quantile_value`` with
+            an additional ``quantile`` dimension; the number of replicates is in the ``count`` attribute
+        """
+
+        assert self.count > 0
+
+        dims = self.groupers
+        variance = self.m2 / (self.count - ddof) if self.count > ddof else np.full_like(self.m2, np.nan)
+        summary = xr.Dataset(
+            {
+                'sum': (dims, self.total),
+                'mean': (dims, self.mean),
+                'variance': (dims, variance),
+                'quantile_value': (dims + ['quantile'], self.sketch.quantiles(self.quantiles)),
+            },
+            coords={**self.coords, 'quantile': self.quantiles}
+        )
+        summary.attrs['count'] = self.count
+
+        return summary
+
+    def prediction_interval(self, upper, lower):
+        """Current prediction interval in the format used by :func:`epivislab.timeseries.interval_timeseries`.
+
+        Args:
+            upper (float): quantile value in the (0, 1) interval
+            lower (float): quantile value in the (0, 1) interval
+
+        Returns:
+            xarray.Dataset: ``upper``, ``lower`` and ``median`` estimates with dimensions ``groupers``
+        """
+
+        assert upper > lower
+
+        values = self.sketch.quantiles([upper, lower, 0.5])
+        dims = self.groupers
+
+        return xr.Dataset(
+            {
+                'upper': (dims, values[..., 0]),
+                'lower': (dims, values[..., 1]),
+                'median': (dims, values[..., 2]),
+            },
+            coords=self.coords
+        )
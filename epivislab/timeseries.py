@@ -1,11 +1,10 @@
 """Methods for generating timeseries plots
+
+``plotly`` and ``ipywidgets`` are imported when a plot or widget is first built, so the array helpers in this
+module (and :mod:`epivislab.simhandler`, which uses them) can be imported by headless jobs without loading them.
 """
 
 import numpy as np
-import plotly
-import plotly.express as px
-import plotly.graph_objects as go
-from ipywidgets import widgets
 
 
 def get_summary_defaults(xr):
@@ -51,6 +50,8 @@ def build_widgets(data_xr, defaults):
         dict: dictionary with {coordinate name: ``widgets.Dropdown`` object} structure
     """
 
+    from ipywidgets import widgets
+
     # build widgets
     widget_dict = {}
     for key, value_ in defaults.items():
@@ -64,30 +65,207 @@ def build_widgets(data_xr, defaults):
     return widget_dict
 
 
-def interval_timeseries(summary_xr):
-    """Create a prediction interval plot
+def build_cube(data_xr, variables, widget_coords, x_coord, index_coord=None):
+    """Pre-index simulation data into contiguous ``numpy`` arrays for fast widget callbacks.
+
+    Each variable is transposed once to the order (``widget_coords``..., ``index_coord``, ``x_coord``) and loaded
+    into memory, so that selecting the data for a combination of dropdown values is a plain array index rather than
+    an ``xarray`` selection and ``pandas`` conversion.
 
     Args:
-        summary_xr (xarray): simulation data containing coordinates `upper` (upper predition interval), `lower` \
-        (lower prediction interval), and `median` (median prediction value).
+        data_xr (xarray): simulation data
+        variables (list of str): data variables to pre-index
+        widget_coords (list of str): coordinates selected by dropdown widgets
+        x_coord (str): coordinate containing x-axis data (timestep data)
+        index_coord (str): optional coordinate distinguishing different simulations
 
     Returns:
-        None; outputs plotly graph using plotly ``display`` method.
+        dict: dictionary with {variable name: ``numpy.ndarray``} structure, plus the positions of each widget
+        coordinate value under the ``'positions'`` key ({coordinate name: {value: position}}) and the x-axis values
+        under the ``'x'`` key
     """
 
-    # select a default subset of the xarray
-    defaults = get_summary_defaults(summary_xr)
-    selection = summary_xr.sel(defaults).to_dataframe().reset_index()
+    order = list(widget_coords) + ([index_coord] if index_coord is not None else []) + [x_coord]
 
-    # check that data for a proper interval display are present
-    assert 'upper' in selection.columns
-    assert 'lower' in selection.columns
-    assert 'median' in selection.columns
+    cube = {var: np.ascontiguousarray(data_xr[var].transpose(*order).values) for var in variables}
+    cube['positions'] = {
+        coord: {value: position for position, value in enumerate(data_xr[coord].values.tolist())}
+        for coord in widget_coords
+    }
+    cube['x'] = data_xr[x_coord].values
+
+    return cube
+
+
+def cube_selection(cube, selection):
+    """Position of a combination of widget values in a cube built by :func:`build_cube`.
+
+    Args:
+        cube (dict): output of :func:`build_cube`
+        selection (dict): dictionary with {coordinate name: selected value} structure
+
+    Returns:
+        tuple: index into each variable array of ``cube``
+    """
+
+    return tuple(cube['positions'][coord][value] for coord, value in selection.items())
+
+
+def _numeric_x(x):
+    """Convert x-axis values, including ``np.datetime64`` timesteps, to floats for downsampling geometry."""
+
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype('datetime64[ns]').astype(np.int64)
+
+    return x.astype(float)
+
+
+def lttb_indices(x, y, n_out):
+    """Select points with the largest-triangle-three-buckets (LTTB) downsampling algorithm.
+
+    The first and last points are always kept. The remaining points are split into ``n_out - 2`` buckets, and from
+    each bucket the point forming the largest triangle with the previously selected point and the mean of the next
+    bucket is kept. Leading dimensions of ``y`` (e.g. replicates) are downsampled together, each selecting its own
+    points.
+
+    Args:
+        x (numpy.ndarray): x-axis values, length ``n``
+        y (numpy.ndarray): y-axis values, with the x-axis as the last dimension
+        n_out (int): number of points to keep
+
+    Returns:
+        numpy.ndarray: sorted indices along the last dimension of ``y``, shape ``y.shape[:-1] + (n_out,)``
+    """
+
+    y = np.asarray(y, dtype=float)
+    n = y.shape[-1]
+    if n_out >= n or n_out < 3:
+        return np.broadcast_to(np.arange(n), y.shape).copy()
+
+    x = _numeric_x(x)
+    rows = y.reshape(-1, n)
+    row_idx = np.arange(rows.shape[0])
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+
+    selected = np.empty((rows.shape[0], n_out), dtype=int)
+    selected[:, 0] = 0
+    selected[:, -1] = n - 1
+    a = np.zeros(rows.shape[0], dtype=int)
+
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+
+        cx = x[next_lo:next_hi].mean()
+        cy = np.nanmean(rows[:, next_lo:next_hi], axis=1)
+        ax, ay = x[a], rows[row_idx, a]
+
+        area = np.abs(
+            (ax - cx)[:, np.newaxis] * (rows[:, lo:hi] - ay[:, np.newaxis])
+            - (ax[:, np.newaxis] - x[np.newaxis, lo:hi]) * (cy - ay)[:, np.newaxis]
+        )
+        a = lo + np.argmax(np.where(np.isnan(area), -1, area), axis=1)
+        selected[:, i + 1] = a
+
+    return selected.reshape(y.shape[:-1] + (n_out,))
+
+
+def minmax_indices(y, n_buckets):
+    """Select the minimum and maximum point of each of ``n_buckets`` equal-width buckets.
+
+    Keeping both extremes of every bucket preserves the envelope of the series, so peaks and troughs are never
+    removed by downsampling. The first and last points are always kept.
+
+    Args:
+        y (numpy.ndarray): one-dimensional y-axis values
+        n_buckets (int): number of buckets
+
+    Returns:
+        numpy.ndarray: sorted, unique indices of the kept points
+    """
+
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if 2 * n_buckets + 2 >= n:
+        return np.arange(n)
+
+    filled = np.where(np.isnan(y), np.nanmean(y), y)
+    edges = np.linspace(0, n, n_buckets + 1).astype(int)
+    keep = [0, n - 1]
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        keep.extend([lo + np.argmin(filled[lo:hi]), lo + np.argmax(filled[lo:hi])])
+
+    return np.unique(keep)
+
+
+def interval_indices(x, upper, lower, median, plot_width):
+    """Select points to draw for a prediction interval plot ``plot_width`` pixels wide.
+
+    The union of the min/max envelope points of ``upper`` and ``lower`` (see :func:`minmax_indices`) and the LTTB
+    points of ``median`` (see :func:`lttb_indices`) is kept, so the interval envelope is drawn exactly while the
+    total number of points stays proportional to the plot width.
+
+    Args:
+        x (numpy.ndarray): x-axis values
+        upper (numpy.ndarray): upper prediction interval
+        lower (numpy.ndarray): lower prediction interval
+        median (numpy.ndarray): median prediction
+        plot_width (int): plot width in pixels
+
+    Returns:
+        numpy.ndarray: sorted, unique indices of the kept points
+    """
+
+    n_buckets = max(plot_width // 4, 1)
+
+    return np.unique(np.concatenate([
+        minmax_indices(upper, n_buckets),
+        minmax_indices(lower, n_buckets),
+        lttb_indices(x, median, max(plot_width // 2, 3)),
+    ]))
+
+
+def figure_layout(plot_width=None, title=None):
+    """Layout shared by interval and spaghetti plots.
+
+    Args:
+        plot_width (int): optional plot width in pixels
+        title (str): optional plot title
+
+    Returns:
+        plotly.graph_objects.Layout
+    """
+
+    import plotly.graph_objects as go
+
+    return go.Layout(
+        plot_bgcolor='#fff',
+        yaxis_title='N',
+        font=dict(size=18),
+        width=plot_width,
+        title=title
+    )
+
+
+def interval_traces(x, upper, lower, median):
+    """Build the traces of a prediction interval plot.
+
+    Args:
+        x (numpy.ndarray): x-axis values
+        upper (numpy.ndarray): upper prediction interval
+        lower (numpy.ndarray): lower prediction interval
+        median (numpy.ndarray): median prediction
+
+    Returns:
+        list: upper, lower and median ``plotly.graph_objects.Scatter`` traces
+    """
+
+    import plotly.graph_objects as go
 
-    # define data traces
     upper_trace = go.Scatter(
-        x=selection['step'],
-        y=selection['upper'],
+        x=x,
+        y=upper,
         fill=None,
         mode='lines',
         line_color='rgba(255,255,255,0.2)',
@@ -95,8 +273,8 @@ def interval_timeseries(summary_xr):
     )
 
     lower_trace = go.Scatter(
-        x=selection['step'],
-        y=selection['lower'],
+        x=x,
+        y=lower,
         fill='tonexty',
         mode='lines',
         fillcolor='rgba(189,0,38,0.2)',
@@ -105,91 +283,349 @@ def interval_timeseries(summary_xr):
     )
 
     median_trace = go.Scatter(
-        x=selection['step'],
-        y=selection['median'],
+        x=x,
+        y=median,
         line_color='rgb(255,255,255)',
         name=None,
         showlegend=False,
     )
 
+    return [upper_trace, lower_trace, median_trace]
+
+
+def interval_timeseries(summary_xr, plot_width=None):
+    """Create a prediction interval plot
+
+    If ``plot_width`` is given, each series is downsampled to a number of points proportional to the plot width
+    before traces are built and in widget callbacks, keeping every envelope point of the interval (see
+    :func:`interval_indices`).
+
+    Args:
+        summary_xr (xarray): simulation data containing coordinates `upper` (upper predition interval), `lower` \
+        (lower prediction interval), and `median` (median prediction value).
+        plot_width (int): optional plot width in pixels used for downsampling
+
+    Returns:
+        None; outputs plotly graph using plotly ``display`` method.
+    """
+
+    import plotly.graph_objects as go
+    from ipywidgets import widgets
+
+    # select a default subset of the xarray
+    defaults = get_summary_defaults(summary_xr)
+
+    # check that data for a proper interval display are present
+    assert 'upper' in summary_xr.data_vars
+    assert 'lower' in summary_xr.data_vars
+    assert 'median' in summary_xr.data_vars
+
+    # pre-index the interval data once; the remaining dimension is the x-axis
+    x_coord = [i for i in summary_xr['median'].dims if i not in defaults][0]
+    cube = build_cube(summary_xr, ['upper', 'lower', 'median'], list(defaults.keys()), x_coord)
+
+    def _points(selection):
+        position = cube_selection(cube, selection)
+        upper, lower, median = cube['upper'][position], cube['lower'][position], cube['median'][position]
+        if plot_width is None:
+            return cube['x'], upper, lower, median
+
+        keep = interval_indices(cube['x'], upper, lower, median, plot_width)
+        return cube['x'][keep], upper[keep], lower[keep], median[keep]
+
+    x, upper, lower, median = _points(defaults)
+
     # build widgets
     widget_dict = build_widgets(data_xr=summary_xr, defaults=defaults)
 
     def _response(change):
-        selection = summary_xr.sel({key: _value.value for key, _value in widget_dict.items()}).to_dataframe().reset_index()
+        x, upper, lower, median = _points({key: _value.value for key, _value in widget_dict.items()})
 
         with g.batch_update():
-            g.data[0].y = selection['upper']
-            g.data[1].y = selection['lower']
-            g.data[2].y = selection['median']
+            for trace_idx, y in enumerate([upper, lower, median]):
+                if plot_width is not None:
+                    g.data[trace_idx].x = x
+                g.data[trace_idx].y = y
 
     for key, val in widget_dict.items():
         val.observe(_response, names="value")
 
-    g = go.FigureWidget(
-        data=[upper_trace, lower_trace, median_trace],
-        layout=go.Layout(
-            plot_bgcolor='#fff',
-            yaxis_title='N',
-            font=dict(size=18)
-        )
-    )
+    g = go.FigureWidget(data=interval_traces(x, upper, lower, median), layout=figure_layout(plot_width))
 
     container1 = widgets.HBox(list(widget_dict.values()))
     return widgets.VBox([container1, g])
 
 
-def spaghetti_timeseries(simulation_xr, x_val, y_val, index_coord):
+def pack_replicates(x, replicates):
+    """Pack replicate lines into single x and y vectors separated by ``NaN`` breaks.
+
+    A single trace drawn from the packed vectors shows one line per replicate, because plotly does not connect
+    lines across ``NaN`` y values. The separator point repeats the last x value so that x stays monotonic.
+
+    Args:
+        x (numpy.ndarray): x-axis values, either shared (length ``n_steps``) or per replicate (same shape as
+            ``replicates``)
+        replicates (numpy.ndarray): y-axis values with shape (``n_replicates``, ``n_steps``)
+
+    Returns:
+        tuple: packed x and y ``numpy.ndarray`` objects, each of length ``n_replicates * (n_steps + 1)``
+    """
+
+    n_replicates = replicates.shape[0]
+    x = np.broadcast_to(x, replicates.shape)
+    packed_x = np.hstack([x, x[:, -1:]]).ravel()
+    packed_y = np.hstack([replicates, np.full((n_replicates, 1), np.nan)]).ravel()
+
+    return packed_x, packed_y
+
+
+def replicate_density(replicates, bins=50):
+    """Count replicate values in y-axis bins at each timestep.
+
+    Args:
+        replicates (numpy.ndarray): y-axis values with shape (``n_replicates``, ``n_steps``)
+        bins (int): number of y-axis bins
+
+    Returns:
+        tuple: bin centers (length ``bins``) and counts with shape (``bins``, ``n_steps``)
+    """
+
+    n_steps = replicates.shape[1]
+    lo, hi = np.nanmin(replicates), np.nanmax(replicates)
+    if hi == lo:
+        hi = lo + 1
+    edges = np.linspace(lo, hi, bins + 1)
+
+    valid = ~np.isnan(replicates)
+    bin_idx = np.clip(np.digitize(replicates[valid], edges) - 1, 0, bins - 1)
+    step_idx = np.broadcast_to(np.arange(n_steps), replicates.shape)[valid]
+    counts = np.bincount(bin_idx * n_steps + step_idx, minlength=bins * n_steps).reshape(bins, n_steps)
+
+    return (edges[:-1] + edges[1:]) / 2, counts
+
+
+def spaghetti_traces(x_axis, x, replicates, render='traces', bins=50):
+    """Build the traces of a spaghetti plot.
+
+    Args:
+        x_axis (numpy.ndarray): x-axis values, used for the density heatmap
+        x (numpy.ndarray): x-axis values per replicate, same shape as ``replicates`` (downsampled lines may keep
+            different points)
+        replicates (numpy.ndarray): y-axis values with shape (``n_replicates``, ``n_steps``)
+        render (str): ``'traces'``, ``'packed'`` or ``'density'``; see :func:`spaghetti_timeseries`
+        bins (int): number of y-axis bins for the density heatmap
+
+    Returns:
+        list: ``plotly`` traces
+    """
+
+    import plotly.graph_objects as go
+
+    if render == 'density':
+        y_bins, counts = replicate_density(replicates, bins=bins)
+        return [go.Heatmap(x=x_axis, y=y_bins, z=counts, colorscale='Greys', showscale=False)]
+
+    if render == 'packed':
+        packed_x, packed_y = pack_replicates(x, replicates)
+        return [
+            go.Scattergl(
+                x=packed_x,
+                y=packed_y,
+                mode='lines',
+                line_color='rgba(0, 0, 0, 0.5)',
+                connectgaps=False,
+                showlegend=False
+            )
+        ]
+
+    lines = []
+    for x_, y in zip(x, replicates):
+        next_line = go.Scatter(
+            x=x_,
+            y=y,
+            fill=None,
+            mode='lines',
+            line_color='rgba(0, 0, 0, 0.5)',
+            showlegend=False
+        )
+        lines.append(next_line)
+
+    return lines
+
+
+def spaghetti_timeseries(simulation_xr, x_val, y_val, index_coord, render='traces', density_threshold=None, bins=50,
+                         plot_width=None):
     """Create a spaghetti plot.
 
+    With ``render='traces'`` each replicate is drawn as its own trace. With ``render='packed'`` all replicates are
+    packed into one ``Scattergl`` trace with ``NaN`` breaks between lines (see :func:`pack_replicates`), so
+    rendering uses WebGL and each widget update sends one array rather than one message per replicate. If
+    ``density_threshold`` is given and the number of replicates exceeds it, a heatmap of replicate density per
+    timestep (see :func:`replicate_density`) is drawn instead of lines. If ``plot_width`` is given, each replicate
+    line is downsampled to ``plot_width`` points with :func:`lttb_indices` before traces are built and in widget
+    callbacks.
+
     Args:
         simulation_xr (xarray): simulation data containing data from multiple simulations.
         x_val (str): coordinate in ``simulation_xr`` containing x-axis data (timestep data)
         y_val (str): coordinate in ``simulation_xr`` containing y-axis data (simulation measurement data)
         index_coord (str): coordinate in ``simulation_xr`` containing index value distinguising different simulations.
+        render (str): ``'traces'`` or ``'packed'``
+        density_threshold (int): optional number of replicates above which a density heatmap is drawn
+        bins (int): number of y-axis bins for the density heatmap
+        plot_width (int): optional plot width in pixels used for downsampling
 
     Returns:
         None; outputs plotly graph using plotly ``display`` method.
     """
 
+    import plotly.graph_objects as go
+    from ipywidgets import widgets
+
+    assert render in ['traces', 'packed']
+
     # select a default subset of the xarray
     defaults = get_spaghetti_defaults(simulation_xr, index_coord)
+    defaults = {key: value for key, value in defaults.items() if key in simulation_xr[y_val].dims}
 
     # build widgets
     widget_dict = build_widgets(data_xr=simulation_xr, defaults=defaults)
 
-    lines = []
-    for i in simulation_xr[index_coord].values:
-        defaults[index_coord] = i
-        line = simulation_xr.sel(defaults).to_dataframe().reset_index()
-        next_line = go.Scatter(
-            x=line[x_val],
-            y=line[y_val],
-            fill=None,
-            mode='lines',
-            line_color='rgba(0, 0, 0, 0.5)',
-            showlegend=False
-        )
-        lines.append(next_line)
+    # pre-index the simulation data once, ordered (widget coordinates..., replicate, timestep)
+    cube = build_cube(simulation_xr, [y_val], list(defaults.keys()), x_val, index_coord=index_coord)
+
+    def _lines(selection):
+        replicates = cube[y_val][cube_selection(cube, selection)]
+        if plot_width is None or render == 'density':
+            return np.broadcast_to(cube['x'], replicates.shape), replicates
+
+        keep = lttb_indices(cube['x'], replicates, plot_width)
+        return cube['x'][keep], np.take_along_axis(replicates, keep, axis=-1)
+
+    if density_threshold is not None and len(simulation_xr[index_coord]) > density_threshold:
+        render = 'density'
+
+    x, replicates = _lines(defaults)
+
+    lines = spaghetti_traces(cube['x'], x, replicates, render=render, bins=bins)
 
     def _response(change):
-        selection = simulation_xr.sel({key: _value.value for key, _value in widget_dict.items()})
+        x, replicates = _lines({key: _value.value for key, _value in widget_dict.items()})
         with g.batch_update():
-            for plot_idx, sim_idx in enumerate(selection[index_coord]):
-                line = selection.sel({index_coord: sim_idx}).to_dataframe().reset_index()
-                g.data[plot_idx].y = line[y_val]
+            if render == 'density':
+                g.data[0].y, g.data[0].z = replicate_density(replicates, bins=bins)
+            elif render == 'packed':
+                g.data[0].x, g.data[0].y = pack_replicates(x, replicates)
+            else:
+                for plot_idx, (x_, y) in enumerate(zip(x, replicates)):
+                    if plot_width is not None:
+                        g.data[plot_idx].x = x_
+                    g.data[plot_idx].y = y
 
     for key, val in widget_dict.items():
         val.observe(_response, names="value")
 
-    g = go.FigureWidget(
-        data=lines,
-        layout=go.Layout(
-            plot_bgcolor='#fff',
-            yaxis_title='N',
-            font=dict(size=18)
-        )
-    )
+    g = go.FigureWidget(data=lines, layout=figure_layout(plot_width))
 
     container1 = widgets.HBox(list(widget_dict.values()))
     return widgets.VBox([container1, g])
+
+
+def interval_figure(x, upper, lower, median, plot_width=None, title=None):
+    """Create a static prediction interval plot for one selection, without widgets.
+
+    Args:
+        x (numpy.ndarray): x-axis values
+        upper (numpy.ndarray): upper prediction interval
+        lower (numpy.ndarray): lower prediction interval
+        median (numpy.ndarray): median prediction
+        plot_width (int): optional plot width in pixels used for downsampling (see :func:`interval_indices`)
+        title (str): optional plot title
+
+    Returns:
+        plotly.graph_objects.Figure
+    """
+
+    import plotly.graph_objects as go
+
+    if plot_width is not None:
+        keep = interval_indices(x, upper, lower, median, plot_width)
+        x, upper, lower, median = x[keep], upper[keep], lower[keep], median[keep]
+
+    return go.Figure(data=interval_traces(x, upper, lower, median), layout=figure_layout(plot_width, title))
+
+
+def spaghetti_figure(x, replicates, render='traces', density_threshold=None, bins=50, plot_width=None, title=None):
+    """Create a static spaghetti plot for one selection, without widgets.
+
+    Args:
+        x (numpy.ndarray): x-axis values, length ``n_steps``
+        replicates (numpy.ndarray): y-axis values with shape (``n_replicates``, ``n_steps``)
+        render (str): ``'traces'`` or ``'packed'``; see :func:`spaghetti_timeseries`
+        density_threshold (int): optional number of replicates above which a density heatmap is drawn
+        bins (int): number of y-axis bins for the density heatmap
+        plot_width (int): optional plot width in pixels used for downsampling (see :func:`lttb_indices`)
+        title (str): optional plot title
+
+    Returns:
+        plotly.graph_objects.Figure
+    """
+
+    import plotly.graph_objects as go
+
+    assert render in ['traces', 'packed']
+
+    if density_threshold is not None and replicates.shape[0] > density_threshold:
+        render = 'density'
+
+    if plot_width is None or render == 'density':
+        x_lines = np.broadcast_to(x, replicates.shape)
+    else:
+        keep = lttb_indices(x, replicates, plot_width)
+        x_lines, replicates = x[keep], np.take_along_axis(replicates, keep, axis=-1)
+
+    return go.Figure(
+        data=spaghetti_traces(x, x_lines, replicates, render=render, bins=bins),
+        layout=figure_layout(plot_width, title)
+    )
+
+
+def write_figure(fig, path, formats=('html',)):
+    """Export a figure to one file per format.
+
+    HTML files reference a shared ``plotly.min.js`` in the same directory rather than embedding it. PNG export
+    requires the ``kaleido`` package.
+
+    Args:
+        fig (plotly.graph_objects.Figure): figure to export
+        path (str): file path without extension
+        formats (list of str): any of ``'html'`` and ``'png'``
+
+    Returns:
+        list of str: paths of the written files
+    """
+
+    paths = []
+    for format_ in formats:
+        assert format_ in ['html', 'png']
+        file_path = f'{path}.{format_}'
+        if format_ == 'html':
+            fig.write_html(file_path, include_plotlyjs='directory', full_html=True)
+        else:
+            fig.write_image(file_path)
+        paths.append(file_path)
+
+    return paths
+
+
+def _report_figure(args):
+    """Build and export one figure of a batch report; run in worker processes by
+    :func:`epivislab.simhandler.EpiSummary.figure_report`."""
+
+    kind, x, arrays, path, title, formats, options = args
+    if kind == 'interval':
+        fig = interval_figure(x, *arrays, plot_width=options['plot_width'], title=title)
+    else:
+        fig = spaghetti_figure(x, *arrays, title=title, **options)
+
+    return write_figure(fig, path, formats=formats)
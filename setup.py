@@ -6,4 +6,5 @@ setup(name='epivislab',
     url='https://github.com/kellypierce/epivislab',
     author='Kelly Pierce',
     packages=['epivislab'],
+    entry_points={'console_scripts': ['epivislab=epivislab.cli:main']},
     zipsafe=False)
@@ -0,0 +1,36 @@
+import inspect
+import itertools
+import pytest
+from benchmarks import bench_summary, bench_plots
+
+
+def benchmark_cases(module):
+    # the smallest parameter combination of every benchmark in module
+    for name, cls in inspect.getmembers(module, inspect.isclass):
+        if cls.__module__ != module.__name__:
+            continue
+        params = next(itertools.product(*cls.params))
+        for method in [i for i in dir(cls) if i.startswith(('time_', 'peakmem_'))]:
+            yield pytest.param(cls, method, params, id=f'{name}.{method}')
+
+
+class TestBenchmarks:
+
+    @pytest.mark.parametrize('cls,method,params', list(benchmark_cases(bench_summary)))
+    def test_summary_benchmarks(self, cls, method, params):
+
+        benchmark = cls()
+        benchmark.setup(*params)
+        getattr(benchmark, method)(*params)
+        if hasattr(benchmark, 'teardown'):
+            benchmark.teardown(*params)
+
+    @pytest.mark.parametrize('cls,method,params', list(benchmark_cases(bench_plots)))
+    def test_plot_benchmarks(self, cls, method, params):
+
+        pytest.importorskip('geopandas')
+        benchmark = cls()
+        benchmark.setup(*params)
+        getattr(benchmark, method)(*params)
+        if hasattr(benchmark, 'teardown'):
+            benchmark.teardown(*params)
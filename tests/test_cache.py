@@ -0,0 +1,140 @@
+import os
+import shutil
+import xarray as xr
+import numpy as np
+import dask
+from numpy.testing import assert_almost_equal
+from epivislab.simhandler import EpiSummary
+from epivislab.cache import ResultCache, MemoCache, dataset_fingerprint
+import pytest
+
+
+@pytest.fixture
+def simulation_store(tmp_path):
+    path = str(tmp_path / 'test_sim_2.zarr')
+    shutil.copytree('tests/data/test_sim_2.zarr', path)
+    return path
+
+
+def make_summary(path, cache_dir, **kwargs):
+    return EpiSummary(
+        simulation=xr.open_zarr(path),
+        state_coord=['compt'],
+        within_sim_coord=['age', 'risk', 'vertex'],
+        time_coord=['step'],
+        between_sim_coord=['index'],
+        measured_coord=['compt_model__state'],
+        cache_dir=cache_dir,
+        **kwargs
+    )
+
+
+class TestResultCache:
+
+    def test_cache_hit(self, simulation_store, tmp_path, monkeypatch):
+
+        cache_dir = str(tmp_path / 'cache')
+        groupers = ['compt', 'vertex', 'step']
+
+        first = make_summary(simulation_store, cache_dir)
+        expected = first.prediction_interval(groupers, 'compt_model__state', upper=0.95, lower=0.05)
+        assert len(first.cache.entries()) == 1
+
+        # a new handler on the same store reads the result without summing
+        second = make_summary(simulation_store, cache_dir)
+        assert second.fingerprint == first.fingerprint
+
+        def _fail(*args, **kwargs):
+            raise AssertionError('cache miss')
+
+        # neither the frame nor any sum is built, and no dask graph is computed
+        for method in ['make_chunks', '_dd_sum', '_xr_sum']:
+            monkeypatch.setattr(second, method, _fail)
+        with dask.config.set(scheduler=_fail):
+            cached = second.prediction_interval(groupers, 'compt_model__state', upper=0.95, lower=0.05)
+
+        for var in ['upper', 'lower', 'median']:
+            assert_almost_equal(cached[var].values, expected[var].values)
+
+        # different parameters are a different key
+        monkeypatch.undo()
+        second.xr_sum_over_groups(groupers + ['index'], 'compt_model__state')
+        assert len(second.cache.entries()) == 2
+
+        assert len(second.invalidate_cache()) == 2
+        assert second.cache.entries() == []
+
+    def test_subset_fingerprint(self, simulation_store, tmp_path):
+
+        cache_dir = str(tmp_path / 'cache')
+        groupers = ['compt', 'vertex', 'step']
+        full = make_summary(simulation_store, cache_dir)
+        full.prediction_interval(groupers, 'compt_model__state', upper=0.95, lower=0.05)
+
+        # a subset keeps encoding['source'] but is a different dataset
+        roles = dict(
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state']
+        )
+        subset_data = xr.open_zarr(simulation_store).isel(index=slice(0, 5))
+        subset = EpiSummary(simulation=subset_data, cache_dir=cache_dir, **roles)
+        assert subset.simulation.encoding['source'] == full.simulation.encoding['source']
+        assert subset.fingerprint != full.fingerprint
+
+        expected = EpiSummary(simulation=subset_data, **roles).prediction_interval(
+            groupers, 'compt_model__state', upper=0.95, lower=0.05
+        )
+        result = subset.prediction_interval(groupers, 'compt_model__state', upper=0.95, lower=0.05)
+        for var in ['upper', 'lower', 'median']:
+            assert_almost_equal(result[var].values, expected[var].transpose(*result[var].dims).values)
+
+        # selecting fewer data variables is also a different dataset
+        assert dataset_fingerprint(xr.open_zarr(simulation_store)[['compt_model__state']]) != full.fingerprint
+
+    def test_fingerprint_changes_with_store(self, simulation_store):
+
+        before = dataset_fingerprint(xr.open_zarr(simulation_store))
+        assert before == dataset_fingerprint(xr.open_zarr(simulation_store))
+
+        chunk = os.path.join(simulation_store, 'compt_model__state', '0.0.0.0.0.0')
+        stat = os.stat(chunk)
+        os.utime(chunk, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        assert before != dataset_fingerprint(xr.open_zarr(simulation_store))
+
+    def test_eviction(self, tmp_path):
+
+        cache = ResultCache(directory=str(tmp_path / 'cache'))
+        data = xr.Dataset({'value': ('x', np.arange(1000.0))})
+        for i in range(3):
+            cache.put(cache.key('abc', i=i), data)
+            os.utime(os.path.join(cache.directory, f"{cache.key('abc', i=i)}.zarr"), (i, i))
+
+        sizes = [size for _, size in cache.entries()]
+        assert len(sizes) == 3
+
+        # the least recently used result is evicted first
+        cache.get(cache.key('abc', i=0))
+        cache.max_bytes = sum(sizes) - 1
+        assert cache.evict() == [cache.key('abc', i=1)]
+        assert cache.get(cache.key('abc', i=1)) is None
+        assert_almost_equal(cache.get(cache.key('abc', i=0))['value'].values, data['value'].values)
+
+
+class TestMemoCache:
+
+    def test_lru(self):
+
+        memo = MemoCache(max_bytes=10)
+        assert memo.put('a', 1, nbytes=4)
+        assert memo.put('b', 2, nbytes=4)
+        assert memo.get('a') == 1
+        assert memo.put('c', 3, nbytes=4)
+
+        # 'b' was least recently used
+        assert memo.get('b') is None
+        assert memo.get('c') == 3
+        assert not memo.put('d', 4, nbytes=11)
+        assert memo.info() == {'hits': 2, 'misses': 1, 'evictions': 1, 'entries': 2, 'nbytes': 8}
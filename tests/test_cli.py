@@ -0,0 +1,31 @@
+import xarray as xr
+from epivislab.cli import main
+
+
+def test_summarize(tmp_path):
+
+    output = str(tmp_path / 'summary.zarr')
+    status = main([
+        'summarize', 'tests/data/test_sim_2.zarr', '--output', output, '--groupers', 'compt', 'step',
+        '--quantiles', '0.1', '0.9', '--chunk-bytes', '4KiB', '--scheduler', 'synchronous'
+    ])
+    assert status == 0
+
+    summary = xr.open_zarr(output)
+    assert set(summary.data_vars) == {'sum', 'quantile_value'}
+    assert list(summary['quantile'].values) == [0.1, 0.9]
+    assert set(summary['quantile_value'].dims) == {'compt', 'step', 'quantile'}
+
+
+def test_summarize_peak_statistics(tmp_path):
+
+    output = str(tmp_path / 'summary.zarr')
+    status = main([
+        'summarize', 'tests/data/test_sim_2.zarr', '--output', output, '--groupers', 'compt', 'step',
+        '--statistics', 'peak_time', '--scheduler', 'synchronous'
+    ])
+    assert status == 0
+
+    summary = xr.open_zarr(output)
+    assert set(summary.data_vars) == {'sum', 'quantile_value', 'peak_time'}
+    assert set(summary['peak_time'].dims) == {'compt', 'quantile'}
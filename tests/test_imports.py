@@ -0,0 +1,35 @@
+import sys
+import json
+import subprocess
+
+HEAVY = ['plotly', 'ipywidgets', 'geopandas', 'xsimlab']
+
+
+def import_report(module):
+    # import in a fresh interpreter, reporting which heavy modules were loaded and the import time
+    code = (
+        'import sys, time, json; start = time.perf_counter(); '
+        f'import {module}; '
+        'elapsed = time.perf_counter() - start; '
+        f'print(json.dumps({{"elapsed": elapsed, "loaded": [i for i in {HEAVY!r} if i in sys.modules]}}))'
+    )
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+
+    return json.loads(output.strip().splitlines()[-1])
+
+
+class TestImports:
+
+    def test_statistics_without_visualization(self):
+
+        for module in ['epivislab', 'epivislab.simhandler', 'epivislab.stats', 'epivislab.streaming',
+                       'epivislab.cache', 'epivislab.timeseries']:
+            report = import_report(module)
+            assert report['loaded'] == [], f'{module} imports {report["loaded"]}'
+
+    def test_import_time(self):
+
+        # the statistics API should not take longer to import than its own dependencies
+        baseline = import_report('xarray, dask.dataframe')['elapsed']
+        report = import_report('epivislab.simhandler')
+        assert report['elapsed'] < 2 * baseline + 0.5
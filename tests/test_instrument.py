@@ -0,0 +1,69 @@
+import logging
+import xarray as xr
+import pytest
+from epivislab import instrument
+from epivislab.simhandler import EpiSummary
+
+
+@pytest.fixture
+def simulation_data():
+    return xr.open_zarr('tests/data/test_sim_2.zarr')
+
+
+def summary(simulation_data):
+    return EpiSummary(
+        simulation=simulation_data,
+        state_coord=['compt'],
+        within_sim_coord=['age', 'risk', 'vertex'],
+        time_coord=['step'],
+        between_sim_coord=['index'],
+        measured_coord=['compt_model__state']
+    )
+
+
+class TestInstrument:
+
+    def test_span(self):
+
+        seen = []
+        with instrument.collect(callback=seen.append) as records:
+            with instrument.span('sum', rows_in=10) as record:
+                record['rows_out'] = 2
+        with instrument.span('quantile'):
+            pass
+
+        assert len(records) == 1
+        assert seen == records
+        assert records[0]['stage'] == 'sum'
+        assert records[0]['rows_in'] == 10
+        assert records[0]['rows_out'] == 2
+        assert records[0]['seconds'] >= 0
+        assert not instrument.enabled()
+
+    def test_stages(self, simulation_data):
+
+        with instrument.collect() as records:
+            sims_xr = summary(simulation_data)
+            sims_xr.prediction_interval(['compt', 'vertex', 'step'], 'compt_model__state', upper=0.95, lower=0.05)
+            sims_xr.prediction_interval(['compt', 'vertex', 'step'], 'compt_model__state', upper=0.9, lower=0.1)
+
+        stages = [i['stage'] for i in records]
+        for stage in ['validate', 'chunk', 'sum', 'quantile', 'to_xarray', 'merge']:
+            assert stage in stages
+
+        sums = [i for i in records if i['stage'] == 'sum']
+        assert len(sums) == 1
+        assert sums[0]['tasks'] > 0
+        assert sums[0]['rows_out'] == 9 * 22 * 10
+        assert sums[0]['bytes_in'] == simulation_data['compt_model__state'].nbytes
+
+        memo = [i for i in records if i['stage'] == 'cache' and i['name'] == 'sum_over_groups']
+        assert [i['hit'] for i in memo] == [False, True]
+
+    def test_logging(self, simulation_data, caplog):
+
+        with caplog.at_level(logging.DEBUG, logger='epivislab'):
+            summary(simulation_data).xr_sum_over_groups(['compt', 'index'], 'compt_model__state')
+
+        assert any(['Summing' in i.getMessage() for i in caplog.records])
+        assert any([i.getMessage().startswith('sum: ') for i in caplog.records])
@@ -0,0 +1,171 @@
+import xarray as xr
+import numpy as np
+from numpy.testing import assert_almost_equal
+import pandas as pd
+from datetime import datetime
+import pytest
+
+gpd = pytest.importorskip('geopandas')
+shapely_geometry = pytest.importorskip('shapely.geometry')
+maps = pytest.importorskip('epivislab.maps')
+
+
+@pytest.fixture
+def spatial_data():
+    rng = np.random.default_rng(1)
+    vertices = [48001.0, 48003.0, 48005.0, 48007.0]
+    coords = {
+        'compartment': ['S', 'Ih'],
+        'risk_group': ['low', 'high'],
+        'age_group': ['0-4', '5-17', '65+'],
+        'vertex': vertices,
+        'step': pd.date_range('2020-03-01', periods=30),
+    }
+    counts = xr.DataArray(
+        rng.poisson(5, size=[len(i) for i in coords.values()]).astype(float),
+        coords=coords,
+        dims=list(coords.keys()),
+        name='apply_counts_delta__counts'
+    )
+
+    # one vertex has no matching shape
+    shape = gpd.GeoDataFrame(
+        {
+            'GEOID10': ['48001', '48003', '48005'],
+            'geometry': [shapely_geometry.box(i, i, i + 1, i + 2) for i in range(3)],
+        },
+        crs='EPSG:4326'
+    )
+
+    return counts, shape
+
+
+@pytest.fixture
+def burden_data(spatial_data):
+    counts, shape = spatial_data
+    df = maps.spatial_simulation(counts, shape, 'Ih')
+    df['group_pop'] = 1000.0
+    df['burden_per_10k'] = df['apply_counts_delta__counts'] / df['group_pop'] * 10000
+    df['burden_per_10k_str'] = [str(round(i, 2)) for i in df['burden_per_10k']]
+    df['marker_size'] = 10 + df['burden_per_10k'] / 100
+
+    return df
+
+
+def reference_spatial_simulation(xr_array, shape, compartment):
+    # row-wise implementation retained to check the vectorized version
+    xr_compt = xr_array.sel({'compartment': compartment}).sum(dim=['risk_group', 'age_group'])
+    df_compt = xr_compt.to_dataframe().reset_index()
+    df_compt['vertex'] = [str(int(i)) for i in df_compt['vertex']]
+    df_compt['date'] = [datetime.strftime(pd.to_datetime(i), '%Y-%m-%d') for i in df_compt['step']]
+    df_shape = gpd.GeoDataFrame(
+        pd.merge(df_compt, shape, left_on='vertex', right_on='GEOID10', how='left'),
+        crs=shape.crs
+    )
+    df_shape['lon'] = [i.centroid.coords[0][0] if i else None for i in df_shape['geometry']]
+    df_shape['lat'] = [i.centroid.coords[0][1] if i else None for i in df_shape['geometry']]
+
+    return df_shape
+
+
+class TestMaps:
+
+    def test_spatial_simulation(self, spatial_data):
+
+        counts, shape = spatial_data
+        result = maps.spatial_simulation(counts, shape, 'Ih')
+        expected = reference_spatial_simulation(counts, shape, 'Ih')
+
+        assert len(result) == len(expected)
+        assert result.crs == expected.crs
+        for col in ['vertex', 'date', 'GEOID10']:
+            assert list(result[col].fillna('')) == list(expected[col].fillna(''))
+        for col in ['apply_counts_delta__counts', 'lon', 'lat']:
+            assert_almost_equal(result[col].astype(float).values, expected[col].astype(float).values)
+        assert result['geometry'].isna().sum() == 30
+
+    def test_burden_plot_frames(self, burden_data):
+
+        df = burden_data
+        fig = maps.make_burden_plot(df, '2020-03-05', '2020-03-20', token='test-token')
+        assert len(fig.frames) == 16
+
+        for k, date in enumerate(pd.date_range('2020-03-05', '2020-03-20').strftime('%Y-%m-%d')):
+            frame = fig.frames[k]
+            rows = df[df['date'] == date]
+            assert_almost_equal(np.array(frame.data[0].marker.color), rows['burden_per_10k'].values)
+            assert_almost_equal(np.array(frame.data[0].lat, dtype=float), rows['lat'].astype(float).values)
+            expected = rows['apply_counts_delta__counts'].sum() / rows['group_pop'].sum() * 10000
+            assert_almost_equal(frame.data[2].y[0], expected)
+            assert frame.data[2].x[0] == date
+
+        parallel = maps.make_burden_plot(df, '2020-03-05', '2020-03-20', token='test-token', processes=2)
+        assert parallel.to_json() == fig.to_json()
+
+    def test_burden_plot_delta_frames(self, burden_data):
+
+        df = burden_data
+        full = maps.make_burden_plot(df, '2020-03-01', '2020-03-30', token='test-token')
+        delta = maps.make_burden_plot(df, '2020-03-01', '2020-03-30', token='test-token', frame_mode='delta')
+        assert len(delta.frames) == len(full.frames)
+        assert len(delta.to_json()) < len(full.to_json())
+
+        # geometry is only in the base trace
+        assert len(delta.data[0].lat) == 4
+        for k, frame in enumerate(delta.frames):
+            assert frame.traces == (0, 2)
+            assert frame.data[0].lat is None
+            assert_almost_equal(np.array(frame.data[0].marker.color), np.array(full.frames[k].data[0].marker.color))
+            assert frame.data[1].y == full.frames[k].data[2].y
+
+    def test_simplified_geojson_cache(self, spatial_data, tmp_path):
+
+        _, shape = spatial_data
+        geojson = maps.simplified_geojson(shape, 0.01, cache_dir=str(tmp_path))
+        assert [i['id'] for i in geojson['features']] == ['48001', '48003', '48005']
+        assert len(list(tmp_path.iterdir())) == 1
+
+        # cached GeoJSON is reused for the same geometries and tolerance
+        assert maps.simplified_geojson(shape, 0.01, cache_dir=str(tmp_path)) == geojson
+        maps.simplified_geojson(shape, 0.1, cache_dir=str(tmp_path))
+        assert len(list(tmp_path.iterdir())) == 2
+
+        path = str(tmp_path / 'shape.shp')
+        shape.to_file(path)
+        assert maps.shape_fingerprint(path) == maps.shape_fingerprint(path)
+        assert maps.simplified_geojson(path, 0.01)['features'][0]['id'] == '48001'
+
+        assert maps.zoom_tolerance({0: 0.1, 8: 0.01, 12: 0.001}, 8.5) == 0.01
+        assert maps.zoom_tolerance({8: 0.01}, 4) == 0.01
+
+    def test_burden_plot_choropleth(self, spatial_data, burden_data, tmp_path):
+
+        _, shape = spatial_data
+        df = burden_data
+        markers = maps.make_burden_plot(df, '2020-03-01', '2020-03-30', token='test-token')
+        fig = maps.make_burden_plot(
+            df, '2020-03-01', '2020-03-30', token='test-token', map_mode='choropleth',
+            geometry_cache_dir=str(tmp_path)
+        )
+        assert fig.data[0].type == 'choroplethmapbox'
+        assert len(fig.data[0].geojson['features']) == 3
+        assert list(fig.data[0].locations) == ['48001', '48003', '48005', '48007']
+        for k, frame in enumerate(fig.frames):
+            assert frame.traces == (0, 2)
+            assert frame.data[0].geojson is None
+            assert frame.data[0].locations is None
+            assert_almost_equal(np.array(frame.data[0].z), np.array(markers.frames[k].data[0].marker.color))
+
+        # the map fits the vertex geometries
+        center, zoom = maps.bounds_zoom(shape.total_bounds)
+        assert fig.layout.mapbox.zoom == zoom
+        assert_almost_equal([fig.layout.mapbox.center.lon, fig.layout.mapbox.center.lat], [1.5, 2.0], decimal=2)
+
+        # projected geometries are drawn in longitude and latitude
+        projected = df.to_crs(3857)
+        reprojected = maps.make_burden_plot(
+            projected, '2020-03-01', '2020-03-30', token='test-token', map_mode='choropleth', tolerance=0
+        )
+        assert reprojected.layout.mapbox.zoom == fig.layout.mapbox.zoom
+        bounds = gpd.GeoDataFrame.from_features(reprojected.data[0].geojson['features']).total_bounds
+        assert_almost_equal(bounds, shape.total_bounds)
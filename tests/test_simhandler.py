@@ -2,8 +2,10 @@ import xarray as xr
 import numpy as np
 from numpy.testing import assert_almost_equal
 import pandas as pd
+import dask
 import dask.dataframe as dd
 from epivislab.simhandler import SimHandler, EpiSummary
+from epivislab import instrument
 import pytest
 
 
@@ -106,4 +108,569 @@ class TestEpiSummary:
 
         # check concordance between dask and pandas workflows
         assert_almost_equal(min(regress['diff']), 0.0)
-        assert_almost_equal(max(regress['diff']), 0.0)
\ No newline at end of file
+        assert_almost_equal(max(regress['diff']), 0.0)
+
+    def test_quantiles_between_groups(self, simulation_data, quantile_groupers):
+
+        sims_xr = EpiSummary(
+            simulation=simulation_data,
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state']
+        )
+
+        quantile_values = [0.05, 0.5, 0.95]
+        grp_q = sims_xr.quantiles_between_sims(quantile_groupers, 'compt_model__state', quantile_values)
+        grp_q = grp_q.to_dataframe().reset_index()
+
+        # calculate sum, then calculate the quantiles in pandas
+        sum_before_median_groups = quantile_groupers + ['index']
+        sims_pd = sims_xr.sum_over_groups(sum_before_median_groups, 'compt_model__state').compute().reset_index()
+        sims_pd_quantile = sims_pd.groupby(quantile_groupers)['compt_model__state'].quantile(quantile_values)
+        sims_pd_quantile = sims_pd_quantile.rename_axis(quantile_groupers + ['quantile']).reset_index()
+
+        # combine and check differences
+        regress = pd.merge(
+            sims_pd_quantile,
+            grp_q,
+            on=quantile_groupers + ['quantile'],
+            how='outer'
+        )
+        regress['diff'] = regress['compt_model__state_x'] - regress['compt_model__state_y']
+
+        # check concordance between dask and pandas workflows
+        assert len(regress) == len(sims_pd_quantile)
+        assert_almost_equal(min(regress['diff']), 0.0)
+        assert_almost_equal(max(regress['diff']), 0.0)
+
+    def test_prediction_interval(self, simulation_data):
+
+        sims_xr = EpiSummary(
+            simulation=simulation_data,
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state']
+        )
+
+        groupers = ['compt', 'vertex', 'step']
+        interval = sims_xr.prediction_interval(groupers, 'compt_model__state', upper=0.95, lower=0.05)
+
+        assert set(interval.data_vars) == {'upper', 'lower', 'median'}
+        assert set(interval.dims) == set(groupers)
+
+        median = sims_xr.quantile_between_sims(groupers, 'compt_model__state', 0.5).compute()
+        median = median.set_index(groupers)['value'].to_xarray()
+        assert_almost_equal(interval['median'].transpose(*median.dims).values, median.values)
+        assert (interval['upper'] >= interval['lower']).all()
+
+    def test_xr_sum_over_groups(self, simulation_data, sum_groupers):
+
+        sims_xr = EpiSummary(
+            simulation=simulation_data,
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state']
+        )
+
+        groupers = sum_groupers + ['step']
+        grp_sum = sims_xr.xr_sum_over_groups(groupers, 'compt_model__state')
+        assert list(grp_sum['compt_model__state'].dims) == groupers
+
+        grp_sum = grp_sum.to_dataframe().reset_index()
+        dd_sum = sims_xr.sum_over_groups(groupers, 'compt_model__state').compute().reset_index()
+
+        regress = pd.merge(dd_sum, grp_sum, on=groupers, how='outer')
+        regress['diff'] = regress['compt_model__state_x'] - regress['compt_model__state_y']
+
+        assert len(regress) == len(dd_sum)
+        assert_almost_equal(min(regress['diff']), 0.0)
+        assert_almost_equal(max(regress['diff']), 0.0)
+
+    def test_xarray_backend_quantiles(self, simulation_data, quantile_groupers):
+
+        sims_xr = EpiSummary(
+            simulation=simulation_data,
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state']
+        )
+
+        quantile_values = [0.05, 0.5, 0.95]
+        dd_q = sims_xr.quantiles_between_sims(quantile_groupers, 'compt_model__state', quantile_values)
+        xr_q = sims_xr.quantiles_between_sims(quantile_groupers, 'compt_model__state', quantile_values, backend='xarray')
+
+        assert set(xr_q['compt_model__state'].dims) == set(quantile_groupers + ['quantile'])
+        xr_q = xr_q.reindex_like(dd_q)
+        assert not xr_q['compt_model__state'].isnull().any()
+        assert_almost_equal(
+            xr_q['compt_model__state'].transpose(*dd_q['compt_model__state'].dims).values,
+            dd_q['compt_model__state'].values
+        )
+
+    def test_plan_chunks(self, simulation_data, caplog):
+
+        sims_xr = EpiSummary(
+            simulation=simulation_data,
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state']
+        )
+
+        # the long-format frame and its chunk plan are only built on first use
+        assert sims_xr.chunk_plan is None
+        sims_xr.chunk_sim
+
+        # the zarr store is a single chunk, which fits the default budget
+        assert sims_xr.chunk_plan['source'] == 'existing'
+        assert sims_xr.chunk_plan['n_chunks'] == 1
+        assert not sims_xr.chunk_plan['over_budget']
+
+        # the largest coordinate (22 steps) is split first, in divisors of its on-disk chunk
+        plan = sims_xr.plan_chunks(chunk_bytes=250000)
+        assert plan['source'] == 'planned'
+        assert plan['chunks']['step'] == 2
+        assert all([plan['chunks'][i] == len(simulation_data[i]) for i in sims_xr.all_coords if i != 'step'])
+        assert plan['n_chunks'] == 11
+
+        # a budget smaller than one age slice splits several coordinates; the plan matches the built frame
+        age_slice = plan['row_bytes'] * int(np.prod([len(simulation_data[i]) for i in sims_xr.all_coords])) // 5
+        for data in [simulation_data, simulation_data.load()]:
+            small = EpiSummary(
+                simulation=data,
+                state_coord=['compt'],
+                within_sim_coord=['age', 'risk', 'vertex'],
+                time_coord=['step'],
+                between_sim_coord=['index'],
+                measured_coord=['compt_model__state'],
+                chunk_bytes=10000
+            )
+            plan = small.plan_chunks()
+            assert plan['bytes_per_chunk'] <= 10000 < age_slice
+            assert not plan['over_budget']
+            assert plan['chunks']['index'] == len(simulation_data['index'])
+
+            partitions = small.chunk_sim.map_partitions(len).compute()
+            assert small.chunk_sim.npartitions == small.chunk_plan['n_chunks'] == plan['n_chunks'] > 1
+            assert partitions.max() * plan['row_bytes'] == small.chunk_plan['bytes_per_chunk'] <= 10000
+
+            # planned chunking does not change the long-format data
+            assert_almost_equal(
+                small.chunk_sim['compt_model__state'].sum().compute(),
+                sims_xr.chunk_sim['compt_model__state'].sum().compute()
+            )
+            pd.testing.assert_frame_equal(
+                small.chunk_sim.compute().sort_values(sims_xr.all_coords).reset_index(drop=True),
+                sims_xr.chunk_sim.compute().sort_values(sims_xr.all_coords).reset_index(drop=True)
+            )
+
+        # replicate vectors are never split, even if one is over budget
+        with caplog.at_level('WARNING', logger='epivislab.simhandler'):
+            plan = small.plan_chunks(chunk_bytes=100)
+        assert plan['over_budget']
+        assert plan['bytes_per_chunk'] == plan['row_bytes'] * len(simulation_data['index'])
+        assert 'exceed the budget' in caplog.text
+
+    def test_compact_frame(self, simulation_data):
+
+        # whole-number counts survive float32 storage
+        counts = simulation_data.assign(compt_model__state=simulation_data['compt_model__state'].round()).load()
+        kwargs = dict(
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state']
+        )
+        compact = EpiSummary(simulation=counts, **kwargs)
+        plain = EpiSummary(simulation=counts, compact=False, **kwargs)
+
+        dtypes = compact.chunk_sim.dtypes
+        assert all([isinstance(dtypes[i], pd.CategoricalDtype) for i in ['age', 'risk', 'vertex', 'compt']])
+        assert dtypes['compt_model__state'] == np.float32
+        assert plain.chunk_sim.dtypes['compt'] == object
+
+        # fractional values are not downcast
+        fractional = simulation_data.load()
+        assert EpiSummary(simulation=fractional, **kwargs).value_dtypes()['compt_model__state'] == np.float64
+
+        # lazy values are narrowed from their on-disk dtype without reading them
+        lazy = counts.chunk({'index': 1})
+
+        def no_compute(*args, **kwargs):
+            raise AssertionError('value_dtypes read lazy values')
+        with dask.config.set(scheduler=no_compute):
+            assert EpiSummary(simulation=lazy, **kwargs).value_dtypes()['compt_model__state'] == np.float64
+            lazy['compt_model__state'].encoding['dtype'] = np.dtype(np.int16)
+            assert EpiSummary(simulation=lazy, **kwargs).value_dtypes()['compt_model__state'] == np.float32
+            lazy['compt_model__state'].encoding['dtype'] = np.dtype(np.int32)
+            assert EpiSummary(simulation=lazy, **kwargs).value_dtypes()['compt_model__state'] == np.float64
+
+        groupers = ['compt', 'vertex', 'step', 'index']
+        compact_sum = compact.sum_over_groups(groupers, 'compt_model__state').compute().sort_index()
+        plain_sum = plain.sum_over_groups(groupers, 'compt_model__state').compute().sort_index()
+        pd.testing.assert_series_equal(compact_sum, plain_sum)
+
+        compact_q = compact.quantiles_between_sims(['compt', 'vertex'], 'compt_model__state', [0.05, 0.5])
+        plain_q = plain.quantiles_between_sims(['compt', 'vertex'], 'compt_model__state', [0.05, 0.5])
+        assert compact_q['compt'].dtype == object
+        xr.testing.assert_allclose(compact_q, plain_q)
+
+    def test_lazy_chunks(self, simulation_data):
+
+        sims_xr = EpiSummary(
+            simulation=simulation_data,
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state']
+        )
+        assert sims_xr._chunk_sims == {}
+
+        # frames are cached per set of measured coordinates
+        assert sims_xr.chunk_sim is sims_xr.chunk_sim
+        assert sims_xr.make_chunks(measured='compt_model__state') is sims_xr.chunk_sim
+        assert list(sims_xr.chunk_sim.columns) == sims_xr.all_coords + ['compt_model__state']
+
+    def test_memoized_sums(self, simulation_data):
+
+        sims_xr = EpiSummary(
+            simulation=simulation_data,
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state']
+        )
+
+        groupers = ['compt', 'vertex', 'step']
+        sims_xr.quantile_between_sims(groupers, 'compt_model__state', 0.5)
+        sims_xr.prediction_interval(groupers, 'compt_model__state', upper=0.95, lower=0.05)
+        assert sims_xr.memo.info()['misses'] == 1
+        assert sims_xr.memo.info()['hits'] == 1
+
+        # grouper order does not matter for the memo
+        first = sims_xr.xr_sum_over_groups(['step', 'compt', 'vertex', 'index'], 'compt_model__state')
+        second = sims_xr.xr_sum_over_groups(['compt', 'vertex', 'step', 'index'], 'compt_model__state')
+        assert list(second['compt_model__state'].dims) == ['compt', 'vertex', 'step', 'index']
+        assert_almost_equal(first['compt_model__state'].transpose(*second['compt_model__state'].dims).values, second['compt_model__state'].values)
+        assert sims_xr.memo.info()['hits'] == 2
+
+    @pytest.mark.parametrize('backend', ['dataframe', 'xarray'])
+    def test_rollup(self, simulation_data, backend):
+
+        kwargs = dict(
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state']
+        )
+        sims_xr = EpiSummary(simulation=simulation_data, **kwargs)
+        direct = EpiSummary(simulation=simulation_data, **kwargs)
+
+        levels = [['compt', 'age', 'vertex'], ['compt', 'risk', 'vertex'], ['compt', 'vertex']]
+        with instrument.collect() as records:
+            rollup = sims_xr.rollup(levels, 'compt_model__state', backend=backend)
+        assert list(rollup) == [tuple(level + ['index']) for level in levels]
+
+        # the finest sum is the only one read from the simulation; coarser levels use the smallest parent
+        parents = {tuple(i['groupers']): i['parent'] for i in records if i['stage'] == 'sum'}
+        assert parents[('age', 'risk', 'vertex', 'compt', 'index')] is None
+        assert parents[('compt', 'age', 'vertex', 'index')] == ['age', 'compt', 'index', 'risk', 'vertex']
+        assert parents[('compt', 'vertex', 'index')] in [
+            ['age', 'compt', 'index', 'vertex'], ['compt', 'index', 'risk', 'vertex']
+        ]
+
+        for level, rolled in rollup.items():
+            if backend == 'dataframe':
+                expected = direct.sum_over_groups(list(level), 'compt_model__state').compute().sort_index()
+                pd.testing.assert_series_equal(rolled.compute().sort_index(), expected)
+            else:
+                expected = direct.xr_sum_over_groups(list(level), 'compt_model__state')
+                xr.testing.assert_allclose(rolled, expected)
+
+        # any coarser grouping is also taken from the rollup
+        with instrument.collect() as records:
+            if backend == 'dataframe':
+                sims_xr.sum_over_groups(['risk', 'index'], 'compt_model__state')
+            else:
+                sims_xr.xr_sum_over_groups(['risk', 'index'], 'compt_model__state')
+        assert [i['parent'] for i in records if i['stage'] == 'sum'] == [['compt', 'index', 'risk', 'vertex']]
+
+    @pytest.mark.parametrize('backend', ['dataframe', 'xarray'])
+    def test_rollup_prediction_interval(self, simulation_data, backend):
+
+        sims_xr = EpiSummary(
+            simulation=simulation_data,
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state']
+        )
+
+        with instrument.collect() as records:
+            sims_xr.rollup([['compt', 'age', 'vertex', 'step'], ['compt', 'vertex', 'step']], 'compt_model__state',
+                           backend=backend)
+        assert [i['stage'] for i in records].count('rollup') == 1
+
+        # a rolled-up level is not summed again
+        with instrument.collect() as records:
+            sims_xr.prediction_interval(['compt', 'vertex', 'step'], 'compt_model__state', upper=0.95, lower=0.05,
+                                        backend=backend)
+        assert [i for i in records if i['stage'] == 'sum'] == []
+
+        # a coarser level is summed from the rollup, not the simulation
+        with instrument.collect() as records:
+            sims_xr.prediction_interval(['compt', 'step'], 'compt_model__state', upper=0.95, lower=0.05,
+                                        backend=backend)
+        assert [i['parent'] for i in records if i['stage'] == 'sum'] == [['compt', 'index', 'step', 'vertex']]
+
+    def test_memo_aggcol_forms(self, simulation_data):
+
+        sims_xr = EpiSummary(
+            simulation=simulation_data,
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state']
+        )
+        groupers = ['compt', 'vertex', 'step']
+
+        # a name and a single-item list share one memoized sum
+        by_name = sims_xr.sum_over_groups(groupers + ['index'], 'compt_model__state')
+        by_list = sims_xr.sum_over_groups(groupers + ['index'], ['compt_model__state'])
+        assert isinstance(by_name, dd.Series) and isinstance(by_list, dd.DataFrame)
+        assert_almost_equal(by_name.compute().values, by_list['compt_model__state'].compute().values)
+        sims_xr.prediction_interval(groupers, 'compt_model__state', upper=0.95, lower=0.05, backend='dataframe')
+        assert sims_xr.memo.info()['entries'] == 1
+        assert sims_xr.memo.info()['hits'] == 2
+
+        sims_xr.xr_sum_over_groups(groupers + ['index'], 'compt_model__state')
+        sims_xr.ensemble_stats(groupers, ['compt_model__state'], ['mean'])
+        assert sims_xr.memo.info()['entries'] == 2
+        assert sims_xr.memo.info()['hits'] == 3
+
+        # an interval plot and a grouped spaghetti plot of the same grouping sum once
+        plots = EpiSummary(
+            simulation=simulation_data,
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state']
+        )
+        plots.interval_plot(groupers, 'compt_model__state', upper=0.95, lower=0.05)
+        plots.spaghetti_plot(groupers=groupers + ['index'], aggcol='compt_model__state')
+        assert plots.memo.info()['misses'] == 1
+        assert plots.memo.info()['hits'] == 1
+
+    def test_memo_cap(self, simulation_data):
+
+        sims_xr = EpiSummary(
+            simulation=simulation_data,
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state'],
+            memo_max_bytes=20000
+        )
+
+        # each summed intermediate is 9 x 1 x 22 x 10 float64 values
+        sims_xr.xr_sum_over_groups(['compt', 'vertex', 'step', 'index'], 'compt_model__state')
+        sims_xr.xr_sum_over_groups(['compt', 'step', 'index'], 'compt_model__state')
+        assert sims_xr.memo.info()['entries'] == 1
+        assert sims_xr.memo.info()['evictions'] == 1
+        assert sims_xr.memo.nbytes <= 20000
+
+    def test_sketch_quantiles(self, simulation_data):
+
+        sims_xr = EpiSummary(
+            simulation=simulation_data.chunk({'index': 3}),
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state']
+        )
+
+        groupers = ['compt', 'vertex', 'step']
+        exact = sims_xr.quantiles_between_sims(groupers, 'compt_model__state', [0.05, 0.5, 0.95], backend='xarray')
+
+        # the sketch is exact while the number of replicates is within its capacity
+        sketch = sims_xr.quantiles_between_sims(
+            groupers, 'compt_model__state', [0.05, 0.5, 0.95], backend='xarray', method='sketch'
+        )
+        assert_almost_equal(sketch['compt_model__state'].values, exact['compt_model__state'].values)
+
+        # with a small capacity the median rank error is within the documented bound
+        sketch = sims_xr.quantiles_between_sims(
+            groupers, 'compt_model__state', [0.5], backend='xarray', method='sketch', k=4
+        )
+        values = np.sort(sims_xr.xr_sum_over_groups(groupers + ['index'], 'compt_model__state')['compt_model__state'].values, axis=-1)
+        bound = int(np.ceil(10 * np.log2(10 / 4) / 4))
+        estimate = sketch['compt_model__state'].values[..., 0]
+        assert np.all(estimate >= values[..., max(4 - bound, 0)])
+        assert np.all(estimate <= values[..., min(5 + bound, 9)])
+
+        with pytest.raises(AssertionError):
+            sims_xr.quantiles_between_sims(groupers, 'compt_model__state', [0.5], method='sketch')
+
+    @pytest.mark.parametrize('scheduler', ['synchronous', 'processes'])
+    def test_scheduler(self, simulation_data, scheduler):
+
+        expected = EpiSummary(
+            simulation=simulation_data,
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state']
+        ).prediction_interval(['compt', 'vertex', 'step'], 'compt_model__state', upper=0.95, lower=0.05)
+
+        sims_xr = EpiSummary(
+            simulation=simulation_data,
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state'],
+            scheduler=scheduler,
+            num_workers=2
+        )
+        for backend in ['dataframe', 'xarray']:
+            interval = sims_xr.prediction_interval(
+                ['compt', 'vertex', 'step'], 'compt_model__state', upper=0.95, lower=0.05, backend=backend
+            )
+            median = interval['median'].reindex_like(expected['median']).transpose(*expected['median'].dims)
+            assert_almost_equal(median.values, expected['median'].values)
+
+    def test_distributed(self, simulation_data):
+
+        pytest.importorskip('distributed')
+        sims_xr = EpiSummary(
+            simulation=simulation_data,
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state'],
+            scheduler='distributed',
+            cluster_kwargs={'n_workers': 1, 'processes': False, 'dashboard_address': None}
+        )
+        try:
+            interval = sims_xr.prediction_interval(
+                ['compt', 'vertex', 'step'], 'compt_model__state', upper=0.95, lower=0.05
+            )
+            assert len(sims_xr.client.scheduler_info()['workers']) == 1
+        finally:
+            sims_xr.close()
+        assert (interval['upper'] >= interval['lower']).all()
+        assert sims_xr._client is None
+
+    @pytest.mark.parametrize('scheduler', ['thread', 1, object()])
+    def test_invalid_scheduler(self, simulation_data, scheduler):
+
+        with pytest.raises(ValueError):
+            EpiSummary(
+                simulation=simulation_data,
+                state_coord=['compt'],
+                within_sim_coord=['age', 'risk', 'vertex'],
+                time_coord=['step'],
+                between_sim_coord=['index'],
+                measured_coord=['compt_model__state'],
+                scheduler=scheduler
+            )
+
+    def test_local_cluster(self, simulation_data):
+
+        distributed = pytest.importorskip('distributed')
+        with distributed.LocalCluster(n_workers=1, processes=False, dashboard_address=None) as cluster:
+            sims_xr = EpiSummary(
+                simulation=simulation_data,
+                state_coord=['compt'],
+                within_sim_coord=['age', 'risk', 'vertex'],
+                time_coord=['step'],
+                between_sim_coord=['index'],
+                measured_coord=['compt_model__state'],
+                scheduler=cluster
+            )
+            try:
+                interval = sims_xr.prediction_interval(
+                    ['compt', 'vertex', 'step'], 'compt_model__state', upper=0.95, lower=0.05
+                )
+                assert sims_xr.client.cluster is cluster
+            finally:
+                sims_xr.close()
+
+            # the given cluster is left running
+            assert cluster.status.name == 'running'
+        assert (interval['upper'] >= interval['lower']).all()
+
+    def test_ensemble_stats(self, simulation_data):
+
+        sims_xr = EpiSummary(
+            simulation=simulation_data,
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state']
+        )
+
+        groupers = ['compt', 'vertex', 'step']
+        stats = sims_xr.ensemble_stats(groupers, 'compt_model__state', ['mean', 'max', 'peak_size'])
+        summed = sims_xr.xr_sum_over_groups(groupers + ['index'], 'compt_model__state')['compt_model__state']
+        assert_almost_equal(stats['mean'].values, summed.mean(dim='index').values)
+        assert_almost_equal(stats['max'].values, summed.max(dim='index').values)
+        assert set(stats['peak_size'].dims) == {'compt', 'vertex', 'quantile'}
+        assert sims_xr.memo.info()['hits'] == 1
+
+        # peak statistics need the time coordinate
+        with pytest.raises(AssertionError):
+            sims_xr.ensemble_stats(['compt', 'vertex'], 'compt_model__state', ['peak_time'])
+
+    def test_summarize_to_zarr(self, simulation_data, tmp_path):
+
+        sims_xr = EpiSummary(
+            simulation=simulation_data,
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state']
+        )
+
+        groupers = ['compt', 'vertex', 'step']
+        output = str(tmp_path / 'summary.zarr')
+        written = sims_xr.summarize_to_zarr(
+            output, groupers, 'compt_model__state', quantiles=[0.05, 0.5, 0.95], statistics=['mean'],
+            chunk_bytes=1024
+        )
+
+        # every block stays within the budget
+        for name in ['sum', 'quantile_value', 'mean']:
+            block = np.prod([max(i) for i in written[name].chunks]) * written[name].dtype.itemsize
+            assert block <= 1024
+
+        expected = sims_xr.quantiles_between_sims(
+            groupers, 'compt_model__state', [0.05, 0.5, 0.95], backend='xarray'
+        )['compt_model__state']
+        assert_almost_equal(
+            written['quantile_value'].values, expected.transpose(*written['quantile_value'].dims).values
+        )
+        summed = sims_xr.xr_sum_over_groups(groupers + ['index'], 'compt_model__state')['compt_model__state']
+        assert_almost_equal(written['mean'].values, summed.mean(dim='index').transpose(*groupers).values)
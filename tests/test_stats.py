@@ -3,7 +3,7 @@ import numpy as np
 from numpy.testing import assert_almost_equal
 import pandas as pd
 import dask.dataframe as dd
-from epivislab.stats import Quantile, Sum
+from epivislab.stats import Quantile, Sum, MultiQuantile, EnsembleStats, decode_categories
 import pytest
 
 
@@ -83,3 +83,125 @@ class TestStats:
         # check concordance between dask and pandas workflows
         assert_almost_equal(min(regress['diff']), 0.0)
         assert_almost_equal(max(regress['diff']), 0.0)
+
+    def test_sorted_quantiles(self):
+
+        rng = np.random.default_rng(7)
+        values = rng.normal(size=(4, 6, 11))
+        values[0, 0, :3] = np.nan
+        values[1, 1, :] = np.nan
+
+        multi = MultiQuantile(quantiles=[0.05, 0.25, 0.5, 0.75, 0.95])
+        sims_evl = multi.sorted_quantiles(values, axis=-1)
+
+        expected = np.moveaxis(np.nanquantile(values, multi.quantiles, axis=-1), 0, -1)
+        assert sims_evl.shape == (4, 6, 5)
+        assert_almost_equal(sims_evl, expected)
+
+    def test_exact_quantile_partitions(self, simulation_data, quantiles):
+
+        # replicates of each group are spread over several partitions
+        sims_sq = simulation_data[
+            ['age', 'compt', 'index', 'risk', 'step', 'vertex', 'compt_model__state']
+        ].chunk(chunks={'index': 3}).to_dask_dataframe(
+            dim_order=['index', 'compt', 'vertex', 'age', 'risk', 'step']
+        )
+        assert sims_sq.npartitions > 1
+
+        groupers = ['compt', 'vertex', 'age', 'risk', 'step']
+        median = Quantile(quantile=quantiles['quantile'])
+        sims_evl = median.dd_quantile(ddf=sims_sq, groupers=groupers, aggcol=['compt_model__state']).compute()
+
+        sims_pd = sims_sq.compute().groupby(groupers)['compt_model__state'].quantile(quantiles['quantile'])
+        sims_evl = sims_evl.set_index(groupers)['value'].reindex(sims_pd.index)
+        assert_almost_equal(sims_evl.values, sims_pd.values)
+
+    def test_categorical_sum(self):
+
+        # categorical groupers and float32 values are decoded and summed at full precision
+        frame = pd.DataFrame({
+            'compt': pd.Categorical.from_codes([0, 1, 0, 1, 0, 1], categories=['S', 'I']),
+            'index': [0, 0, 1, 1, 0, 0],
+            'value': np.array([1, 2, 3, 4, 2 ** 24, 1], dtype=np.float32),
+        })
+        ddf = dd.from_pandas(frame, npartitions=2)
+        result = Sum().dd_sum(ddf, ['compt', 'index'], 'value').compute().sort_index()
+        expected = frame.astype({'compt': object, 'value': float}).groupby(['compt', 'index'])['value'].sum()
+        pd.testing.assert_series_equal(result, expected.sort_index())
+        assert result.loc[('S', 0)] == 2 ** 24 + 1
+
+        decoded = decode_categories(frame.set_index('compt'))
+        assert decoded.index.dtype == object
+        assert list(decoded.index) == ['S', 'I', 'S', 'I', 'S', 'I']
+
+    def test_grouped_quantiles(self):
+
+        # groups with different numbers of replicates and missing values
+        rng = np.random.default_rng(3)
+        frame = pd.DataFrame({
+            'group': rng.integers(0, 6, size=200),
+            'value': rng.normal(size=200),
+        })
+        frame.loc[frame.sample(frac=0.1, random_state=1).index, 'value'] = np.nan
+        frame = pd.concat([frame, pd.DataFrame({'group': [9, 9], 'value': [np.nan, np.nan]})])
+
+        multi = MultiQuantile(quantiles=[0.05, 0.5, 0.95])
+        result = multi.grouped_quantiles(frame, groupers=['group'], aggcol='value')
+        expected = frame.groupby('group')['value'].quantile([0.05, 0.5, 0.95])
+        assert_almost_equal(result.set_index(['group', 'quantile'])['value'].values, expected.values)
+        assert result[result['group'] == 9]['value'].isna().all()
+
+    def test_ensemble_stats(self, simulation_data):
+
+        summed = Sum().xr_sum(ds=simulation_data, groupers=['compt', 'vertex', 'step', 'index'], aggcol='compt_model__state')
+        values = summed['compt_model__state'].values
+        values[0, 0, 3, 2] = np.nan
+
+        stats = EnsembleStats(
+            statistics=['mean', 'variance', 'min', 'max', 'exceedance', 'peak_time', 'peak_size'], threshold=100.0
+        )
+        result = stats.xr_stats(
+            ds=summed.copy(data={'compt_model__state': values}).chunk({'index': 3, 'step': 5}),
+            between=['index'], aggcol='compt_model__state', time_coord='step'
+        ).compute()
+
+        assert_almost_equal(result['mean'].values, np.nanmean(values, axis=-1))
+        assert_almost_equal(result['variance'].values, np.nanvar(values, axis=-1, ddof=1))
+        assert_almost_equal(result['min'].values, np.nanmin(values, axis=-1))
+        assert_almost_equal(result['max'].values, np.nanmax(values, axis=-1))
+        valid = ~np.isnan(values)
+        assert_almost_equal(result['exceedance'].values, (values > 100).sum(axis=-1) / valid.sum(axis=-1))
+
+        # peak distributions across replicates
+        peak_size = np.nanmax(values, axis=-2)
+        assert_almost_equal(result['peak_size'].values, np.quantile(peak_size, [0.05, 0.5, 0.95], axis=-1).transpose(1, 2, 0))
+        peak_time = summed['step'].values[np.nanargmax(values, axis=-2)]
+        assert (result['peak_time'].sel(quantile=0.05).values <= peak_time.max(axis=-1)).all()
+        assert (result['peak_time'].sel(quantile=0.95).values >= peak_time.min(axis=-1)).all()
+        assert result['peak_time'].dtype == summed['step'].dtype
+
+    @pytest.mark.parametrize('statistics', [['peak_time'], ['peak_size'], ['peak_time', 'peak_size']])
+    def test_peak_statistics_only(self, simulation_data, statistics):
+
+        summed = Sum().xr_sum(ds=simulation_data, groupers=['compt', 'vertex', 'step', 'index'], aggcol='compt_model__state')
+        result = EnsembleStats(statistics=statistics).xr_stats(
+            ds=summed, between=['index'], aggcol='compt_model__state', time_coord='step'
+        ).compute()
+
+        assert set(result.data_vars) == set(statistics)
+        assert 'statistic' not in result.dims
+        expected = EnsembleStats(statistics=['mean'] + statistics).xr_stats(
+            ds=summed, between=['index'], aggcol='compt_model__state', time_coord='step'
+        ).compute()
+        xr.testing.assert_identical(result, expected[statistics])
+
+    def test_exceedance_threshold_per_vertex(self, simulation_data):
+
+        summed = Sum().xr_sum(ds=simulation_data, groupers=['compt', 'vertex', 'step', 'index'], aggcol='compt_model__state')
+        threshold = xr.DataArray([50.0], coords={'vertex': summed['vertex'].values}, dims=['vertex'])
+        result = EnsembleStats(statistics=['exceedance'], threshold=threshold).xr_stats(
+            ds=summed, between=['index'], aggcol='compt_model__state'
+        ).compute()
+
+        expected = (summed['compt_model__state'] > 50).mean(dim='index')
+        assert_almost_equal(result['exceedance'].values, expected.transpose(*result['exceedance'].dims).values)
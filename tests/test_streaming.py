@@ -0,0 +1,102 @@
+import xarray as xr
+import numpy as np
+from numpy.testing import assert_almost_equal
+from epivislab.simhandler import EpiSummary
+from epivislab.streaming import EnsembleAccumulator
+from epivislab.stats import Sum, QuantileSketch
+import pytest
+
+
+@pytest.fixture(params=['tests/data/test_sim_2.zarr'])
+def simulation_data(request):
+    d = xr.open_zarr(request.param)
+    return d
+
+
+class TestEnsembleAccumulator:
+
+    def test_batches_match_full_ensemble(self, simulation_data):
+
+        groupers = ['compt', 'vertex', 'step']
+        quantiles = [0.05, 0.5, 0.95]
+        accumulator = EnsembleAccumulator(groupers, 'compt_model__state', ['index'], quantiles=quantiles)
+
+        # overlapping batches; replicates already seen are skipped
+        assert accumulator.ingest(simulation_data.isel(index=slice(0, 4))) == 4
+        assert accumulator.ingest(simulation_data.isel(index=slice(2, 7))) == 3
+        assert accumulator.ingest(simulation_data.isel(index=slice(7, 10))) == 3
+        assert accumulator.ingest(simulation_data.isel(index=slice(0, 10))) == 0
+        summary = accumulator.summary()
+
+        full = simulation_data['compt_model__state'].sum(dim=['age', 'risk']).transpose(*groupers, 'index')
+        assert summary.attrs['count'] == 10
+        assert_almost_equal(summary['sum'].values, full.sum(dim='index').values)
+        assert_almost_equal(summary['mean'].values, full.mean(dim='index').values)
+        assert_almost_equal(summary['variance'].values, full.var(dim='index', ddof=1).values, decimal=5)
+        assert_almost_equal(
+            summary['quantile_value'].values,
+            np.moveaxis(np.quantile(full.values, quantiles, axis=-1), 0, -1)
+        )
+
+    def test_seen_replicates_not_summed(self, simulation_data, monkeypatch):
+
+        summed = []
+        xr_sum = Sum.xr_sum
+
+        def recording_sum(self, ds, groupers, aggcol):
+            summed.append(ds['index'].values.tolist())
+            return xr_sum(self, ds, groupers, aggcol)
+
+        monkeypatch.setattr(Sum, 'xr_sum', recording_sum)
+        accumulator = EnsembleAccumulator(['compt', 'vertex', 'step'], 'compt_model__state', ['index'])
+        index = simulation_data['index'].values.tolist()
+
+        assert accumulator.ingest(simulation_data.isel(index=slice(0, 4))) == 4
+        assert accumulator.ingest(simulation_data.isel(index=slice(2, 7))) == 3
+        assert accumulator.ingest(simulation_data.isel(index=slice(0, 7))) == 0
+        assert summed == [index[0:4], index[4:7]]
+
+    def test_merge(self, simulation_data):
+
+        sims_xr = EpiSummary(
+            simulation=simulation_data,
+            state_coord=['compt'],
+            within_sim_coord=['age', 'risk', 'vertex'],
+            time_coord=['step'],
+            between_sim_coord=['index'],
+            measured_coord=['compt_model__state']
+        )
+
+        groupers = ['compt', 'vertex', 'step']
+        full = sims_xr.accumulator(groupers, 'compt_model__state').summary()
+
+        first = EnsembleAccumulator(groupers, 'compt_model__state', 'index')
+        first.ingest(simulation_data.isel(index=slice(0, 5)))
+        second = EnsembleAccumulator(groupers, 'compt_model__state', 'index')
+        second.ingest(simulation_data.isel(index=slice(5, 10)))
+        first.merge(second)
+        merged = first.summary()
+
+        for var in ['sum', 'mean', 'variance', 'quantile_value']:
+            assert_almost_equal(merged[var].values, full[var].values, decimal=5)
+
+
+class TestQuantileSketch:
+
+    def test_sketch_error_bound(self):
+
+        rng = np.random.default_rng(11)
+        values = rng.normal(size=(3, 5000))
+        k = 100
+
+        sketch = QuantileSketch(k=k, seed=0)
+        for batch in np.split(values, 10, axis=-1):
+            sketch.update(batch)
+        assert sketch.count == 5000
+
+        # compare ranks of the estimates to the requested ranks
+        quantiles = [0.05, 0.25, 0.5, 0.75, 0.95]
+        estimates = sketch.quantiles(quantiles)
+        ranks = (np.sort(values, axis=-1)[..., np.newaxis, :] <= estimates[..., np.newaxis]).sum(axis=-1) / 5000
+        bound = np.log2(5000 / k) / k
+        assert np.all(np.abs(ranks - np.array(quantiles)) <= bound)
@@ -0,0 +1,179 @@
+import json
+import xarray as xr
+import numpy as np
+from numpy.testing import assert_almost_equal
+from epivislab.simhandler import EpiSummary
+from epivislab.timeseries import interval_timeseries, spaghetti_timeseries, lttb_indices, interval_indices
+from epivislab.timeseries import interval_figure, spaghetti_figure
+import plotly.graph_objects as go
+import pytest
+
+
+@pytest.fixture(params=['tests/data/test_sim_2.zarr'])
+def simulation_data(request):
+    d = xr.open_zarr(request.param)
+    return d
+
+
+@pytest.fixture
+def summary(simulation_data):
+    return EpiSummary(
+        simulation=simulation_data,
+        state_coord=['compt'],
+        within_sim_coord=['age', 'risk', 'vertex'],
+        time_coord=['step'],
+        between_sim_coord=['index'],
+        measured_coord=['compt_model__state']
+    )
+
+
+class TestTimeseries:
+
+    def test_interval_callback(self, summary):
+
+        summary_xr = summary.prediction_interval(['compt', 'vertex', 'step'], 'compt_model__state', 0.95, 0.05)
+        box = interval_timeseries(summary_xr)
+        widgets, g = box.children[0].children, box.children[1]
+
+        compt = [w for w in widgets if w.description == 'compt'][0]
+        compt.value = 'Ih'
+        expected = summary_xr.sel(compt='Ih', vertex='Austin')
+        assert_almost_equal(np.array(g.data[0].y), expected['upper'].values)
+        assert_almost_equal(np.array(g.data[1].y), expected['lower'].values)
+        assert_almost_equal(np.array(g.data[2].y), expected['median'].values)
+
+    def test_spaghetti_callback(self, summary, simulation_data):
+
+        box = summary.spaghetti_plot()
+        widgets, g = box.children[0].children, box.children[1]
+        assert len(g.data) == len(simulation_data['index'])
+
+        age = [w for w in widgets if w.description == 'age'][0]
+        age.value = '65+'
+        selection = {w.description: w.value for w in widgets}
+        expected = simulation_data['compt_model__state'].sel(selection).transpose('index', 'step').values
+        assert_almost_equal(np.array([trace.y for trace in g.data]), expected)
+
+    def test_grouped_spaghetti(self, summary, simulation_data):
+
+        box = summary.spaghetti_plot(groupers=['compt', 'vertex', 'step', 'index'], aggcol='compt_model__state')
+        widgets, g = box.children[0].children, box.children[1]
+        assert {w.description for w in widgets} == {'compt', 'vertex'}
+        assert len(g.data) == len(simulation_data['index'])
+
+        selection = {w.description: w.value for w in widgets}
+        expected = simulation_data['compt_model__state'].sel(selection).sum(dim=['age', 'risk'])
+        assert_almost_equal(np.array([trace.y for trace in g.data]), expected.transpose('index', 'step').values)
+
+    def test_packed_spaghetti(self, summary, simulation_data):
+
+        box = summary.spaghetti_plot(render='packed')
+        widgets, g = box.children[0].children, box.children[1]
+        assert len(g.data) == 1
+        assert g.data[0].type == 'scattergl'
+
+        age = [w for w in widgets if w.description == 'age'][0]
+        age.value = '65+'
+        selection = {w.description: w.value for w in widgets}
+        expected = simulation_data['compt_model__state'].sel(selection).transpose('index', 'step').values
+
+        # one NaN separator after each replicate
+        packed = np.array(g.data[0].y, dtype=float).reshape(len(simulation_data['index']), -1)
+        assert np.isnan(packed[:, -1]).all()
+        assert_almost_equal(packed[:, :-1], expected)
+
+    def test_density_spaghetti(self, summary, simulation_data):
+
+        box = summary.spaghetti_plot(density_threshold=5, bins=20)
+        g = box.children[1]
+        assert len(g.data) == 1
+        assert g.data[0].type == 'heatmap'
+
+        # every replicate is counted once per timestep
+        counts = np.array(g.data[0].z)
+        assert counts.shape == (20, len(simulation_data['step']))
+        assert (counts.sum(axis=0) == len(simulation_data['index'])).all()
+
+
+class TestDownsampling:
+
+    def test_lttb(self):
+
+        rng = np.random.default_rng(3)
+        x = np.arange('2020-01-01', '2023-01-01', dtype='datetime64[D]')
+        y = rng.normal(size=(4, len(x))).cumsum(axis=-1)
+
+        keep = lttb_indices(x, y, 100)
+        assert keep.shape == (4, 100)
+        assert (keep[:, 0] == 0).all()
+        assert (keep[:, -1] == len(x) - 1).all()
+        assert (np.diff(keep, axis=-1) > 0).all()
+
+        # a spike is always selected
+        y[2, 500] = 1000.0
+        assert 500 in lttb_indices(x, y, 100)[2]
+
+    def test_interval_envelope(self):
+
+        rng = np.random.default_rng(5)
+        x = np.arange(5000)
+        median = rng.normal(size=5000).cumsum()
+        upper = median + rng.uniform(1, 5, size=5000)
+        lower = median - rng.uniform(1, 5, size=5000)
+
+        keep = interval_indices(x, upper, lower, median, plot_width=400)
+        assert len(keep) <= 1000
+        assert np.argmax(upper) in keep
+        assert np.argmin(lower) in keep
+
+        # the envelope extremes of every bucket are kept
+        for lo, hi in zip(np.linspace(0, 5000, 101).astype(int)[:-1], np.linspace(0, 5000, 101).astype(int)[1:]):
+            assert lo + np.argmax(upper[lo:hi]) in keep
+            assert lo + np.argmin(lower[lo:hi]) in keep
+
+    def test_downsampled_plots(self, summary):
+
+        summary_xr = summary.prediction_interval(['compt', 'vertex', 'step'], 'compt_model__state', 0.95, 0.05)
+        g = interval_timeseries(summary_xr, plot_width=12).children[1]
+        assert len(g.data[0].x) <= len(summary_xr['step'])
+        assert len(g.data[0].x) == len(g.data[2].y)
+
+        g = summary.spaghetti_plot(render='packed', plot_width=12).children[1]
+        assert len(g.data[0].y) == 10 * 13
+
+    @pytest.mark.parametrize('processes', [None, 2])
+    def test_interval_report(self, summary, tmp_path, processes):
+
+        groupers = ['compt', 'vertex', 'step']
+        manifest = summary.figure_report(
+            str(tmp_path), groupers, 'compt_model__state', upper=0.95, lower=0.05, processes=processes
+        )
+        assert len(manifest['figures']) == len(summary.simulation['compt']) * len(summary.simulation['vertex'])
+        with open(tmp_path / 'manifest.json') as f:
+            assert json.load(f) == manifest
+        for figure in manifest['figures']:
+            assert (tmp_path / figure['files'][0]).exists()
+        assert (tmp_path / 'plotly.min.js').exists()
+
+        summary_xr = summary.prediction_interval(groupers, 'compt_model__state', 0.95, 0.05, backend='xarray')
+        expected = summary_xr.sel(compt='Ih', vertex='Austin')
+        fig = interval_figure(expected['step'].values, expected['upper'].values, expected['lower'].values,
+                              expected['median'].values)
+        assert type(fig) == go.Figure
+        assert_almost_equal(np.array(fig.data[2].y), expected['median'].values)
+
+    def test_spaghetti_report(self, summary, simulation_data, tmp_path):
+
+        manifest = summary.figure_report(
+            str(tmp_path), ['compt', 'step'], 'compt_model__state', kind='spaghetti', render='traces'
+        )
+        assert [figure['selection'] for figure in manifest['figures']] == [
+            {'compt': compt} for compt in simulation_data['compt'].values
+        ]
+
+        replicates = simulation_data['compt_model__state'].sel(compt='Ih').sum(dim=['age', 'risk', 'vertex'])
+        fig = spaghetti_figure(simulation_data['step'].values, replicates.transpose('index', 'step').values)
+        assert len(fig.data) == len(simulation_data['index'])
+        fig = spaghetti_figure(simulation_data['step'].values, replicates.transpose('index', 'step').values,
+                               density_threshold=5)
+        assert fig.data[0].type == 'heatmap'